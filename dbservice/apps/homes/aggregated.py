@@ -1,24 +1,45 @@
+import base64
+import binascii
 import datetime
+import functools
+import heapq
 import itertools
 import operator
-from collections import OrderedDict, namedtuple
-
-from .condensed import condense
-from .models import Measurement, VirtualEnergyPort
-from .serializers import AggregatedSerializer, PaginatedTemperatureSerializer, \
-    VirtualEnergyMeasurementSerializer
-from .utils import get_urlquery_timespan, get_urlquery_value, pairwise
+from collections import OrderedDict, deque, namedtuple
+
+from .cache import cached_result
+from .condensed import (CondensedPages, SampleArrays, bucket_boundary,
+                        bucket_index, condense, condense_sql, condense_window,
+                        condensed_from_rollups, condensed_grid, load_samples,
+                        reset_corrected_samples, stream_samples)
+from . import resets
+from .ledger import ledger_condensed
+from .models import (Measurement, MeterPort, VirtualEnergyMeasurement,
+                     VirtualEnergyPort)
+from .serializers import (AggregatedSerializer, TemperaturePageSerializer,
+                          TemperatureSerializer,
+                          VirtualEnergyMeasurementSerializer)
+from .streaming import stream_rows, stream_sql, streaming_json_response
+from .utils import get_urlquery_timespan, get_urlquery_value
 from dateutil.relativedelta import relativedelta
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.conf import settings
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Avg
+from django.db import connections
+from django.db.models import Avg, Max, Min
 from django.views.decorators.http import require_GET
 from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
+from rest_framework.templatetags.rest_framework import replace_query_param
 
 from dbservice.apps.homes.serializers import PaginatedCondensedSerializer
 from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 condensed_options = OrderedDict([
     ('1min', datetime.timedelta(minutes=1)),
@@ -43,38 +64,157 @@ AveragePower = namedtuple(
     'AveragePower', ['value', 'from_timestamp', 'to_timestamp', 'unit'])
 
 
-def _find_negative_accumulated_values(data):
-    """Return negative differential in data if next is positiv."""
-    idx0_values, idx1_values, idx2_values = itertools.tee(data, 3)
-    next(idx1_values), next(idx2_values), next(idx2_values)
-    return [
-        idx0.value - idx1.value
+def _find_negative_accumulated_values(values):
+    """Yield negative differential in values if next is positiv."""
+    idx0_values, idx1_values, idx2_values = itertools.tee(values, 3)
+    next(idx1_values, None)
+    next(idx2_values, None), next(idx2_values, None)
+    return (
+        idx0 - idx1
         for idx0, idx1, idx2 in
         zip(idx0_values, idx1_values, idx2_values)
-        if idx1.value < idx0.value and idx1.value <= idx2.value
-    ]
+        if idx1 < idx0 and idx1 <= idx2
+    )
 
 
-def aggregate_mainmeter_consumption(home_id,
-                                    from_timestamp, to_timestamp, tau):
-    """Aggregate consumption from mainmeter."""
-    energy_unit = MEASUREMENT_UNIT_CHOICES[0][0]
+def _accumulated_value(values):
+    """
+    Return the increase of the accumulated `values`, corrected for counter
+    resets, in one pass over `values`.
+    """
+    bounds = []
+
+    def tracked():
+        for value in values:
+            if not bounds:
+                bounds.append(value)
+            yield value
+            last = value
+        if bounds:
+            bounds.append(last)
+
+    corrections = sum(_find_negative_accumulated_values(tracked()))
+    if not bounds:
+        return 0
+    return bounds[-1] - bounds[0] + corrections
+
+
+_ACCUMULATED_SQL = '''
+SELECT coalesce(sum(
+    CASE WHEN previous IS NULL THEN -value ELSE 0 END +
+    CASE WHEN following IS NULL THEN value ELSE 0 END +
+    CASE WHEN value < previous AND value <= following
+         THEN previous - value ELSE 0 END), 0)::bigint
+FROM (
+    SELECT value,
+           lag(value) OVER series AS previous,
+           lead(value) OVER series AS following
+    FROM ({measurements}) AS m (series, "timestamp", value)
+    WINDOW series AS (PARTITION BY series ORDER BY "timestamp")
+) AS m
+'''
+
+
+def accumulated_value_sql(queryset, series):
+    """
+    Sum of `_accumulated_value` of the values of measurement `queryset` per
+    distinct `series` field, ordered by timestamp, computed by PostgreSQL in
+    one statement so no rows are transferred.  Returns None on other
+    backends, so callers fall back to `_accumulated_value`.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    measurements, params = queryset.order_by().values_list(
+        series, 'timestamp', 'value').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(_ACCUMULATED_SQL.format(measurements=measurements),
+                       params)
+        return cursor.fetchone()[0]
+
+
+def _resets_accumulated_value(measurements, meter_ports):
+    """
+    Sum of `_accumulated_value` of the series of `measurements`, one per
+    series of the `(series, meter_port_id)` pairs `meter_ports`, from the
+    recorded counter resets.  The series are those the other paths
+    accumulate: the home for consumption, the submeter for production.
+    Returns None unless resets are recorded and every series has a single
+    meter port, whose resets are those of the series.
+    """
+    if not settings.HOMES_COUNTER_RESETS:
+        return None
+    meter_ports = list(meter_ports)
+    series = [key for key, meter_port_id in meter_ports]
+    if len(set(series)) != len(series):
+        return None
+    return sum(
+        resets.accumulated_value(
+            measurements.filter(meter_port_id=meter_port_id), meter_port_id)
+        for key, meter_port_id in meter_ports)
+
+
+def mainmeter_measurements(home_id, from_timestamp, to_timestamp, tau):
+    """Return the energy measurements of the mainmeters of `home_id`."""
     filters = {
         'meter_port__mainmeter__residential_home__id': home_id,
-        'meter_port__unit': energy_unit,
+        'meter_port__unit': MEASUREMENT_UNIT_CHOICES[0][0],
     }
     if from_timestamp and to_timestamp:
         filters['timestamp__gte'] = from_timestamp - tau
         filters['timestamp__lte'] = to_timestamp + tau
-    data = Measurement.objects.filter(**filters).order_by('timestamp')
+    return Measurement.objects.filter(**filters)
+
+
+def _mainmeter_rollups(home_id, from_timestamp, to_timestamp, tau,
+                       boundaries=None):
+    # rollups are per meter port, so only homes with a single energy port
+    # on their mainmeters are served from them; they are not corrected for
+    # counter resets
+    if (not (tau and from_timestamp and settings.HOMES_ROLLUPS) or
+            settings.HOMES_COUNTER_RESETS):
+        return None
+    meter_ports = MeterPort.objects.filter(
+        mainmeter__residential_home__id=home_id,
+        unit=MEASUREMENT_UNIT_CHOICES[0][0],
+    ).values_list('id', flat=True)
+    if len(meter_ports) != 1:
+        return None
+    return condensed_from_rollups(meter_ports[0], from_timestamp,
+                                  to_timestamp, tau, inclusive=True,
+                                  boundaries=boundaries)
+
+
+def aggregate_mainmeter_consumption(home_id,
+                                    from_timestamp, to_timestamp, tau):
+    """Aggregate consumption from mainmeter."""
+    energy_unit = MEASUREMENT_UNIT_CHOICES[0][0]
+    data = mainmeter_measurements(
+        home_id, from_timestamp, to_timestamp, tau).order_by('timestamp')
+    result = _mainmeter_rollups(home_id, from_timestamp, to_timestamp, tau)
+    if result is not None:
+        return result
+    if tau and settings.HOMES_COUNTER_RESETS:
+        # corrected like the energy ledger
+        return condense(reset_corrected_samples(data, mainmeter_measurements(
+            home_id, None, None, tau)), from_timestamp, tau)
+    if tau and settings.HOMES_CONDENSE_ENGINE == 'sql':
+        result = condense_sql(data, from_timestamp, to_timestamp, tau)
+        if result is not None:
+            return result
     if tau:
-        return condense(data, from_timestamp, tau)
+        return condense(load_samples(data), from_timestamp, tau)
     else:
-        value = 0
-        if data:
-            not_accumulated_values = _find_negative_accumulated_values(data)
-            to_value, from_value = data.reverse()[0].value, data[0].value
-            value = to_value - from_value + sum(not_accumulated_values)
+        # the mainmeters of a home are accumulated as one series
+        value = _resets_accumulated_value(data, MeterPort.objects.filter(
+            mainmeter__residential_home__id=home_id, unit=energy_unit,
+        ).values_list('mainmeter__residential_home', 'id'))
+        if value is None:
+            value = accumulated_value_sql(
+                data, 'meter_port__mainmeter__residential_home__id')
+        if value is None:
+            value = _accumulated_value(
+                value for value, in stream_rows(data, 'value'))
         return [
             AveragePower(
                 value=value,
@@ -85,59 +225,129 @@ def aggregate_mainmeter_consumption(home_id,
         ]
 
 
-def aggregate_submeter_measured_production(home_id,
-                                           from_timestamp, to_timestamp, tau):
-    """Aggregate production from submeters based on home_id."""
-    energy_unit = MEASUREMENT_UNIT_CHOICES[0][0]
+def mainmeter_consumption_slice(home_id, from_timestamp, to_timestamp, tau,
+                                first, start, stop):
+    """
+    Return `aggregate_mainmeter_consumption(...)[start:stop]`, where `first`
+    is the index of the first boundary of the bucket grid.
+    """
+    boundaries = (bucket_boundary(from_timestamp, tau, first + start),
+                  bucket_boundary(from_timestamp, tau, first + stop))
+    result = _mainmeter_rollups(home_id, from_timestamp, to_timestamp, tau,
+                                boundaries=boundaries)
+    if result is not None and len(result) == stop - start:
+        return result
+    series = None
+    if settings.HOMES_COUNTER_RESETS:
+        series = mainmeter_measurements(home_id, None, None, tau)
+    return condense_window(
+        mainmeter_measurements(home_id, from_timestamp, to_timestamp, tau),
+        from_timestamp, tau, first, start, stop, series=series)
+
+
+def paged_mainmeter_consumption(home_id, from_timestamp, to_timestamp, tau):
+    """
+    Return the condensed consumption of `home_id` as `CondensedPages`, or
+    None when there are no buckets.
+    """
+    grid = condensed_grid(
+        mainmeter_measurements(home_id, from_timestamp, to_timestamp, tau),
+        from_timestamp, tau)
+    if grid is None or grid[1] <= 0:
+        return None
+    first, count = grid
+
+    def compute(start, stop):
+        return cached_result(
+            ('home', home_id),
+            ('consumption', from_timestamp, to_timestamp, tau, start, stop),
+            (from_timestamp - tau, to_timestamp + tau),
+            functools.partial(mainmeter_consumption_slice, home_id,
+                              from_timestamp, to_timestamp, tau, first,
+                              start, stop))
+    return CondensedPages(count, compute)
+
+
+def submeter_production_measurements(home_id, from_timestamp, to_timestamp,
+                                     tau):
+    """Return the energy measurements of the production submeters."""
     filters = {
         'meter_port__submeter__residential_home__id': home_id,
         ('meter_port__energy_production_period__'
          'appliance__residential_home__id'): home_id,
-        'meter_port__unit': energy_unit,
+        'meter_port__unit': MEASUREMENT_UNIT_CHOICES[0][0],
     }
     if from_timestamp and to_timestamp:
         filters['timestamp__gte'] = from_timestamp - tau
         filters['timestamp__lte'] = to_timestamp + tau
+    return Measurement.objects.filter(**filters)
 
-    data = Measurement.objects.filter(**filters).order_by(
-        'timestamp',
-    ).values_list(
-        'meter_port__submeter__id', 'timestamp', 'value',
-    )
+
+def _keyed_buckets(n, stream):
+    for value in stream:
+        yield value.from_timestamp, n, value
+
+
+def _sum_buckets(streams):
+    """
+    Merge the condensed `streams`, each ordered by time, into one stream
+    summing the values of the buckets they share.  Buckets missing from
+    some streams are summed over the others.
+    """
+    merged = heapq.merge(*[_keyed_buckets(n, stream)
+                           for n, stream in enumerate(streams)])
+    for from_timestamp, group in itertools.groupby(
+            merged, key=operator.itemgetter(0)):
+        values = [value for _, _, value in group]
+        yield values[0]._replace(
+            value=sum(value.value for value in values))
+
+
+def aggregate_submeter_measured_production(home_id,
+                                           from_timestamp, to_timestamp, tau):
+    """Aggregate production from submeters based on home_id."""
+    energy_unit = MEASUREMENT_UNIT_CHOICES[0][0]
+    measurements = submeter_production_measurements(
+        home_id, from_timestamp, to_timestamp, tau)
+    submeters = measurements.order_by().values_list(
+        'meter_port__submeter__id', flat=True).distinct()
+    if tau and settings.HOMES_COUNTER_RESETS:
+        # corrected like the energy ledger
+        series = submeter_production_measurements(home_id, None, None, tau)
+        return _sum_buckets([
+            condense(reset_corrected_samples(
+                measurements.filter(meter_port__submeter__id=submeter),
+                series.filter(meter_port__submeter__id=submeter)),
+                from_timestamp, tau)
+            for submeter in submeters
+        ])
     if tau:
-        result = []
-        data = sorted(data, key=lambda x: x[0])  # Sort before groupby
-        SubmeterMeasurement = namedtuple('Measurement', ['value', 'timestamp'])
-        for key, group in itertools.groupby(data, key=lambda x: x[0]):
-            raw_data = [SubmeterMeasurement(timestamp=timestamp, value=value)
-                        for submeter, timestamp, value in group]
-            result.append(condense(raw_data, from_timestamp, tau))
-
-        def sum_values(condense_timeslot_set):
-            ft, tt = zip(
-                *map(
-                    operator.attrgetter('from_timestamp', 'to_timestamp'),
-                    condense_timeslot_set
-                )
-            )
-            assert len(set(ft)) == 1
-            assert len(set(tt)) == 1
-
-            if condense_timeslot_set:
-                return condense_timeslot_set[0]._replace(
-                    value=sum([entry.value for entry in condense_timeslot_set])
-                )
-            return []
-        return map(sum_values, zip(*result))
+        # one stream per submeter, condensed while merged, so only a chunk
+        # of every submeter is held in memory
+        return _sum_buckets([
+            condense(stream_samples(measurements.filter(
+                meter_port__submeter__id=submeter).order_by('timestamp')),
+                from_timestamp, tau)
+            for submeter in submeters
+        ])
     else:
-        prod_value = 0
-        if data:
-            for key, group in itertools.groupby(data, lambda x: x[0]):
-                data_submeter = [item[2] for item in group]
-                not_accumulated_values = _find_negative_accumulated_values(
-                    data_submeter)
-                prod_value += (data_submeter[-1] - data_submeter[0] +
-                               sum(not_accumulated_values))
+        prod_value = _resets_accumulated_value(
+            measurements, MeterPort.objects.filter(**{
+                'submeter__residential_home__id': home_id,
+                ('energy_production_period__'
+                 'appliance__residential_home__id'): home_id,
+                'unit': energy_unit,
+            }).values_list('submeter', 'id'))
+        if prod_value is None:
+            prod_value = accumulated_value_sql(measurements,
+                                               'meter_port__submeter__id')
+        if prod_value is None:
+            prod_value = sum(
+                _accumulated_value(value for value, in stream_rows(
+                    measurements.filter(
+                        meter_port__submeter__id=submeter).order_by(
+                            'timestamp'), 'value'))
+                for submeter in submeters)
         return [
             AveragePower(
                 value=prod_value,
@@ -148,6 +358,89 @@ def aggregate_submeter_measured_production(home_id,
         ]
 
 
+def _union(ranges):
+    """Return the union of the `(low, high)` ranges as disjoint ranges."""
+    union = []
+    for low, high in sorted(ranges):
+        if union and low <= union[-1][1]:
+            union[-1] = (union[-1][0], max(union[-1][1], high))
+        else:
+            union.append((low, high))
+    return union
+
+
+def _index_ranges(ranges, start, stop):
+    """
+    Return the ranges of the bucket indices at positions `[start:stop]` of
+    the disjoint `ranges` laid end to end.
+    """
+    result = []
+    offset = 0
+    for low, high in ranges:
+        first = max(start - offset, 0)
+        last = min(stop - offset, high - low)
+        if first < last:
+            result.append((low + first, low + last))
+        offset += high - low
+    return result
+
+
+def submeter_production_slice(home_id, from_timestamp, to_timestamp, tau,
+                              grids, start, stop):
+    """
+    Return `aggregate_submeter_measured_production(...)[start:stop]`, where
+    `grids` holds the `(submeter, first, last)` bucket indices of every
+    submeter.
+    """
+    measurements = submeter_production_measurements(
+        home_id, from_timestamp, to_timestamp, tau)
+    series = None
+    if settings.HOMES_COUNTER_RESETS:
+        series = submeter_production_measurements(home_id, None, None, tau)
+    streams = []
+    ranges = _union((first, last) for submeter, first, last in grids)
+    for low, high in _index_ranges(ranges, start, stop):
+        for submeter, first, last in grids:
+            if max(low, first) < min(high, last):
+                streams.append(condense_window(
+                    measurements.filter(meter_port__submeter__id=submeter),
+                    from_timestamp, tau, 0, max(low, first),
+                    min(high, last), series=None if series is None else
+                    series.filter(meter_port__submeter__id=submeter)))
+    return list(_sum_buckets(streams))
+
+
+def paged_submeter_production(home_id, from_timestamp, to_timestamp, tau):
+    """
+    Return the condensed production of `home_id` as `CondensedPages`, or
+    None when there are no buckets.
+    """
+    bounds = submeter_production_measurements(
+        home_id, from_timestamp, to_timestamp, tau).order_by().values_list(
+            'meter_port__submeter__id').annotate(
+                first=Min('timestamp'), last=Max('timestamp'))
+    grids = []
+    for submeter, first, last in bounds:
+        first = bucket_index(from_timestamp, tau, first, round_up=True)
+        last = bucket_index(from_timestamp, tau, last)
+        if first < last:
+            grids.append((submeter, first, last))
+    count = sum(high - low for low, high in
+                _union((first, last) for submeter, first, last in grids))
+    if not count:
+        return None
+
+    def compute(start, stop):
+        return cached_result(
+            ('home', home_id),
+            ('production', from_timestamp, to_timestamp, tau, start, stop),
+            (from_timestamp - tau, to_timestamp + tau),
+            functools.partial(submeter_production_slice, home_id,
+                              from_timestamp, to_timestamp, tau, grids,
+                              start, stop))
+    return CondensedPages(count, compute)
+
+
 @require_GET
 def aggregated(request, home_id, pflow):
     """Aggregate the measurements based on `home_id` and power flow `pflow`."""
@@ -158,13 +451,28 @@ def aggregated(request, home_id, pflow):
                              default_return=datetime.timedelta(seconds=0))
     # Aggregate measurement based on flow
     if pflow is 'consumption':
-        result = aggregate_mainmeter_consumption(
-            home_id, from_timestamp, to_timestamp, tau)
+        aggregate = aggregate_mainmeter_consumption
     elif pflow is 'production':
-        result = aggregate_submeter_measured_production(
-            home_id, from_timestamp, to_timestamp, tau)
+        aggregate = aggregate_submeter_measured_production
+    result = None
+    if tau:
+        result = ledger_condensed(home_id, pflow, from_timestamp,
+                                  to_timestamp, tau)
+    if tau and result is None:
+        # only the buckets of the requested page are computed
+        paged = {
+            'consumption': paged_mainmeter_consumption,
+            'production': paged_submeter_production,
+        }[pflow]
+        result = paged(home_id, from_timestamp, to_timestamp, tau)
+    if result is None:
+        result = cached_result(
+            ('home', home_id), (pflow, from_timestamp, to_timestamp, tau),
+            (from_timestamp - tau, to_timestamp + tau),
+            lambda: list(aggregate(home_id, from_timestamp, to_timestamp,
+                                   tau)))
     if tau:
-        paginator = Paginator(list(result), 20)
+        paginator = Paginator(result, 20)
         page = request.QUERY_PARAMS.get('page')
         try:
             result_paginated = paginator.page(page)
@@ -190,41 +498,150 @@ Temperature = namedtuple(
 )
 
 
+TEMPERATURE_PAGE_SIZE = 20
+
+_CURSOR_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def temperature_meter_ports(home_id):
+    """
+    Return the `(id, submeter name)` of the temperature meter ports of the
+    submeters of `home_id`, ordered by submeter name and id.
+    """
+    return list(MeterPort.objects.filter(
+        submeter__residential_home=home_id,
+        resource_type='temperature',
+    ).order_by('submeter__name', 'id').values_list('id', 'submeter__name'))
+
+
+def encode_cursor(direction, meter_port_id, timestamp):
+    """
+    Return the opaque cursor of the temperatures after (`direction` 'n') or
+    before ('p') the temperature of `meter_port_id` at `timestamp`.
+    """
+    position = '{} {} {}'.format(
+        direction, meter_port_id,
+        timestamp.strftime(_CURSOR_TIMESTAMP_FORMAT))
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the `(direction, meter_port_id, timestamp)` of `cursor`.
+    """
+    try:
+        direction, meter_port_id, timestamp = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split(' ')
+        if direction not in ('n', 'p'):
+            raise ValueError(direction)
+        return (direction, int(meter_port_id), datetime.datetime.strptime(
+            timestamp, _CURSOR_TIMESTAMP_FORMAT))
+    except (TypeError, ValueError, binascii.Error):
+        raise ParseError('Invalid cursor')
+
+
+def temperature_page(meter_ports, from_timestamp, to_timestamp, cursor,
+                     size):
+    """
+    Return up to `size` + 1 temperatures of `meter_ports` from the position
+    of `cursor`, and whether they were read backwards.  Every meter port is
+    read with a range scan of the index on meter port and timestamp, limited
+    to the temperatures still missing.
+    """
+    backwards = False
+    start, position = 0, None
+    if cursor:
+        direction, meter_port_id, timestamp = decode_cursor(cursor)
+        backwards = direction == 'p'
+        ids = [meter_port[0] for meter_port in meter_ports]
+        if meter_port_id not in ids:
+            raise ParseError('Invalid cursor')
+        start, position = ids.index(meter_port_id), timestamp
+    if backwards:
+        ports = meter_ports[start::-1]
+    else:
+        ports = meter_ports[start:]
+    result = []
+    for meter_port_id, submeter_name in ports:
+        measurements = Measurement.objects.filter(meter_port=meter_port_id)
+        if from_timestamp and to_timestamp:
+            measurements = measurements.filter(timestamp__gte=from_timestamp,
+                                               timestamp__lte=to_timestamp)
+        if position is not None and backwards:
+            measurements = measurements.filter(timestamp__lt=position)
+        elif position is not None:
+            measurements = measurements.filter(timestamp__gt=position)
+        position = None
+        measurements = measurements.order_by(
+            '-timestamp' if backwards else 'timestamp').values_list(
+                'value', 'timestamp')[:size + 1 - len(result)]
+        result.extend((meter_port_id, Temperature(value, timestamp,
+                                                  submeter_name))
+                      for value, timestamp in measurements)
+        if len(result) > size:
+            break
+    return result, backwards
+
+
 @require_GET
 def get_temperature_home(request, pk):
+    """
+    Returns a page of the temperatures of the submeters of home `pk`,
+    ordered by submeter name and timestamp, with the cursors of the pages
+    before and after it
+    """
     from_timestamp, to_timestamp = get_urlquery_timespan(request,
                                                          required=False)
-    kwargs = {
-        'meter_port__submeter__residential_home__id': pk,
-        'meter_port__resource_type': 'temperature',
-    }
+    cursor = request.QUERY_PARAMS.get('cursor')
+    size = TEMPERATURE_PAGE_SIZE
+    result, backwards = temperature_page(
+        temperature_meter_ports(pk), from_timestamp, to_timestamp, cursor,
+        size)
+    more = len(result) > size
+    result = result[:size]
+    if backwards:
+        result.reverse()
+
+    def link(direction, index):
+        meter_port_id, temperature = result[index]
+        return replace_query_param(
+            request.build_absolute_uri(), 'cursor',
+            encode_cursor(direction, meter_port_id, temperature.timestamp))
+
+    # a cursor was taken from a page on the other side
+    if backwards:
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, bool(cursor)
+    page = {'next': None, 'previous': None,
+            'results': [temperature for _, temperature in result]}
+    if result and has_next:
+        page['next'] = link('n', -1)
+    if result and has_previous:
+        page['previous'] = link('p', 0)
+    return Response(TemperaturePageSerializer(page).data)
+
+
+@require_GET
+def stream_temperature_home(request, pk):
+    """
+    Returns a response streaming all temperatures of the submeters of home
+    `pk`, ordered as the pages of `get_temperature_home`
+    """
+    from_timestamp, to_timestamp = get_urlquery_timespan(request,
+                                                         required=False)
+    measurements = Measurement.objects.filter(
+        meter_port__in=[meter_port_id for meter_port_id, _ in
+                        temperature_meter_ports(pk)])
     if from_timestamp and to_timestamp:
-        kwargs.update({
-            'timestamp__gte': from_timestamp,
-            'timestamp__lte': to_timestamp,
-        })
-    result = Measurement.objects.filter(**kwargs).order_by(
-        'meter_port__submeter__residential_home__id',
-        'meter_port__submeter__name',
-        'timestamp',
-    ).values_list(
+        measurements = measurements.filter(timestamp__gte=from_timestamp,
+                                           timestamp__lte=to_timestamp)
+    rows = stream_rows(
+        measurements.order_by('meter_port__submeter__name', 'meter_port',
+                              'timestamp'),
         'value', 'timestamp', 'meter_port__submeter__name')
-    result_queryset = list(map(lambda m: Temperature(*m), result))
-    paginator = Paginator(result_queryset, 20)
-    page = request.QUERY_PARAMS.get('page')
-    try:
-        result_paginated = paginator.page(page)
-    except PageNotAnInteger:
-        result_paginated = paginator.page(1)
-    except EmptyPage:
-        result_paginated = paginator.page(paginator.num_pages)
-
-    serializer_context = {'request': request}
-    serializer = PaginatedTemperatureSerializer(
-        result_paginated,
-        context=serializer_context
-    )
-    return Response(serializer.data)
+    return streaming_json_response(
+        TemperatureSerializer(Temperature(*row)).data for row in rows)
 
 
 # Class to feed the serializer
@@ -258,16 +675,12 @@ def virtual_energy_measurements_to_objs(
                               to_timestamp=to_timestamp)
 
 
-def get_virtual_energy_measurements(virtual_port_id, from_timestamp,
-                                    to_timestamp):
+def get_virtual_energy_port(virtual_port_id):
     """
-    Get follower measurements (current, voltage, and power_factor) and leading
-    measurements (the consumption)
+    Get the `VirtualEnergyPort` `virtual_port_id`
     """
-    leader_field = 'consumption'
-    followers = ['current', 'voltage', 'power_factor']
     try:
-        meter_port_ids = VirtualEnergyPort.objects.get(id=virtual_port_id)
+        return VirtualEnergyPort.objects.get(id=virtual_port_id)
     except MultipleObjectsReturned:
         err_msg = "Virtualport '{}' have multiple entries".format(
             virtual_port_id)
@@ -278,9 +691,25 @@ def get_virtual_energy_measurements(virtual_port_id, from_timestamp,
     except:
         raise ParseError("Unexpected error")
 
+
+def virtual_energy_querysets(virtual_port_id, from_timestamp, to_timestamp):
+    """
+    Get the querysets of the follower measurements (current, voltage, and
+    power_factor) and the leading measurements (the consumption)
+    """
+    leader_field = 'consumption'
+    followers = ['current', 'voltage', 'power_factor']
+    meter_port_ids = get_virtual_energy_port(virtual_port_id)
+
     leader_measurements = Measurement.objects.filter(
         meter_port_id=getattr(meter_port_ids, leader_field).id
     ).order_by('timestamp')
+    follower_measurements = [
+        Measurement.objects.filter(
+            meter_port_id=getattr(meter_port_ids, m_type).id
+        ).order_by('timestamp')
+        for m_type in followers
+    ]
 
     if from_timestamp and to_timestamp:
         leader_measurements = leader_measurements.filter(
@@ -289,38 +718,205 @@ def get_virtual_energy_measurements(virtual_port_id, from_timestamp,
         )
 
         follower_measurements = [
-            Measurement.objects.filter(
-                meter_port_id=getattr(meter_port_ids, m_type).id,
+            follower.filter(
                 timestamp__gt=from_timestamp,
                 timestamp__lt=to_timestamp)
-            for m_type in followers
+            for follower in follower_measurements
         ]
 
     return follower_measurements, leader_measurements
 
 
-def calc_timeslots(followers, leader):
+def get_virtual_energy_measurements(virtual_port_id, from_timestamp,
+                                    to_timestamp):
     """
-    Calculate `avg_timeslot` on timeslots defined by leader
+    Get follower measurements (current, voltage, and power_factor) and leading
+    measurements (the consumption)
     """
-    def avg_timeslot(follower, from_timestamp, to_timestamp):
-        values = [measurement.value for measurement in list(follower) if
-                  from_timestamp <= measurement.timestamp <= to_timestamp]
-        if len(values):
-            return round(sum(values)/len(values))
+    followers, leader = virtual_energy_querysets(virtual_port_id,
+                                                 from_timestamp, to_timestamp)
+    if settings.HOMES_VIRTUAL_ENERGY_ENGINE == 'numpy':
+        # `SampleArrays`, which `calc_timeslots` aligns with NumPy
+        return ([load_samples(follower, engine='numpy')
+                 for follower in followers],
+                load_samples(leader, engine='numpy'))
+    return ([stream_samples(follower) for follower in followers],
+            stream_samples(leader))
 
-    def measurement_timeslot(from_meas, to_meas, followers):
-        return ([
-            avg_timeslot(field, from_meas.timestamp, to_meas.timestamp)
-            for field in itertools.takewhile(lambda x: bool(x), followers)
-        ]),
 
-    leader_overlap = pairwise(leader)
-    entries = ((from_meas.value, to_meas.value) +
-               measurement_timeslot(from_meas, to_meas, followers) +
-               (from_meas.timestamp, to_meas.timestamp)
-               for from_meas, to_meas in leader_overlap)
-    return itertools.filterfalse(lambda x: not all(x), entries)
+def calc_timeslots(followers, leader):
+    """
+    Calculate the average of every follower on the timeslots defined by
+    leader, in one pass over the leader and the followers ordered by
+    timestamp.
+
+    Every follower keeps a window of its samples within the current timeslot
+    (both ends included) and their running sum; as the timeslots only move
+    forward, every sample enters and leaves the window once.
+    """
+    followers = list(followers)
+    if all(isinstance(samples, SampleArrays)
+           for samples in followers + [leader]):
+        yield from calc_timeslots_arrays(followers, leader)
+        return
+    # [samples, next sample, window, sum of the window] of every follower
+    windows = []
+    for follower in followers:
+        follower = iter(follower)
+        windows.append([follower, next(follower, None), deque(), 0])
+    leader = iter(leader)
+    from_meas = next(leader, None)
+    for to_meas in leader:
+        from_timestamp = from_meas.timestamp
+        to_timestamp = to_meas.timestamp
+        entry = [from_meas.value, to_meas.value]
+        for window in windows:
+            follower, pending, window_samples, total = window
+            while pending is not None and pending.timestamp <= to_timestamp:
+                window_samples.append(pending)
+                total += pending.value
+                pending = next(follower, None)
+            while (window_samples and
+                   window_samples[0].timestamp < from_timestamp):
+                total -= window_samples.popleft().value
+            window[1] = pending
+            window[3] = total
+            entry.append(round(total / len(window_samples))
+                         if window_samples else None)
+        from_meas = to_meas
+        if all(entry):
+            yield tuple(entry) + (from_timestamp, to_timestamp)
+
+
+def calc_timeslots_arrays(followers, leader):
+    """
+    `calc_timeslots` of followers and leader given as `SampleArrays`,
+    computed with NumPy; returns a list.
+
+    The samples of every follower within a timeslot are located with
+    `searchsorted` on both ends and summed from the cumulative sums of the
+    follower, so the whole alignment is a few vectorised passes.  Averages
+    are divided and rounded in floating point like `calc_timeslots`, so the
+    result is identical; it falls back to `calc_timeslots` for input it
+    does not cover: unordered samples or sums beyond 2 ** 53.
+    """
+    if not all(_covered(arrays) for arrays in followers + [leader]):
+        return list(calc_timeslots(
+            [follower.samples() for follower in followers],
+            leader.samples()))
+    timestamps, values = leader
+    if len(timestamps) < 2:
+        return []
+    columns = [values[:-1].tolist(), values[1:].tolist()]
+    keep = (values[:-1] != 0) & (values[1:] != 0)
+    for follower_timestamps, follower_values in followers:
+        low = np.searchsorted(follower_timestamps, timestamps[:-1], 'left')
+        high = np.searchsorted(follower_timestamps, timestamps[1:], 'right')
+        sums = np.concatenate(([0], np.cumsum(follower_values)))
+        counts = high - low
+        averages = np.rint(
+            (sums[high] - sums[low]) / np.maximum(counts, 1)).astype(np.int64)
+        keep &= (counts > 0) & (averages != 0)
+        columns.append(averages.tolist())
+    timestamps = timestamps.astype('datetime64[us]').astype(object).tolist()
+    columns.extend((timestamps[:-1], timestamps[1:]))
+    return list(itertools.compress(zip(*columns), keep.tolist()))
+
+
+def _covered(arrays):
+    # ordered samples whose sums are exact in int64 and float64
+    timestamps, values = arrays
+    if not len(values):
+        return True
+    largest = max(abs(int(values.min())), abs(int(values.max())))
+    return (largest * len(values) < 2 ** 53 and
+            bool((timestamps[1:] >= timestamps[:-1]).all()))
+
+
+# averages rounded half to even, as `round` in Python
+_ROUND_HALF_EVEN = (
+    'CASE WHEN {0} - floor({0}) = 0.5 THEN 2 * round({0} / 2) '
+    'ELSE round({0}) END')
+
+_TIMESLOTS_SQL = '''
+SELECT * FROM (
+    SELECT leader.value,
+           leader.next_value,
+           ({current})::bigint AS "current",
+           ({voltage})::bigint AS "voltage",
+           ({power_factor})::bigint AS "power_factor",
+           leader."timestamp",
+           leader.next_timestamp
+    FROM (
+        SELECT "timestamp", value,
+               lead("timestamp") OVER ordered AS next_timestamp,
+               lead(value) OVER ordered AS next_value
+        FROM ({leader}) AS m ("timestamp", value)
+        WINDOW ordered AS (ORDER BY "timestamp")
+    ) AS leader
+    {joins}
+    WHERE leader.next_timestamp IS NOT NULL
+) AS timeslots
+WHERE value <> 0 AND next_value <> 0 AND "current" <> 0 AND "voltage" <> 0
+    AND "power_factor" <> 0
+ORDER BY "timestamp"
+'''
+
+_TIMESLOT_JOIN = '''
+    CROSS JOIN LATERAL (
+        SELECT avg(m.value) AS average
+        FROM ({measurements}) AS m ("timestamp", value)
+        WHERE m."timestamp" >= leader."timestamp"
+            AND m."timestamp" <= leader.next_timestamp
+    ) AS "{follower}"
+'''
+
+
+def calc_timeslots_sql(followers, leader):
+    """
+    `calc_timeslots` of the current, voltage and power_factor measurement
+    querysets `followers` on the leading measurement queryset `leader`,
+    computed by PostgreSQL: the timeslots come from `lead()` over the leader
+    and every follower is averaged over the range of a timeslot, read from
+    the index on meter port and timestamp.  The rows are streamed.
+
+    Returns None on other backends, so callers fall back to
+    `calc_timeslots`.
+    """
+    if connections[leader.db].vendor != 'postgresql':
+        return None
+    names = ['current', 'voltage', 'power_factor']
+    leader_sql, params = leader.order_by().values_list(
+        'timestamp', 'value').query.sql_with_params()
+    params = list(params)
+    joins = []
+    for name, follower in zip(names, followers):
+        follower_sql, follower_params = follower.order_by().values_list(
+            'timestamp', 'value').query.sql_with_params()
+        joins.append(_TIMESLOT_JOIN.format(measurements=follower_sql,
+                                           follower=name))
+        params.extend(follower_params)
+    sql = _TIMESLOTS_SQL.format(
+        leader=leader_sql, joins=''.join(joins),
+        **{name: _ROUND_HALF_EVEN.format('"{}".average'.format(name))
+           for name in names})
+    return stream_sql(sql, params, using=leader.db)
+
+
+def materialized_timeslots(virtual_port_id, from_timestamp, to_timestamp):
+    """
+    `calc_timeslots` of virtual energy port `virtual_port_id` read from its
+    materialized measurements (see `dbservice.apps.homes.virtual`)
+    """
+    virtual_port = get_virtual_energy_port(virtual_port_id)
+    measurements = VirtualEnergyMeasurement.objects.filter(
+        virtual_energy_port=virtual_port)
+    if from_timestamp and to_timestamp:
+        measurements = measurements.filter(
+            from_timestamp__gt=from_timestamp,
+            to_timestamp__lt=to_timestamp)
+    return stream_rows(measurements.order_by('from_timestamp'),
+                       *ConsumptionAligned._fields)
 
 
 @require_GET
@@ -332,10 +928,17 @@ def response_virtual_energy_port_measurements(request, virtual_port_id):
     from_timestamp, to_timestamp = get_urlquery_timespan(request,
                                                          required=False)
 
-    followers, leader = get_virtual_energy_measurements(virtual_port_id,
-                                                        from_timestamp,
-                                                        to_timestamp)
-    entries = calc_timeslots(followers, leader)
+    entries = None
+    if settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        entries = materialized_timeslots(virtual_port_id, from_timestamp,
+                                         to_timestamp)
+    elif settings.HOMES_VIRTUAL_ENERGY_ENGINE == 'sql':
+        entries = calc_timeslots_sql(*virtual_energy_querysets(
+            virtual_port_id, from_timestamp, to_timestamp))
+    if entries is None:
+        followers, leader = get_virtual_energy_measurements(
+            virtual_port_id, from_timestamp, to_timestamp)
+        entries = calc_timeslots(followers, leader)
     result = itertools.starmap(virtual_energy_measurements_to_objs, entries)
     serializer = VirtualEnergyMeasurementSerializer(result, many=True)
     return Response(serializer.data)
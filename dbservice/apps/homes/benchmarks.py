@@ -0,0 +1,298 @@
+"""
+Benchmarks of the measurement ingest and analytics paths
+
+Run with `./manage.py benchmark <name>`.  Every benchmark creates its own
+throw-away user, home and meter ports and removes them again afterwards, so
+it may be run against a copy of a production database.
+"""
+import contextlib
+import datetime
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import override_settings
+
+from dbservice.apps.users.models import User
+from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+from dbservice.apps.utils import RESOURCE_TYPE_CHOICES
+
+from . import models
+from .condensed import (Sample, condense, condense_arrays, sample_arrays,
+                        samples)
+from .aggregated import (aggregate_mainmeter_consumption, calc_timeslots,
+                         calc_timeslots_arrays)
+from .fleet import load_curve
+from .ingest import MeasurementRow, load_measurements, parse_measurements
+from .serializers import MeasurementSerializer
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Register the decorated function as benchmark `name`.
+    """
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+@contextlib.contextmanager
+def timed(out, label, rows=None):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if rows:
+        out.write('{:<40} {:>10.3f} s {:>12.0f} rows/s\n'.format(
+            label, elapsed, rows / elapsed))
+    else:
+        out.write('{:<40} {:>10.3f} s\n'.format(label, elapsed))
+
+
+@contextlib.contextmanager
+def meter_ports(count=1, unit=MEASUREMENT_UNIT_CHOICES[0][0]):
+    """
+    Yield `count` meter ports on the main meter of a temporary home.
+    """
+    user = User.objects.create_user(
+        'benchmark-{}@dbservice.invalid'.format(time.time()), None)
+    home = models.ResidentialHome.objects.create(
+        dno_customer_id=user, country='denmark')
+    mainmeter = models.MainMeter.objects.create(
+        residential_home=home, name='benchmark main meter')
+    ports = [
+        models.MeterPort.objects.create(
+            mainmeter=mainmeter,
+            name='benchmark meter port {}'.format(n),
+            resource_type=RESOURCE_TYPE_CHOICES[0][0],
+            unit=unit,
+        )
+        for n in range(count)
+    ]
+    try:
+        yield user, ports
+    finally:
+        models.Measurement.objects.filter(meter_port__in=ports).delete()
+        models.MeterPort.objects.filter(
+            id__in=[port.id for port in ports]).delete()
+        user.delete()
+
+
+@contextlib.contextmanager
+def fleet(count, unit=MEASUREMENT_UNIT_CHOICES[0][0]):
+    """
+    Yield `count` temporary homes, each with one meter port on its main
+    meter.
+    """
+    users, homes, ports = [], [], []
+    for n in range(count):
+        # a user owns a single home
+        user = User.objects.create_user(
+            'benchmark-{}-{}@dbservice.invalid'.format(time.time(), n), None)
+        users.append(user)
+        home = models.ResidentialHome.objects.create(
+            dno_customer_id=user, country='denmark')
+        mainmeter = models.MainMeter.objects.create(
+            residential_home=home, name='benchmark main meter')
+        homes.append(home)
+        ports.append(models.MeterPort.objects.create(
+            mainmeter=mainmeter,
+            name='benchmark meter port',
+            resource_type=RESOURCE_TYPE_CHOICES[0][0],
+            unit=unit,
+        ))
+    try:
+        yield homes, ports
+    finally:
+        models.Measurement.objects.filter(meter_port__in=ports).delete()
+        models.MeterPort.objects.filter(
+            id__in=[port.id for port in ports]).delete()
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def accumulating_payload(meter_port, rows, start=None,
+                         period=datetime.timedelta(seconds=10)):
+    """
+    Return `rows` accumulating energy measurements as posted by a gateway.
+    """
+    start = start or datetime.datetime(2015, 1, 1)
+    url = reverse('homes-v1-meterport-detail', kwargs={'pk': meter_port.pk})
+    return [
+        {
+            'meter_port': url,
+            'timestamp': (start + n * period).isoformat(),
+            'value': 1000 * n,
+        }
+        for n in range(rows)
+    ]
+
+
+@benchmark('ingest')
+def ingest_benchmark(out, rows=10000, **options):
+    """
+    Compare the serializer based bulk create with the bulk ingest path.
+    """
+    with meter_ports(2) as (user, (serializer_port, ingest_port)):
+        payload = accumulating_payload(serializer_port, rows)
+        with timed(out, 'serializer bulk create', rows):
+            serializer = MeasurementSerializer(data=payload, many=True)
+            assert serializer.is_valid(), serializer.errors
+            serializer.save(force_insert=True)
+
+        payload = accumulating_payload(ingest_port, rows)
+        with timed(out, 'bulk ingest', rows):
+            parsed, errors = parse_measurements(payload, user)
+            assert not errors, errors
+            load_measurements(parsed)
+
+
+@benchmark('query')
+def query_benchmark(out, rows=10000, **options):
+    """
+    Time hourly condensing of a meter port and show the query plan of the
+    raw data scan; run before and after changing the index layout.
+    """
+    with meter_ports(1) as (user, (port,)):
+        payload = accumulating_payload(port, rows)
+        parsed, errors = parse_measurements(payload, user)
+        load_measurements(parsed)
+        first, last = parsed[0].timestamp, parsed[-1].timestamp
+        increment = datetime.timedelta(hours=1)
+        queryset = models.Measurement.objects.filter(
+            meter_port_id=port.id,
+            timestamp__gt=first - increment,
+            timestamp__lt=last + increment,
+        ).order_by('timestamp')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE {}'.format(
+                    models.Measurement._meta.db_table))
+                sql, params = queryset.values_list(
+                    'timestamp', 'value').query.sql_with_params()
+                cursor.execute('EXPLAIN ' + sql, params)
+                for line, in cursor.fetchall():
+                    out.write('  {}\n'.format(line))
+        for run in range(3):
+            with timed(out, 'hourly condense (run {})'.format(run), rows):
+                list(condense(samples(queryset), first, increment))
+
+
+@benchmark('storage')
+def storage_benchmark(out, rows=10000, **options):
+    """
+    Compare the on-disk size of measurement rows with and without per row
+    audit timestamps (PostgreSQL only).
+    """
+    if connection.vendor != 'postgresql':
+        out.write('storage benchmark requires PostgreSQL\n')
+        return
+    table = models.Measurement._meta.db_table
+    with meter_ports(2) as (user, (audited_port, lean_port)):
+        for port, audit in ((audited_port, True), (lean_port, False)):
+            parsed, errors = parse_measurements(
+                accumulating_payload(port, rows), user)
+            with override_settings(HOMES_MEASUREMENT_AUDIT_TIMESTAMPS=audit):
+                load_measurements(parsed)
+        with connection.cursor() as cursor:
+            for port, label in ((audited_port, 'audited'),
+                                (lean_port, 'lean')):
+                cursor.execute(
+                    'SELECT avg(pg_column_size(m.*)) FROM {} m '
+                    'WHERE meter_port_id = %s'.format(table), [port.id])
+                size, = cursor.fetchone()
+                out.write('{:<40} {:>10.1f} bytes/row\n'.format(
+                    '{} row'.format(label), size))
+
+
+@benchmark('condense')
+def condense_benchmark(out, rows=500000, **options):
+    """
+    Compare the condense engines on a year of minute samples in memory.
+    """
+    start = datetime.datetime(2015, 1, 1)
+    raw_data = [
+        Sample(start + datetime.timedelta(minutes=n), 1000 * n)
+        for n in range(rows)
+    ]
+    arrays = sample_arrays(raw_data)
+    for label, increment in (('hourly', datetime.timedelta(hours=1)),
+                             ('daily', datetime.timedelta(days=1))):
+        timings = []
+        for engine, run in (
+                ('python', lambda: list(condense(raw_data, start,
+                                                 increment))),
+                ('numpy', lambda: condense_arrays(arrays, start,
+                                                  increment))):
+            started = time.perf_counter()
+            with timed(out, '{} condense ({})'.format(label, engine), rows):
+                run()
+            timings.append(time.perf_counter() - started)
+        out.write('{:<40} {:>10.1f} x\n'.format(
+            '{} speedup'.format(label), timings[0] / timings[1]))
+
+
+@benchmark('fleet')
+def fleet_benchmark(out, homes=1000, days=30, **options):
+    """
+    Compare the fleet load curve of `homes` homes with a month of 15 minute
+    samples with condensing every home on its own.
+    """
+    start = datetime.datetime(2015, 1, 1)
+    period = datetime.timedelta(minutes=15)
+    samples_per_home = int(datetime.timedelta(days=days) / period)
+    tau = datetime.timedelta(minutes=15)
+    end = start + datetime.timedelta(days=days)
+    with fleet(homes) as (fleet_homes, ports):
+        for port in ports:
+            load_measurements([
+                MeasurementRow(port.id, start + n * period, 1000 * n)
+                for n in range(samples_per_home)
+            ])
+        home_ids = [home.id for home in fleet_homes]
+        rows = homes * samples_per_home
+        with timed(out, 'per home condense', rows):
+            for home_id in home_ids:
+                list(aggregate_mainmeter_consumption(home_id, start, end,
+                                                     tau))
+        for processes in sorted({1, settings.HOMES_FLEET_PROCESSES}):
+            with timed(out, 'load curve ({} processes)'.format(processes),
+                       rows):
+                load_curve('consumption', home_ids, start, end, tau,
+                           processes=processes)
+
+
+@benchmark('virtual')
+def virtual_benchmark(out, days=30, **options):
+    """
+    Compare the virtual energy engines aligning a month of 10 second current,
+    voltage and power factor samples in memory on the intervals of the 10
+    second consumption samples.
+    """
+    start = datetime.datetime(2015, 1, 1)
+    rows = int(datetime.timedelta(days=days) / datetime.timedelta(seconds=10))
+    leader = [
+        Sample(start + datetime.timedelta(seconds=10 * n), 1000 * n + 1)
+        for n in range(rows)
+    ]
+    followers = [
+        [Sample(start + datetime.timedelta(seconds=10 * n + 3), 230 + n % 7)
+         for n in range(rows)]
+        for _ in range(3)
+    ]
+    follower_arrays = [sample_arrays(follower) for follower in followers]
+    leader_arrays = sample_arrays(leader)
+    timings = []
+    for engine, run in (
+            ('python', lambda: list(calc_timeslots(followers, leader))),
+            ('numpy', lambda: calc_timeslots_arrays(follower_arrays,
+                                                    leader_arrays))):
+        started = time.perf_counter()
+        with timed(out, 'virtual energy alignment ({})'.format(engine), rows):
+            run()
+        timings.append(time.perf_counter() - started)
+    out.write('{:<40} {:>10.1f} x\n'.format(
+        'virtual energy speedup', timings[0] / timings[1]))
@@ -0,0 +1,403 @@
+"""
+Write-behind buffer in front of the bulk ingest path
+
+Gateways post many small batches; loading each in its own transaction costs
+a round trip and a commit per request.  With `HOMES_INGEST_BUFFER` enabled
+validated rows are queued in process and a background thread loads them in
+large batches once `HOMES_INGEST_BUFFER_FLUSH_ROWS` rows are pending or
+`HOMES_INGEST_BUFFER_FLUSH_SECONDS` have passed.
+
+A request is acknowledged either after its rows are committed (`commit`) or
+as soon as they are written and fsync'ed to the spool directory (`spool`).
+A batch not committed within `HOMES_INGEST_BUFFER_COMMIT_TIMEOUT` is
+acknowledged as accepted with its id, like a spooled one.
+Spooled batches are removed once committed and loaded again when the buffer
+starts, so an acknowledged batch survives a crash of the process.  Every
+process holds a lock on the spool files of its pending batches, so the
+buffers of the other processes sharing the spool directory only recover the
+batches of processes that are gone.  When more
+than `HOMES_INGEST_BUFFER_MAX_ROWS` rows are pending new requests wait up to
+`HOMES_INGEST_BUFFER_BLOCK_SECONDS` for room and are then turned away with
+503 Service Unavailable.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from dbservice.apps.users.models import User
+
+from .ingest import ON_CONFLICT_REJECT, MeasurementRow, load_measurements
+from .models import Measurement
+from .signals import measurement_ranges, measurements_committed
+
+logger = logging.getLogger(__name__)
+
+ACK_SPOOL = 'spool'
+ACK_COMMIT = 'commit'
+ACK_CHOICES = (ACK_SPOOL, ACK_COMMIT)
+
+SPOOL_SUFFIX = '.json'
+FAILED_SUFFIX = '.failed'
+
+
+class BufferFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Ingest buffer full, retry later.'
+
+
+class PendingBatch(object):
+    """
+    Rows of one request waiting to be flushed.
+    """
+    def __init__(self, rows, on_conflict, user=None, source='api',
+                 spool_path=None, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.rows = rows
+        self.on_conflict = on_conflict
+        self.user = user
+        self.source = source
+        self.spool_path = spool_path
+        # the spool file, open and locked while the batch is pending
+        self.spool_file = None
+        self.count = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, count=None, error=None):
+        self.count = count
+        self.error = error
+        if self.spool_path is not None:
+            try:
+                if error is None:
+                    os.remove(self.spool_path)
+                else:
+                    os.rename(self.spool_path,
+                              self.spool_path + FAILED_SUFFIX)
+            except OSError:
+                logger.exception('Failed to unspool ingest batch %s',
+                                 self.spool_path)
+            # the lock is released after the file is gone, see `_claim`
+            self.spool_file.close()
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the batch to be committed and return the number of rows
+        stored, re-raising the error of a failed load.  Returns None when the
+        batch is still pending after `timeout` seconds.
+        """
+        if not self.done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.count
+
+
+def _dump(batch):
+    return json.dumps({
+        'id': batch.id,
+        'on_conflict': batch.on_conflict,
+        'user_id': batch.user.id if batch.user is not None else None,
+        'source': batch.source,
+        'rows': [[row.meter_port_id, row.timestamp.isoformat(), row.value]
+                 for row in batch.rows],
+    })
+
+
+def _load(data):
+    data = json.loads(data)
+    rows = [MeasurementRow(meter_port_id, parse_datetime(timestamp), value)
+            for meter_port_id, timestamp, value in data['rows']]
+    user = User.objects.filter(id=data['user_id']).first()
+    return PendingBatch(rows, data['on_conflict'], user,
+                        data.get('source', 'api'), id=data.get('id'))
+
+
+class IngestBuffer(object):
+    def __init__(self, max_rows=None, flush_rows=None, flush_seconds=None,
+                 spool_dir=None):
+        self.max_rows = max_rows or settings.HOMES_INGEST_BUFFER_MAX_ROWS
+        self.flush_rows = (flush_rows or
+                           settings.HOMES_INGEST_BUFFER_FLUSH_ROWS)
+        self.flush_seconds = (flush_seconds or
+                              settings.HOMES_INGEST_BUFFER_FLUSH_SECONDS)
+        self.spool_dir = spool_dir or settings.HOMES_INGEST_BUFFER_SPOOL_DIR
+        self.pending = []
+        self.pending_rows = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._recover()
+
+    def _claim(self, path):
+        """
+        Return the spool file at `path` open and locked, or None when a live
+        process holds it or it is gone.
+        """
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # the holder may have unspooled it before releasing the lock
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except OSError:
+            pass
+        f.close()
+        return None
+
+    def _recover(self):
+        """
+        Queue the batches spooled but not committed by processes that are
+        gone.
+        """
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(SPOOL_SUFFIX):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            f = self._claim(path)
+            if f is None:
+                continue
+            batch = _load(f.read())
+            batch.spool_path = path
+            batch.spool_file = f
+            self.pending.append(batch)
+            self.pending_rows += len(batch.rows)
+        if self.pending:
+            logger.info('Recovered %d spooled ingest batches',
+                        len(self.pending))
+
+    def _spool(self, batch):
+        fd, path = tempfile.mkstemp(dir=self.spool_dir, suffix='.tmp')
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write(_dump(batch))
+            f.flush()
+            os.fsync(f.fileno())
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # time ordered names keep the flush order on recovery
+            spool_path = os.path.join(self.spool_dir, '{:017.6f}-{}{}'.format(
+                time.time(), batch.id, SPOOL_SUFFIX))
+            os.rename(path, spool_path)
+        except Exception:
+            f.close()
+            raise
+        batch.spool_path = spool_path
+        batch.spool_file = f
+
+    def _unspool(self, batch):
+        try:
+            os.remove(batch.spool_path)
+        except OSError:
+            logger.exception('Failed to unspool ingest batch %s',
+                             batch.spool_path)
+        batch.spool_file.close()
+
+    def put(self, rows, on_conflict=None, user=None, source='api',
+            ack=ACK_COMMIT, block=None):
+        """
+        Queue `rows` for loading and return the `PendingBatch`.
+
+        With `ack` set to `spool` the rows are written to the spool before
+        this returns.  Raises `BufferFull` when there is no room for the rows
+        within `block` seconds.
+        """
+        if ack not in ACK_CHOICES:
+            raise ValueError('Unknown ack {!r}'.format(ack))
+        if ack == ACK_SPOOL and not self.spool_dir:
+            raise ImproperlyConfigured(
+                'Spool acknowledgement requires '
+                'HOMES_INGEST_BUFFER_SPOOL_DIR.')
+        if block is None:
+            block = settings.HOMES_INGEST_BUFFER_BLOCK_SECONDS
+        on_conflict = on_conflict or settings.HOMES_INGEST_ON_CONFLICT
+        batch = PendingBatch(rows, on_conflict, user, source)
+        deadline = time.monotonic() + block
+        # written and fsync'ed before taking the lock, which the flush and
+        # every other request wait on
+        if self.spool_dir:
+            self._spool(batch)
+        with self.condition:
+            while (self.pending and
+                   self.pending_rows + len(rows) > self.max_rows):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if batch.spool_path is not None:
+                        self._unspool(batch)
+                    raise BufferFull()
+                self.condition.notify_all()
+                self.condition.wait(remaining)
+            self.pending.append(batch)
+            self.pending_rows += len(rows)
+            if self.pending_rows >= self.flush_rows:
+                self.condition.notify_all()
+        return batch
+
+    def _take(self):
+        with self.condition:
+            batches, self.pending = self.pending, []
+            self.pending_rows = 0
+            self.condition.notify_all()
+        return batches
+
+    def flush(self):
+        """
+        Load every pending batch, grouping the batches with the same conflict
+        handling, user and source.  Rejecting batches store either every row
+        or none, so a group of them is combined into a single load; when it
+        fails its batches are loaded one by one, so only the offending batch
+        fails.  Other groups are loaded one batch at a time within a single
+        transaction, which tells the rows stored of each batch.
+        """
+        groups = {}
+        for batch in self._take():
+            key = (batch.on_conflict,
+                   batch.user.id if batch.user is not None else None,
+                   batch.source)
+            groups.setdefault(key, []).append(batch)
+        for batches in groups.values():
+            try:
+                self._load(batches)
+            except Exception as e:
+                # fail the batches rather than leave their requests waiting
+                logger.exception('Failed to flush buffered ingest batches')
+                for batch in batches:
+                    if not batch.done.is_set():
+                        batch.finish(error=e)
+
+    def _load(self, batches):
+        first = batches[0]
+        if len(batches) == 1:
+            self._load_one(first)
+            return
+        if first.on_conflict != ON_CONFLICT_REJECT:
+            self._load_each(batches)
+            return
+        rows = [row for batch in batches for row in batch.rows]
+        try:
+            load_measurements(rows, on_conflict=first.on_conflict,
+                              user=first.user, source=first.source)
+        except Exception:
+            for batch in batches:
+                self._load_one(batch)
+        else:
+            for batch in batches:
+                batch.finish(count=len(batch.rows))
+
+    def _load_each(self, batches):
+        """
+        Load `batches` one by one in a single transaction, each in a
+        savepoint of its own so only an offending batch fails.  The batches
+        are finished once the transaction has committed.
+        """
+        results = []
+        with transaction.atomic():
+            for batch in batches:
+                try:
+                    results.append((batch, load_measurements(
+                        batch.rows, on_conflict=batch.on_conflict,
+                        user=batch.user, source=batch.source), None))
+                except Exception as e:
+                    logger.exception('Failed to load buffered ingest batch %s',
+                                     batch.spool_path or batch.id)
+                    results.append((batch, None, e))
+        stored = [batch for batch, count, error in results if error is None]
+        if stored:
+            measurements_committed.send(
+                sender=Measurement, using='default',
+                ranges=measurement_ranges(
+                    row for batch in stored for row in batch.rows))
+        for batch, count, error in results:
+            batch.finish(count=count, error=error)
+
+    def _load_one(self, batch):
+        try:
+            count = load_measurements(batch.rows,
+                                      on_conflict=batch.on_conflict,
+                                      user=batch.user, source=batch.source)
+        except Exception as e:
+            logger.exception('Failed to load buffered ingest batch %s',
+                             batch.spool_path or '')
+            batch.finish(error=e)
+        else:
+            batch.finish(count=count)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.stopping and self.pending_rows < self.flush_rows:
+                    self.condition.wait(self.flush_seconds)
+                stopping = self.stopping
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                # keep flushing; a dead thread would leave every later
+                # request waiting for a flush that never comes
+                logger.exception('Ingest buffer flush failed')
+            if stopping:
+                return
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='ingest-buffer',
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Flush the remaining rows and stop the flush thread.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    Return the ingest buffer of this process, starting it on first use.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = IngestBuffer()
+            _buffer.start()
+            atexit.register(_buffer.stop)
+    return _buffer
+
+
+def buffered_ingest(rows, on_conflict=None, user=None, source='api',
+                    ack=None):
+    """
+    Queue `rows` on the ingest buffer and return the `PendingBatch`.  With
+    `commit` acknowledgement wait up to `HOMES_INGEST_BUFFER_COMMIT_TIMEOUT`
+    for the rows to be committed, re-raising the error of a failed load.
+    """
+    ack = ack or settings.HOMES_INGEST_BUFFER_ACK
+    batch = get_buffer().put(rows, on_conflict=on_conflict, user=user,
+                             source=source, ack=ack)
+    if ack == ACK_COMMIT:
+        batch.wait(settings.HOMES_INGEST_BUFFER_COMMIT_TIMEOUT)
+    return batch
@@ -0,0 +1,172 @@
+"""
+Range aware cache of condensed and aggregated results
+
+Results are cached per scope, a meter port or a residential home, under a
+key of the query parameters, together with the time window of measurements
+the result was computed from.  Each scope keeps an index of its entries and
+their windows, pruned of expired entries and held to
+`HOMES_RESULT_CACHE_MAX_ENTRIES` entries on every write; ingesting
+measurements into a meter port only evicts the entries of the port and its
+home whose window overlaps the ingested range, so dashboards polling past
+windows keep hitting the cache while the current window is recomputed.
+
+Set `HOMES_RESULT_CACHE` to the alias of a shared cache in `CACHES`, such as
+memcached, to enable caching.  Hits and misses are counted in the cache and
+reported by `cache_stats()`.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import MeterPort
+
+PREFIX = 'homes:results:'
+HITS = PREFIX + 'hits'
+MISSES = PREFIX + 'misses'
+
+
+def get_cache():
+    """
+    Return the result cache, or None when caching is disabled.
+    """
+    if not settings.HOMES_RESULT_CACHE:
+        return None
+    return caches[settings.HOMES_RESULT_CACHE]
+
+
+def _scope_key(scope, suffix):
+    kind, pk = scope
+    return '{}{}:{}:{}'.format(PREFIX, kind, pk, suffix)
+
+
+def _entry_key(scope, params):
+    digest = hashlib.md5(repr((scope, params)).encode('utf-8')).hexdigest()
+    return PREFIX + digest
+
+
+def _count(cache, key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.add(key, 1, timeout=None)
+
+
+def _prune(cache, index):
+    """
+    Return `index` without its expired entries and at most
+    `HOMES_RESULT_CACHE_MAX_ENTRIES` entries, evicting those cached before
+    the latest ingests into the scope first and then the oldest.
+    """
+    now = time.time()
+    index = {key: entry for key, entry in index.items()
+             if entry[1] is None or entry[1] > now}
+    excess = len(index) - settings.HOMES_RESULT_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = sorted(index, key=lambda key: (
+            index[key][2],
+            float('inf') if index[key][1] is None else index[key][1]))
+        cache.delete_many(oldest[:excess])
+        for key in oldest[:excess]:
+            del index[key]
+    return index
+
+
+def cached_result(scope, params, window, compute):
+    """
+    Return the result of `compute()` for `params` within `scope`, a
+    `(kind, pk)` pair such as `('port', 1)` or `('home', 1)`, from the cache
+    when possible.  `window` is the `(from, to)` time range of the
+    measurements the result depends on.
+
+    Results computed while measurements of the scope were ingested are not
+    cached, as they may miss some of them.
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    scope = (scope[0], str(scope[1]))
+    key = _entry_key(scope, params)
+    index_key = _scope_key(scope, 'entries')
+    epoch_key = _scope_key(scope, 'epoch')
+    cached = cache.get_many([key, index_key, epoch_key])
+    # entries only count while indexed, so an evicted index evicts them
+    if key in cached and key in cached.get(index_key, {}):
+        _count(cache, HITS)
+        return cached[key]
+    _count(cache, MISSES)
+    epoch = cached.get(epoch_key, 0)
+    result = compute()
+    timeout = settings.HOMES_RESULT_CACHE_TIMEOUT
+    if cache.get(epoch_key, 0) != epoch:
+        return result
+    cache.set(key, result, timeout)
+    # indexed with its window, expiry and the epoch it was computed in
+    index = cache.get(index_key) or {}
+    index[key] = (window, None if timeout is None else time.time() + timeout,
+                  epoch)
+    cache.set(index_key, _prune(cache, index), timeout)
+    if cache.get(epoch_key, 0) != epoch:
+        # raced with an ingest; its eviction may have missed the entry
+        cache.delete(key)
+    return result
+
+
+def invalidate(scope, from_timestamp, to_timestamp):
+    """
+    Evict the cached results of `scope` whose window overlaps the range
+    from `from_timestamp` to `to_timestamp`.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    scope = (scope[0], str(scope[1]))
+    index_key = _scope_key(scope, 'entries')
+    epoch_key = _scope_key(scope, 'epoch')
+    _count(cache, epoch_key)
+    index = cache.get(index_key) or {}
+    stale = [
+        key for key, ((window_from, window_to), expires, epoch)
+        in index.items()
+        if window_from <= to_timestamp and from_timestamp <= window_to
+    ]
+    if not stale:
+        return
+    cache.delete_many(stale)
+    for key in stale:
+        del index[key]
+    cache.set(index_key, index, settings.HOMES_RESULT_CACHE_TIMEOUT)
+
+
+def invalidate_measurements(ranges, using='default'):
+    """
+    Evict the cached results of the meter ports and homes of `ranges`, as
+    sent with `measurements_stored`.
+    """
+    homes = MeterPort.objects.using(using).filter(
+        id__in=list(ranges)).values_list(
+            'id', 'mainmeter__residential_home_id',
+            'submeter__residential_home_id')
+    for meter_port_id, mainmeter_home_id, submeter_home_id in homes:
+        from_timestamp, to_timestamp = ranges[meter_port_id]
+        invalidate(('port', meter_port_id), from_timestamp, to_timestamp)
+        for home_id in {mainmeter_home_id, submeter_home_id} - {None}:
+            invalidate(('home', home_id), from_timestamp, to_timestamp)
+
+
+def cache_stats():
+    """
+    Return the hit and miss counters of the result cache.
+    """
+    cache = get_cache()
+    if cache is None:
+        return {'enabled': False, 'hits': 0, 'misses': 0}
+    counters = cache.get_many([HITS, MISSES])
+    return {
+        'enabled': True,
+        'hits': counters.get(HITS, 0),
+        'misses': counters.get(MISSES, 0),
+    }
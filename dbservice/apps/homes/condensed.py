@@ -1,19 +1,153 @@
 import datetime
+import functools
 import itertools
+import operator
 from collections import namedtuple
 from fractions import Fraction
 
-from .models import Measurement, MeterPort
+from .cache import cached_result
+from .models import Measurement, MeasurementRollup, MeterPort
 from .serializers import PaginatedCondensedSerializer
+from .streaming import bounded, stream_rows
 from .utils import get_urlquery_timespan, pairwise, tabulate
 from django import forms
+from django.conf import settings
 from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.db.models import Max, Min
 from django.views.decorators.http import require_GET
 from rest_framework.exceptions import ParseError
 from rest_framework.generics import Paginator
 from rest_framework.response import Response
 
-from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+from dateutil.relativedelta import relativedelta
+
+from dbservice.apps.utils import (MEASUREMENT_UNIT_CHOICES,
+                                  ROLLUP_RESOLUTION_CHOICES)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+Sample = namedtuple('Sample', ['timestamp', 'value'])
+_sample = functools.partial(tuple.__new__, Sample)
+
+
+def stream_samples(queryset):
+    """
+    Yield the (timestamp, value) samples of a measurement queryset, fetched
+    in chunks; only selecting these columns lets the database answer from
+    the covering (meter_port, timestamp, value) index.
+    """
+    return map(_sample, stream_rows(queryset, 'timestamp', 'value'))
+
+
+def samples(queryset):
+    """
+    Return the (timestamp, value) samples of a measurement queryset.
+    """
+    return list(bounded(stream_samples(queryset)))
+
+
+class SampleArrays(namedtuple('SampleArrays', ['timestamps', 'values'])):
+    """
+    Samples as NumPy arrays of microseconds since the epoch and values.
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def samples(self):
+        return [
+            Sample(timestamp, value) for timestamp, value in zip(
+                self.timestamps.astype('datetime64[us]').astype(object),
+                self.values.tolist())
+        ]
+
+
+def sample_arrays(rows):
+    """
+    Return `(timestamp, value)` rows as `SampleArrays`, or None when the
+    timestamps are timezone aware.  Rows are converted a chunk at a time.
+    """
+    rows = iter(rows)
+    timestamps, values = [], []
+    while True:
+        chunk = list(itertools.islice(rows, settings.HOMES_STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        if chunk[0][0].tzinfo is not None:
+            return None
+        timestamps.append(np.array([row[0] for row in chunk],
+                                   dtype='datetime64[us]').astype(np.int64))
+        values.append(np.array([row[1] for row in chunk], dtype=np.int64))
+    if not timestamps:
+        return SampleArrays(np.array([], dtype=np.int64),
+                            np.array([], dtype=np.int64))
+    return SampleArrays(np.concatenate(timestamps), np.concatenate(values))
+
+
+def corrected_samples(raw_data, following=None):
+    """
+    Yield the samples `raw_data` ordered by timestamp with their values
+    corrected for counter resets: the counter keeps its value over an
+    interval ending in a reset, a drop below the previous sample the next
+    sample does not drop below (`_find_negative_accumulated_values`).  The
+    sample `following` the last one decides on a drop on the last sample;
+    without it the drop is taken for a reset, so the last bucket is not
+    negative until a following sample is stored.
+    """
+    raw_data = iter(raw_data)
+    sample_a = next(raw_data, None)
+    if sample_a is None:
+        return
+    yield sample_a
+    sample_b = next(raw_data, None)
+    offset = 0
+    while sample_b is not None:
+        sample_c = next(raw_data, None)
+        after = following if sample_c is None else sample_c
+        if (sample_b.value < sample_a.value and
+                (after is None or sample_b.value <= after.value)):
+            offset += sample_a.value - sample_b.value
+        yield Sample(sample_b.timestamp, sample_b.value + offset)
+        sample_a, sample_b = sample_b, sample_c
+
+
+def reset_corrected_samples(window, series):
+    """
+    Yield the `corrected_samples` of measurement queryset `window`, a time
+    range of the measurement queryset `series`, deciding on a drop on the
+    last sample of the range with the sample following it in `series`.
+    """
+    last = window.order_by('-timestamp').values_list(
+        'timestamp', flat=True).first()
+    following = None
+    if last is not None:
+        following = series.filter(timestamp__gt=last).order_by(
+            'timestamp').values_list('timestamp', 'value').first()
+    return corrected_samples(
+        stream_samples(window.order_by('timestamp')),
+        Sample(*following) if following else None)
+
+
+def load_samples(queryset, engine=None):
+    """
+    Return the samples of a measurement queryset in the representation of
+    `engine`, by default the configured `HOMES_CONDENSE_ENGINE`:
+    `SampleArrays` for the NumPy engine, otherwise a stream of samples.
+    """
+    if engine is None:
+        engine = settings.HOMES_CONDENSE_ENGINE
+    if engine == 'numpy' and np is not None:
+        arrays = sample_arrays(bounded(
+            stream_rows(queryset, 'timestamp', 'value')))
+        if arrays is not None:
+            return arrays
+    return stream_samples(queryset)
 
 
 class CondensedPeriodForm(forms.Form):
@@ -77,11 +211,330 @@ def condense(raw_data, from_timestamp, increment):
     The queryset `raw_data` is interpolated from `from_timestamp` to
     `to_timestamp` with the sample period `increment`
     """
+    if isinstance(raw_data, SampleArrays):
+        return iter(condense_arrays(raw_data, from_timestamp, increment))
     aligned = _resolution_aligned_data(raw_data, from_timestamp, increment)
     result = map(condense_pair, pairwise(aligned))
     return result
 
 
+_condensed_value = functools.partial(tuple.__new__, CondensedValue)
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_SECOND = 10 ** 6
+
+
+def _interpolate_microseconds(value_before, value_after, before, total):
+    # `_interpolate_sample` on microsecond offsets, including its rounding
+    # of the offsets to float seconds
+    rate = (value_after - value_before) / Fraction(total / _SECOND)
+    return int(value_before + rate * Fraction(before / _SECOND))
+
+
+def condense_arrays(arrays, from_timestamp, increment):
+    """
+    `condense` of `SampleArrays` computed with NumPy; returns a list.
+
+    Every bucket boundary is located with `searchsorted` and interpolated
+    with exact integer arithmetic, so the result is identical to the
+    generator based engine, which it falls back to for input it does not
+    cover: unordered or duplicate timestamps, timezone aware or calendar
+    (relativedelta) increments.
+    """
+    timestamps, values = arrays
+    if (len(timestamps) < 2 or from_timestamp.tzinfo is not None or
+            not isinstance(increment, datetime.timedelta) or
+            increment <= datetime.timedelta(0) or
+            not (timestamps[1:] > timestamps[:-1]).all()):
+        return list(condense(arrays.samples(), from_timestamp, increment))
+
+    step = increment // _MICROSECOND
+    start = (from_timestamp - _EPOCH) // _MICROSECOND
+    first, last = int(timestamps[0]), int(timestamps[-1])
+    # boundaries from + n * increment (n >= 0) within [first, last]
+    n_first = max(0, -((start - first) // step))
+    n_last = (last - start) // step
+    if n_last <= n_first:
+        return []
+    n = np.arange(n_first, n_last + 1, dtype=np.int64)
+    boundaries = start + n * step
+
+    after = np.searchsorted(timestamps, boundaries, side='left')
+    exact = timestamps[after] == boundaries
+    before = np.maximum(after - 1, 0)
+    offset = boundaries - timestamps[before]
+    span = timestamps[after] - timestamps[before]
+    # `_interpolate_sample` divides float seconds; those are exact, and the
+    # interpolation an integer division, for whole seconds
+    whole = exact | ((offset % _SECOND == 0) & (span % _SECOND == 0))
+    interpolate = whole & ~exact
+    offset = np.where(interpolate, offset // _SECOND, 0)
+    span = np.where(interpolate, span // _SECOND, 1)
+
+    value_before = values[before]
+    value_after = values[after]
+    largest = max(abs(int(value_before.min())), abs(int(value_before.max())),
+                  abs(int(value_after.min())), abs(int(value_after.max())))
+    if 4 * largest * int(span.max()) >= 2 ** 63:
+        # the products below could overflow int64
+        value_before = value_before.astype(object)
+        value_after = value_after.astype(object)
+        offset = offset.astype(object)
+        span = span.astype(object)
+    numerator = value_before * span + (value_after - value_before) * offset
+    # truncate towards zero like int(Fraction)
+    interpolated = numerator // span
+    interpolated += (numerator < 0) & (numerator % span != 0)
+    result = np.where(exact, value_after, interpolated).tolist()
+    for i in np.flatnonzero(~whole).tolist():
+        result[i] = _interpolate_microseconds(
+            int(values[before[i]]), int(values[after[i]]),
+            int(boundaries[i] - timestamps[before[i]]),
+            int(timestamps[after[i]] - timestamps[before[i]]))
+
+    stamps = boundaries.astype('datetime64[us]').astype(object).tolist()
+    deltas = map(operator.sub, result[1:], result)
+    return list(map(_condensed_value, zip(stamps, stamps[1:], deltas)))
+
+
+_RELATIVEDELTA_UNITS = ('years', 'months', 'days', 'hours', 'minutes',
+                        'seconds', 'microseconds')
+_RELATIVEDELTA_ABSOLUTE = ('year', 'month', 'day', 'weekday', 'hour',
+                           'minute', 'second', 'microsecond')
+
+# One row per bucket boundary `from + n * increment`: the neighbouring
+# samples are looked up with index scans of `(measurements)`, the boundary
+# value interpolated with `_interpolate_sample` truncation and the bucket
+# values taken with `lead()`.
+_CONDENSE_SQL = '''
+SELECT boundary, next_boundary, next_value - value FROM (
+    SELECT boundary,
+           lead(boundary) OVER (ORDER BY boundary) AS next_boundary,
+           value,
+           lead(value) OVER (ORDER BY boundary) AS next_value
+    FROM (
+        SELECT grid.boundary,
+               CASE
+                   WHEN before."timestamp" = grid.boundary THEN before.value
+                   WHEN after."timestamp" = grid.boundary THEN after.value
+                   ELSE div(
+                       before.value::numeric * {span} +
+                       (after.value - before.value)::numeric * {offset},
+                       {span})::bigint
+               END AS value
+        FROM (
+            SELECT %s::timestamp + n * %s::interval AS boundary
+            FROM generate_series(0, %s) AS n
+        ) AS grid
+        CROSS JOIN LATERAL (
+            SELECT m."timestamp", m.value FROM ({{measurements}}) AS m
+            WHERE m."timestamp" <= grid.boundary
+            ORDER BY m."timestamp" DESC LIMIT 1
+        ) AS before
+        CROSS JOIN LATERAL (
+            SELECT m."timestamp", m.value FROM ({{measurements}}) AS m
+            WHERE m."timestamp" >= grid.boundary
+            ORDER BY m."timestamp" LIMIT 1
+        ) AS after
+    ) AS boundaries
+) AS buckets
+WHERE next_boundary IS NOT NULL
+ORDER BY boundary
+'''.format(
+    span=('round(extract(epoch FROM after."timestamp" - before."timestamp")'
+          '::numeric * 1000000)'),
+    offset=('round(extract(epoch FROM grid.boundary - before."timestamp")'
+            '::numeric * 1000000)'))
+
+
+def _sql_interval(increment):
+    # interval literal of `increment`, or None when not expressible
+    if isinstance(increment, datetime.timedelta):
+        return '{} days {} seconds {} microseconds'.format(
+            increment.days, increment.seconds, increment.microseconds)
+    if (not isinstance(increment, relativedelta) or
+            any(getattr(increment, attr) is not None
+                for attr in _RELATIVEDELTA_ABSOLUTE) or
+            increment.leapdays):
+        return None
+    return ' '.join('{} {}'.format(getattr(increment, unit), unit)
+                    for unit in _RELATIVEDELTA_UNITS)
+
+
+def condense_sql(queryset, from_timestamp, to_timestamp, increment):
+    """
+    `condense` of the samples of measurement `queryset`, computed by
+    PostgreSQL so only one row per bucket is transferred.  `queryset`
+    must already be restricted to the samples around the requested range.
+
+    Bucket boundaries up to `to_timestamp + increment` are generated with
+    `generate_series`; both `timedelta` and `relativedelta` increments are
+    supported and match the Python engine for timestamps at whole seconds.
+    Returns None on other backends, for timezone aware timestamps and for
+    increments SQL cannot express, so callers fall back to `condense`.
+    """
+    connection = connections[queryset.db]
+    interval = _sql_interval(increment)
+    if (connection.vendor != 'postgresql' or interval is None or
+            from_timestamp.tzinfo is not None or
+            from_timestamp + increment <= from_timestamp):
+        return None
+    end = to_timestamp + increment
+    if isinstance(increment, datetime.timedelta):
+        last = (end - from_timestamp) // increment
+    else:
+        last = 0
+        while from_timestamp + (last + 1) * increment <= end:
+            last += 1
+    measurements, params = queryset.order_by().values_list(
+        'timestamp', 'value').query.sql_with_params()
+    sql = _CONDENSE_SQL.format(measurements=measurements)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [from_timestamp, interval, max(last, 0)] +
+                       list(params) + list(params))
+        return list(map(_condensed_value, cursor.fetchall()))
+
+
+def condensed_from_rollups(meter_port_id, from_timestamp, to_timestamp,
+                           increment, inclusive=False, boundaries=None):
+    """
+    `condense` of the measurements of `meter_port_id` from
+    `from_timestamp - increment` to `to_timestamp + increment`, read from the
+    rollups; the range bounds are included when `inclusive`.  `boundaries`
+    optionally restricts the result to the buckets between a pair of
+    boundaries.
+
+    Returns None when no rollup resolution matches `increment` and the
+    alignment of `from_timestamp`, or when the rollups do not cover the
+    range, so callers fall back to the raw samples.
+    """
+    if (not isinstance(increment, datetime.timedelta) or
+            from_timestamp.tzinfo is not None or
+            increment.total_seconds() not in dict(
+                ROLLUP_RESOLUTION_CHOICES) or
+            (from_timestamp - _EPOCH) % increment):
+        return None
+    before, after = 'sample_before__gt', 'sample_after__lt'
+    if inclusive:
+        before, after = 'sample_before__gte', 'sample_after__lte'
+    rows = MeasurementRollup.objects.filter(**{
+        'meter_port_id': meter_port_id,
+        'resolution': int(increment.total_seconds()),
+        'timestamp__gte': from_timestamp,
+        'value__isnull': False,
+        before: from_timestamp - increment,
+        after: to_timestamp + increment,
+    })
+    if boundaries is not None:
+        rows = rows.filter(timestamp__gte=boundaries[0],
+                           timestamp__lte=boundaries[1])
+    rows = list(rows.order_by('timestamp').values_list('timestamp', 'value'))
+    if (len(rows) < 2 or
+            (rows[-1][0] - rows[0][0]) // increment != len(rows) - 1):
+        return None
+    return list(map(condense_pair, pairwise(rows)))
+
+
+def bucket_boundary(from_timestamp, increment, n):
+    """
+    Return boundary `n` of the bucket grid of `condense`.
+    """
+    return from_timestamp + n * increment
+
+
+def bucket_index(from_timestamp, increment, timestamp, round_up=False):
+    """
+    Return the index of the last boundary of the bucket grid at or before
+    `timestamp`, or of the first at or after it when `round_up`; boundaries
+    before `from_timestamp` are not part of the grid.
+    """
+    if isinstance(increment, datetime.timedelta):
+        n, rest = divmod(timestamp - from_timestamp, increment)
+        if round_up and rest:
+            n += 1
+        return max(n, 0)
+    # calendar increments clamp to the end of the month, so count them
+    n = 0
+    while bucket_boundary(from_timestamp, increment, n + 1) <= timestamp:
+        n += 1
+    if round_up and bucket_boundary(from_timestamp, increment, n) < timestamp:
+        n += 1
+    return n
+
+
+def condensed_grid(window, from_timestamp, increment):
+    """
+    Return `(first, count)`, the index of the first boundary and the number
+    of buckets `condense` yields for the samples of measurement queryset
+    `window`, or None when there are no samples.
+    """
+    bounds = window.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+    if bounds['first'] is None:
+        return None
+    first = bucket_index(from_timestamp, increment, bounds['first'],
+                         round_up=True)
+    last = bucket_index(from_timestamp, increment, bounds['last'])
+    return first, last - first
+
+
+def condense_window(window, from_timestamp, increment, first, start, stop,
+                    series=None):
+    """
+    Return `condense` of the samples of measurement queryset `window`
+    sliced to `[start:stop]` of the buckets from boundary `first`, reading
+    only the samples around those buckets.  Given the measurement queryset
+    `series` `window` is a time range of, the samples are corrected for
+    counter resets (see `reset_corrected_samples`).
+    """
+    page_from = bucket_boundary(from_timestamp, increment, first + start)
+    page_to = bucket_boundary(from_timestamp, increment, first + stop)
+    before = window.filter(timestamp__lte=page_from).order_by(
+        '-timestamp').values_list('timestamp', flat=True).first()
+    after = window.filter(timestamp__gte=page_to).order_by(
+        'timestamp').values_list('timestamp', flat=True).first()
+    page = window.filter(timestamp__gte=before or page_from,
+                         timestamp__lte=after or page_to)
+    # calendar increments are only aligned on the grid of `from_timestamp`
+    grid_from = page_from
+    if not isinstance(increment, datetime.timedelta):
+        grid_from = from_timestamp
+    result = None
+    if series is not None:
+        result = condense(reset_corrected_samples(page, series), grid_from,
+                          increment)
+    elif settings.HOMES_CONDENSE_ENGINE == 'sql':
+        result = condense_sql(page, grid_from, page_to, increment)
+    if result is None:
+        result = condense(load_samples(page.order_by('timestamp')),
+                          grid_from, increment)
+    result = itertools.dropwhile(
+        lambda value: value.from_timestamp < page_from, result)
+    return list(itertools.islice(result, stop - start))
+
+
+class CondensedPages(object):
+    """
+    Sequence of `count` condensed values that only computes the slices a
+    paginator takes, by calling `compute(start, stop)`.
+    """
+    def __init__(self, count, compute):
+        self.length = count
+        self.compute = compute
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            return self.compute(start, max(start, stop))[::step]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.compute(index, index + 1)[0]
+
+
 @require_GET
 def condensed(request, pk, increment):
     # Validate the time span
@@ -89,15 +542,92 @@ def condensed(request, pk, increment):
 
     if from_timestamp == to_timestamp:
         raise ParseError('Error: Cannot interpolate over equal timestamps')
+    window = (from_timestamp - increment, to_timestamp + increment)
+    grid = condensed_grid(Measurement.objects.filter(
+        meter_port_id=pk, timestamp__gt=window[0], timestamp__lt=window[1]),
+        from_timestamp, increment)
+    if grid is None or grid[1] <= 0:
+        # no buckets: report why, or pad single samples with dummy values
+        result = cached_result(
+            ('port', pk),
+            ('condensed', from_timestamp, to_timestamp, increment),
+            window, functools.partial(condensed_values, pk, from_timestamp,
+                                      to_timestamp, increment))
+        return paginated_condensed(request, result)
+    check_energy_port(pk)
+
+    def compute(start, stop):
+        return cached_result(
+            ('port', pk),
+            ('condensed', from_timestamp, to_timestamp, increment, start,
+             stop),
+            window, functools.partial(
+                condensed_slice, pk, from_timestamp, to_timestamp, increment,
+                grid[0], start, stop))
+    return paginated_condensed(request, CondensedPages(grid[1], compute))
+
+
+def check_energy_port(pk):
+    meter_port_unit = MeterPort.objects.filter(id=pk)[0].unit
+    if meter_port_unit != MEASUREMENT_UNIT_CHOICES[0][0]:
+        raise ParseError(
+            'Condensed function cannot generate valid output, '
+            'when meter port is not measuring energy. '
+            'Meter port {} is measuring {}'.format(pk, meter_port_unit)
+        )
+
+
+def condensed_slice(pk, from_timestamp, to_timestamp, increment, first,
+                    start, stop):
+    """
+    Return `condensed_values(...)[start:stop]`, where `first` is the index
+    of the first boundary of the bucket grid.
+    """
+    if settings.HOMES_ROLLUPS:
+        boundaries = (
+            bucket_boundary(from_timestamp, increment, first + start),
+            bucket_boundary(from_timestamp, increment, first + stop))
+        result = condensed_from_rollups(pk, from_timestamp, to_timestamp,
+                                        increment, boundaries=boundaries)
+        if result is not None and len(result) == stop - start:
+            return result
+    window = Measurement.objects.filter(
+        meter_port_id=pk,
+        timestamp__gt=(from_timestamp - increment),
+        timestamp__lt=(to_timestamp + increment))
+    return condense_window(window, from_timestamp, increment, first, start,
+                           stop)
+
+
+def condensed_values(pk, from_timestamp, to_timestamp, increment):
+    """
+    Return the condensed values of meter port `pk` from `from_timestamp` to
+    `to_timestamp`, raising `ParseError` when there are none.
+    """
+    if settings.HOMES_ROLLUPS:
+        result = condensed_from_rollups(pk, from_timestamp, to_timestamp,
+                                        increment)
+        if result is not None:
+            return result
+
     # extend from/to range but query on lt/gt rather than lte/gte --- when
     # available data doesn't exactly hit the from/to timestamps, we include
     # some extra to allow interpolation to hit from/to timestamps --- but not
     # quite enaugh to include an extra increment-size period in the output...
-    raw_data = Measurement.objects.filter(
+    measurements = Measurement.objects.filter(
         meter_port_id=pk,
         timestamp__gt=(from_timestamp - increment),
-        timestamp__lt=(to_timestamp + increment)).order_by(
-            'timestamp')
+        timestamp__lt=(to_timestamp + increment))
+    if settings.HOMES_CONDENSE_ENGINE == 'sql' and MeterPort.objects.filter(
+            id=pk, unit=MEASUREMENT_UNIT_CHOICES[0][0]).exists():
+        result = condense_sql(measurements, from_timestamp, to_timestamp,
+                              increment)
+        if result:
+            return result
+
+    raw_data = load_samples(measurements.order_by('timestamp'))
+    if not isinstance(raw_data, SampleArrays):
+        raw_data = list(bounded(raw_data))
 
     if not raw_data:
         if not Measurement.objects.filter(meter_port_id=pk).exists():
@@ -105,40 +635,28 @@ def condensed(request, pk, increment):
         else:
             raise ParseError('No measurements within the time interval')
 
-    meter_port_unit = MeterPort.objects.filter(id=pk)[0].unit
-    if meter_port_unit != MEASUREMENT_UNIT_CHOICES[0][0]:
-        raise ParseError(
-            'Condensed function cannot generate valid output, '
-            'when meter port is not measuring energy. '
-            'Meter port {} is measuring {}'.format(pk, meter_port_unit)
-        )
+    check_energy_port(pk)
 
     result = list(condense(raw_data, from_timestamp, increment))
     if not result:
+        if isinstance(raw_data, SampleArrays):
+            raw_data = raw_data.samples()
+        earliest, latest = raw_data[0].timestamp, raw_data[-1].timestamp
         dummy_values = [
-            Measurement(
-                value=0,
-                timestamp=(raw_data.earliest().timestamp - 2*increment)
-            ),
-            Measurement(
-                value=0,
-                timestamp=(raw_data.earliest().timestamp - increment)
-            ),
-            Measurement(
-                value=0,
-                timestamp=(raw_data.latest().timestamp + increment)
-            ),
-            Measurement(
-                value=0,
-                timestamp=(raw_data.earliest().timestamp + 2*increment)
-            ),
+            Sample(value=0, timestamp=(earliest - 2*increment)),
+            Sample(value=0, timestamp=(earliest - increment)),
+            Sample(value=0, timestamp=(latest + increment)),
+            Sample(value=0, timestamp=(earliest + 2*increment)),
         ]
         raw_data = itertools.chain(raw_data, dummy_values)
         result = list(condense(raw_data, from_timestamp, increment))
         if not result:
             raise ParseError('Condensed function has no valid output '
                              '(only one measurement was available maybe?)')
+    return result
+
 
+def paginated_condensed(request, result):
     paginator = Paginator(result, 20)
     page = request.QUERY_PARAMS.get('page')
     try:
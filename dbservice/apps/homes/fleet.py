@@ -0,0 +1,245 @@
+"""
+Load curves of a fleet of residential homes
+
+DNOs build feeder load curves from the condensed consumption or production
+of many homes.  `load_curve` computes the summed, and optionally per home,
+condensed values of a set of homes in one pass: the time range is split
+into chunks of `HOMES_FLEET_CHUNK_BUCKETS` buckets and the measurements of
+all homes in a chunk are read with one streaming scan.  Every series (the
+mainmeters of a home for consumption, a submeter for production) carries
+the samples after its last condensed boundary over to the next chunk, so
+the values are those of `aggregate_mainmeter_consumption` and
+`aggregate_submeter_measured_production` for every home.
+
+The homes are split over `HOMES_FLEET_PROCESSES` worker processes.
+"""
+import collections
+import datetime
+import itertools
+import multiprocessing
+import operator
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+
+from .aggregated import condensed_options
+from .condensed import (CondensedValue, Sample, bucket_boundary,
+                        bucket_index, condense)
+from .models import Measurement, SubMeter
+from .serializers import LoadCurveSerializer
+from .streaming import stream_rows
+from .utils import (close_connections, get_urlquery_timespan,
+                    get_urlquery_value)
+
+# field of the series of measurements condensed together for each power flow
+SERIES_FIELDS = {
+    'consumption': 'meter_port__mainmeter__residential_home',
+    'production': 'meter_port__submeter',
+}
+
+
+def series_homes(pflow, home_ids):
+    """
+    Return a dictionary mapping the series of power flow `pflow` of the
+    homes `home_ids` to their home.
+    """
+    if pflow == 'consumption':
+        return {home_id: home_id for home_id in home_ids}
+    return dict(SubMeter.objects.filter(
+        residential_home__in=home_ids).values_list(
+            'id', 'residential_home'))
+
+
+def fleet_measurements(pflow, home_ids):
+    """
+    Return the energy measurements of power flow `pflow` of the homes
+    `home_ids`.
+    """
+    measurements = Measurement.objects.filter(
+        meter_port__unit=MEASUREMENT_UNIT_CHOICES[0][0])
+    if pflow == 'consumption':
+        measurements = measurements.filter(
+            meter_port__mainmeter__residential_home__in=home_ids)
+    else:
+        measurements = measurements.filter(**{
+            'meter_port__submeter__residential_home__in': home_ids,
+            ('meter_port__energy_production_period__'
+             'appliance__residential_home'): F(
+                 'meter_port__submeter__residential_home'),
+        })
+    return measurements
+
+
+def time_chunks(from_timestamp, to_timestamp, tau):
+    """
+    Return the `(from, to)` ranges of the chunks of samples read from
+    `from_timestamp - tau` to `to_timestamp + tau`; the last range includes
+    its end.
+    """
+    buckets = settings.HOMES_FLEET_CHUNK_BUCKETS
+    edges = [from_timestamp - tau]
+    n = buckets
+    while bucket_boundary(from_timestamp, tau, n) < to_timestamp + tau:
+        edges.append(bucket_boundary(from_timestamp, tau, n))
+        n += buckets
+    edges.append(to_timestamp + tau)
+    return list(zip(edges, edges[1:]))
+
+
+def condense_carried(raw_data, from_timestamp, tau, condensed_to):
+    """
+    `condense` of the samples `raw_data` for the buckets from `condensed_to`
+    on.  Returns the buckets, the boundary they reach and the samples to
+    carry over to the next chunk.
+    """
+    grid_from = from_timestamp
+    if isinstance(tau, datetime.timedelta):
+        grid_from = bucket_boundary(from_timestamp, tau, bucket_index(
+            from_timestamp, tau, raw_data[0].timestamp))
+    buckets = [
+        value for value in condense(raw_data, grid_from, tau)
+        if condensed_to is None or value.from_timestamp >= condensed_to
+    ]
+    if buckets:
+        condensed_to = buckets[-1].to_timestamp
+    if condensed_to is None:
+        return buckets, condensed_to, raw_data
+    # the boundaries after `condensed_to` interpolate from the last sample
+    # at or before it on
+    carry = len(raw_data) - 1
+    while carry > 0 and raw_data[carry].timestamp > condensed_to:
+        carry -= 1
+    return buckets, condensed_to, raw_data[carry:]
+
+
+def _add(curve, value):
+    key = value.from_timestamp, value.to_timestamp
+    curve[key] = curve.get(key, 0) + value.value
+
+
+def home_load_curves(pflow, home_ids, from_timestamp, to_timestamp, tau,
+                     per_home=False):
+    """
+    Return the summed load curve of the homes `home_ids` and, when
+    `per_home`, the load curve of every home, as dictionaries mapping
+    `(from_timestamp, to_timestamp)` to the condensed value.
+    """
+    series_field = SERIES_FIELDS[pflow]
+    measurements = fleet_measurements(pflow, home_ids)
+    homes_of_series = series_homes(pflow, home_ids)
+    total = {}
+    homes = collections.defaultdict(dict)
+    state = {}
+    chunks = time_chunks(from_timestamp, to_timestamp, tau)
+    for n, (chunk_from, chunk_to) in enumerate(chunks):
+        chunk = measurements.filter(timestamp__gte=chunk_from)
+        if n == len(chunks) - 1:
+            chunk = chunk.filter(timestamp__lte=chunk_to)
+        else:
+            chunk = chunk.filter(timestamp__lt=chunk_to)
+        rows = stream_rows(chunk.order_by(series_field, 'timestamp'),
+                           series_field, 'timestamp', 'value')
+        for series, group in itertools.groupby(
+                rows, key=operator.itemgetter(0)):
+            carried, condensed_to = state.get(series, ([], None))
+            raw_data = carried + [Sample(timestamp, value)
+                                  for _, timestamp, value in group]
+            buckets, condensed_to, carried = condense_carried(
+                raw_data, from_timestamp, tau, condensed_to)
+            state[series] = carried, condensed_to
+            for value in buckets:
+                _add(total, value)
+                if per_home:
+                    _add(homes[homes_of_series[series]], value)
+    return total, dict(homes)
+
+
+def _home_load_curves(args):
+    return home_load_curves(*args)
+
+
+def _values(curve):
+    return [CondensedValue(from_timestamp, to_timestamp, value)
+            for (from_timestamp, to_timestamp), value in sorted(curve.items())]
+
+
+def load_curve(pflow, home_ids, from_timestamp, to_timestamp, tau,
+               per_home=False, processes=None):
+    """
+    Return the summed condensed `pflow` ('consumption' or 'production') of
+    the homes `home_ids` as a list of `CondensedValue`, and a dictionary of
+    the list of every home when `per_home`.
+    """
+    processes = processes or settings.HOMES_FLEET_PROCESSES
+    home_ids = sorted(home_ids)
+    groups = [home_ids[n::processes] for n in range(processes)]
+    args = [(pflow, group, from_timestamp, to_timestamp, tau, per_home)
+            for group in groups if group]
+    connection = connections[Measurement.objects.db]
+    if len(args) > 1 and not connection.in_atomic_block:
+        close_connections()
+        pool = multiprocessing.Pool(len(args))
+        try:
+            results = pool.map(_home_load_curves, args)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [home_load_curves(pflow, home_ids, from_timestamp,
+                                    to_timestamp, tau, per_home)]
+    total = {}
+    homes = {}
+    for group_total, group_homes in results:
+        for key, value in group_total.items():
+            total[key] = total.get(key, 0) + value
+        homes.update(group_homes)
+    if not per_home:
+        return _values(total), None
+    return _values(total), {home: _values(curve)
+                            for home, curve in homes.items()}
+
+
+def response_load_curve(request, homes):
+    """
+    Returns the load curve of the residential homes of queryset `homes`,
+    optionally restricted to the comma separated ids `residential_homes`.
+    """
+    from_timestamp, to_timestamp = get_urlquery_timespan(request)
+    tau = get_urlquery_value(request, 'tau',
+                             parser_options=condensed_options)
+    if tau is None:
+        tau = condensed_options['15min']
+    pflow = get_urlquery_value(
+        request, 'pflow',
+        parser_options={'consumption': 'consumption',
+                        'production': 'production'},
+        default_return='consumption')
+    per_home = request.QUERY_PARAMS.get('per_home') in ('1', 'true')
+    home_ids = request.QUERY_PARAMS.get('residential_homes')
+    if home_ids:
+        try:
+            homes = homes.filter(
+                id__in=[int(home_id) for home_id in home_ids.split(',')])
+        except ValueError:
+            raise ParseError('residential_homes must be a comma separated '
+                             'list of ids')
+    home_ids = list(homes.values_list('id', flat=True))
+    values, curves = load_curve(pflow, home_ids, from_timestamp,
+                                to_timestamp, tau, per_home=per_home)
+    result = {
+        'pflow': pflow,
+        'homes': len(home_ids),
+        'values': values,
+        'per_home': None,
+    }
+    if per_home:
+        result['per_home'] = [
+            {'residential_home': home_id, 'values': curves.get(home_id, [])}
+            for home_id in home_ids
+        ]
+    return Response(LoadCurveSerializer(result).data)
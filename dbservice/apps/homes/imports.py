@@ -0,0 +1,157 @@
+"""
+Loading of measurement files
+
+Meter vendors deliver CSV files, optionally gzip compressed, with a header
+line naming the columns `meter_port`, `timestamp` and `value`; `meter_port`
+is the primary key of the meter port.  Files are streamed and loaded in
+chunks through the bulk ingest path, and every file is checkpointed as an
+`ImportedFile` so it is only loaded again when its size or modification time
+changes.
+"""
+import csv
+import gzip
+import io
+import itertools
+
+from django.conf import settings
+from django.db import transaction
+
+from .ingest import ON_CONFLICT_SKIP, load_measurements, parse_measurements
+from .signals import measurement_ranges, measurements_committed
+from .models import ImportedChunk, ImportedFile, Measurement
+
+CSV_FIELDS = ('meter_port', 'timestamp', 'value')
+
+
+class MeasurementFileError(Exception):
+    pass
+
+
+def text_lines(stream, name, encoding='utf-8'):
+    """
+    Return the lines of binary file object `stream`, decompressing files
+    named `*.gz` on the fly.
+    """
+    if name.endswith('.gz'):
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def split_csv(lines, size):
+    """
+    Split CSV `lines` into chunks of `size` data lines without parsing them.
+
+    Yields `(number, line, fieldnames, chunk)` where `number` counts the
+    chunks from zero and `line` is the line number of the first line in
+    `chunk`.  Fields must not contain line breaks.
+    """
+    lines = iter(lines)
+    header = next(lines, None)
+    if header is None:
+        return
+    fieldnames = [field.strip() for field in next(csv.reader([header]))]
+    missing = set(CSV_FIELDS) - set(fieldnames)
+    if missing:
+        raise MeasurementFileError('Missing columns: {}'.format(
+            ', '.join(sorted(missing))))
+    line = 2
+    for number in itertools.count():
+        chunk = list(itertools.islice(lines, size))
+        if not chunk:
+            return
+        yield number, line, fieldnames, chunk
+        line += len(chunk)
+
+
+def csv_chunks(lines, size):
+    """
+    Yield `(line, items)` for every `size` data rows of CSV `lines`, where
+    `line` is the line number of the first row in `items`.
+    """
+    for number, line, fieldnames, chunk in split_csv(lines, size):
+        yield line, list(csv.DictReader(chunk, fieldnames))
+
+
+def parse_chunk(name, line, items):
+    """
+    Validate the CSV `items` starting at `line` of file `name` and return
+    the measurement rows, raising `MeasurementFileError` on the first
+    invalid row.
+    """
+    rows, errors = parse_measurements(items, None)
+    for offset, row_errors in enumerate(errors):
+        if row_errors:
+            raise MeasurementFileError('{}:{}: {}'.format(
+                name, line + offset, row_errors))
+    return rows
+
+
+def load_csv(lines, name, source, on_conflict=ON_CONFLICT_SKIP,
+             chunk_size=None):
+    """
+    Load the measurements of CSV `lines` chunk by chunk and return the number
+    of rows stored.  Each chunk is loaded in its own transaction.
+    """
+    chunk_size = chunk_size or settings.HOMES_INGEST_CHUNK_SIZE
+    count = 0
+    for line, items in csv_chunks(lines, chunk_size):
+        rows = parse_chunk(name, line, items)
+        count += load_measurements(rows, on_conflict=on_conflict,
+                                   source=source)
+    return count
+
+
+def load_chunk(imported_file_id, number, name, line, fieldnames, chunk,
+               source, on_conflict=ON_CONFLICT_SKIP):
+    """
+    Load chunk `number` of a file split by `split_csv` and record it as an
+    `ImportedChunk` in the same transaction, so a resumed load can skip it.
+    Returns `(rows in chunk, rows stored)`.
+    """
+    rows = parse_chunk(name, line, list(csv.DictReader(chunk, fieldnames)))
+    with transaction.atomic():
+        stored = load_measurements(rows, on_conflict=on_conflict,
+                                   source=source)
+        ImportedChunk.objects.create(imported_file_id=imported_file_id,
+                                     number=number, rows=stored)
+    if rows and not transaction.get_connection().in_atomic_block:
+        measurements_committed.send(sender=Measurement,
+                                    ranges=measurement_ranges(rows),
+                                    using='default')
+    return len(rows), stored
+
+
+def checkpoint(source, name):
+    """
+    Return the `ImportedFile` checkpoint of file `name` from `source`.
+    """
+    imported_file, created = ImportedFile.objects.get_or_create(
+        source=source, name=name)
+    return imported_file
+
+
+def import_file(source, name, size, mtime, open_stream,
+                on_conflict=ON_CONFLICT_SKIP, force=False):
+    """
+    Load file `name` unless its checkpoint shows it was already loaded at
+    `size` and `mtime`.  `open_stream` is a context manager factory for a
+    binary file object of the file.
+
+    Returns the number of rows stored, or None when the file was skipped.
+    Files that fail halfway are loaded again on the next run; the default
+    `skip` conflict handling makes that idempotent.
+    """
+    imported_file = checkpoint(source, name)
+    if not force and imported_file.is_current(size, mtime):
+        return None
+    imported_file.completed = False
+    imported_file.save()
+    with open_stream() as stream:
+        rows = load_csv(text_lines(stream, name), name, source,
+                        on_conflict=on_conflict)
+    imported_file.size = size
+    imported_file.mtime = mtime
+    imported_file.rows = rows
+    imported_file.completed = True
+    imported_file.save()
+    return rows
@@ -0,0 +1,86 @@
+"""
+Physical index layout of the measurement table
+
+Every hot query filters on meter port and orders by timestamp, so the table is
+served by one unique index on `(meter_port_id, timestamp)` that also carries
+`value` (PostgreSQL `INCLUDE`), letting condense and aggregate scans run as
+index-only scans.  Queries on timestamp alone use either a B-tree or, for
+append-only data, a much smaller BRIN index.
+"""
+from . import partitions
+
+MEASUREMENT_TABLE = partitions.MEASUREMENT_TABLE
+COVERING_INDEX = '{}_meter_port_id_timestamp_uniq'.format(MEASUREMENT_TABLE)
+TIMESTAMP_INDEX = '{}_timestamp_idx'.format(MEASUREMENT_TABLE)
+TIMESTAMP_INDEX_METHODS = ('btree', 'brin')
+
+
+def create_covering_index(cursor):
+    """
+    Replace the unique constraint on `(meter_port_id, timestamp)` with a
+    unique index that includes `value`.
+    """
+    cursor.execute(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'u'",
+        [MEASUREMENT_TABLE])
+    for name, in cursor.fetchall():
+        cursor.execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+            MEASUREMENT_TABLE, name))
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS {} '
+        'ON {} (meter_port_id, timestamp) INCLUDE (value)'.format(
+            COVERING_INDEX, MEASUREMENT_TABLE))
+
+
+def timestamp_index_method(cursor):
+    """
+    Return the access method of the timestamp index, or None when missing.
+    """
+    cursor.execute(
+        'SELECT pg_am.amname FROM pg_class '
+        'JOIN pg_am ON pg_am.oid = pg_class.relam '
+        'WHERE pg_class.relname = %s', [TIMESTAMP_INDEX])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_timestamp_index(cursor, method='btree', vendor='postgresql'):
+    """
+    (Re)create the timestamp index with access `method`.
+    """
+    if vendor != 'postgresql':
+        cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {} (timestamp)'
+                       .format(TIMESTAMP_INDEX, MEASUREMENT_TABLE))
+        return
+    if method not in TIMESTAMP_INDEX_METHODS:
+        raise ValueError('Unknown index method {!r}'.format(method))
+    if timestamp_index_method(cursor) == method:
+        return
+    cursor.execute('DROP INDEX IF EXISTS {}'.format(TIMESTAMP_INDEX))
+    cursor.execute('CREATE INDEX {} ON {} USING {} (timestamp)'.format(
+        TIMESTAMP_INDEX, MEASUREMENT_TABLE, method))
+
+
+def covering_index_of(cursor, table):
+    """
+    Return the name of the covering index on `table`, which is either the
+    measurement table or one of its partitions.
+    """
+    cursor.execute(
+        'SELECT index.relname FROM pg_index '
+        'JOIN pg_class index ON index.oid = pg_index.indexrelid '
+        'WHERE pg_index.indrelid = %s::regclass '
+        'AND pg_index.indisunique AND NOT pg_index.indisprimary',
+        [table])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def cluster(cursor, table):
+    """
+    Physically reorder `table` by meter port and timestamp.
+    """
+    cursor.execute('CLUSTER {} USING {}'.format(
+        table, covering_index_of(cursor, table)))
+    cursor.execute('ANALYZE {}'.format(table))
@@ -0,0 +1,370 @@
+"""
+Bulk ingest of measurements
+
+The generic `BulkCreateModelMixin` runs the full serializer and saves every
+object on its own.  For measurement batches posted by gateways we validate the
+batch as a whole instead --- one query resolves every referenced meter port
+--- and load the rows with PostgreSQL `COPY` (chunked `bulk_create` on other
+backends).
+
+Every load is recorded as an `IngestBatch`.  With
+`HOMES_MEASUREMENT_AUDIT_TIMESTAMPS` off, the rows themselves carry no
+created/last modified timestamps and the batch is their only provenance.
+"""
+import io
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.fields import DateTimeField
+
+from .models import IngestBatch, Measurement, MeterPort
+from .signals import (measurement_ranges, measurements_committed,
+                      measurements_stored)
+
+ON_CONFLICT_SKIP = 'skip'
+ON_CONFLICT_OVERWRITE = 'overwrite'
+ON_CONFLICT_REJECT = 'reject'
+ON_CONFLICT_CHOICES = (ON_CONFLICT_SKIP, ON_CONFLICT_OVERWRITE,
+                       ON_CONFLICT_REJECT)
+
+MeasurementRow = namedtuple(
+    'MeasurementRow', ['meter_port_id', 'timestamp', 'value'])
+
+METER_PORT_VIEW_NAME = 'homes-v1-meterport-detail'
+
+_timestamp_field = DateTimeField()
+
+
+class MeasurementConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Measurement already stored.'
+
+
+def owned_meter_ports(user):
+    """
+    Return the meter ports `user` may store measurements on; every meter
+    port without a user (management commands).
+    """
+    meter_ports = MeterPort.objects.all()
+    if user is None or user.is_superuser:
+        return meter_ports
+    return meter_ports.filter(
+        Q(mainmeter__residential_home__dno_customer_id=user) |
+        Q(submeter__residential_home__dno_customer_id=user)
+    )
+
+
+def _meter_port_pk(value):
+    """
+    Extract the meter port primary key from either a plain primary key or a
+    hyperlink to the meter port detail view.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        try:
+            match = resolve(urlparse(value).path)
+        except Resolver404:
+            raise ValidationError('Invalid hyperlink - No URL match')
+        if match.view_name != METER_PORT_VIEW_NAME:
+            raise ValidationError(
+                'Invalid hyperlink - Incorrect URL match')
+        return int(match.kwargs['pk'])
+    raise ValidationError(
+        'Incorrect type.  Expected url or pk, received {}.'.format(
+            type(value).__name__))
+
+
+def parse_measurements(data, user):
+    """
+    Validate a batch of measurements posted as a list of objects with
+    `meter_port`, `timestamp` and `value`.
+
+    Returns `(rows, errors)`, where `errors` is empty when the batch is valid
+    and otherwise holds one dict of field errors per input object, like the
+    errors of a `many=True` serializer.
+    """
+    if not isinstance(data, list):
+        return [], [{'non_field_errors': ['Expected a list of items.']}]
+
+    meter_port_pks = {}
+    rows = []
+    errors = []
+    for item in data:
+        row_errors = {}
+        meter_port_id = timestamp = value = None
+        if not isinstance(item, dict):
+            errors.append({'non_field_errors': ['Invalid data']})
+            rows.append(None)
+            continue
+        try:
+            raw = item['meter_port']
+            key = (type(raw), raw)
+            if key not in meter_port_pks:
+                meter_port_pks[key] = _meter_port_pk(raw)
+            meter_port_id = meter_port_pks[key]
+        except KeyError:
+            row_errors['meter_port'] = ['This field is required.']
+        except (TypeError, ValueError, ValidationError) as e:
+            row_errors['meter_port'] = getattr(e, 'messages', [str(e)])
+        try:
+            timestamp = _timestamp_field.from_native(item['timestamp'])
+            if timestamp is None:
+                raise KeyError('timestamp')
+        except KeyError:
+            row_errors['timestamp'] = ['This field is required.']
+        except ValidationError as e:
+            row_errors['timestamp'] = e.messages
+        try:
+            value = int(item['value'])
+        except KeyError:
+            row_errors['value'] = ['This field is required.']
+        except (TypeError, ValueError):
+            row_errors['value'] = ['Enter a whole number.']
+        errors.append(row_errors)
+        rows.append(MeasurementRow(meter_port_id, timestamp, value))
+
+    referenced = {row.meter_port_id for row in rows
+                  if row is not None and row.meter_port_id is not None}
+    known = set(owned_meter_ports(user).filter(
+        id__in=referenced).values_list('id', flat=True))
+    for row, row_errors in zip(rows, errors):
+        if row is None or row.meter_port_id is None:
+            continue
+        if row.meter_port_id not in known:
+            row_errors['meter_port'] = [
+                "Invalid pk '{}' - object does not exist.".format(
+                    row.meter_port_id)]
+
+    if any(errors):
+        return [], errors
+    return rows, []
+
+
+def _audit_timestamp():
+    """
+    Return the created/last modified timestamp to store on new rows, or None
+    for lean rows.
+    """
+    if settings.HOMES_MEASUREMENT_AUDIT_TIMESTAMPS:
+        return timezone.now()
+    return None
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _copy_rows(cursor, sql, lines):
+    buf = io.StringIO()
+    buf.writelines(lines)
+    buf.seek(0)
+    cursor.copy_expert(sql, buf)
+
+
+def _copy_measurements(rows, connection):
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+    sql = (
+        'COPY {} (meter_port_id, timestamp, value, created, last_modified) '
+        'FROM STDIN'
+    ).format(table)
+    now = _audit_timestamp()
+    now = now.isoformat() if now else '\\N'
+    with connection.cursor() as cursor:
+        for chunk in _chunks(rows, settings.HOMES_INGEST_CHUNK_SIZE):
+            _copy_rows(cursor, sql, (
+                '{}\t{}\t{}\t{}\t{}\n'.format(
+                    row.meter_port_id, row.timestamp.isoformat(), row.value,
+                    now, now)
+                for row in chunk
+            ))
+    return len(rows)
+
+
+def _upsert_measurements(rows, connection, on_conflict):
+    """
+    COPY `rows` into a temporary table and merge them into the measurement
+    table with `INSERT ... ON CONFLICT`.  Duplicates within the batch are
+    collapsed first; the first row wins when skipping and the last row wins
+    when overwriting.
+    """
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+    if on_conflict == ON_CONFLICT_SKIP:
+        ordinal_order, conflict_action = 'ASC', 'DO NOTHING'
+    else:
+        ordinal_order, conflict_action = 'DESC', (
+            'DO UPDATE SET value = EXCLUDED.value, '
+            'last_modified = EXCLUDED.last_modified')
+    # the staging columns take the types of the measurement columns, so the
+    # timestamps are interpreted on COPY as they are on the table itself
+    columns = ', '.join(
+        '{} {}'.format(name, Measurement._meta.get_field(name).db_type(
+            connection))
+        for name in ('timestamp', 'value'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE homes_measurement_ingest ('
+            'ordinal integer, meter_port_id integer, {})'.format(columns))
+        copy_sql = (
+            'COPY homes_measurement_ingest '
+            '(ordinal, meter_port_id, timestamp, value) FROM STDIN')
+        for offset, chunk in enumerate(
+                _chunks(rows, settings.HOMES_INGEST_CHUNK_SIZE)):
+            offset *= settings.HOMES_INGEST_CHUNK_SIZE
+            _copy_rows(cursor, copy_sql, (
+                '{}\t{}\t{}\t{}\n'.format(
+                    offset + n, row.meter_port_id, row.timestamp.isoformat(),
+                    row.value)
+                for n, row in enumerate(chunk)
+            ))
+        cursor.execute(
+            'INSERT INTO {table} '
+            '(meter_port_id, timestamp, value, created, last_modified) '
+            'SELECT DISTINCT ON (meter_port_id, timestamp) '
+            'meter_port_id, timestamp, value, %s, %s '
+            'FROM homes_measurement_ingest '
+            'ORDER BY meter_port_id, timestamp, ordinal {ordinal_order} '
+            'ON CONFLICT (meter_port_id, timestamp) {conflict_action}'.format(
+                table=table, ordinal_order=ordinal_order,
+                conflict_action=conflict_action),
+            [_audit_timestamp()] * 2)
+        count = cursor.rowcount
+        cursor.execute('DROP TABLE homes_measurement_ingest')
+    return count
+
+
+# rows per UPDATE of `_overwrite_measurements`, three parameters each within
+# the 999 parameters SQLite accepts
+OVERWRITE_CHUNK_SIZE = 300
+
+
+def _overwrite_measurements(values, now, using):
+    """
+    Set the values of the stored measurements of `values`, a dictionary
+    mapping their ids to the new value, with one UPDATE per
+    `OVERWRITE_CHUNK_SIZE` rows.  Returns the number of rows.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    items = sorted(values.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), OVERWRITE_CHUNK_SIZE):
+            chunk = items[start:start + OVERWRITE_CHUNK_SIZE]
+            cursor.execute(
+                'UPDATE {table} SET {value} = CASE {id} {cases} END, '
+                '{last_modified} = %s WHERE {id} IN ({ids})'.format(
+                    table=quote_name(Measurement._meta.db_table),
+                    value=quote_name('value'),
+                    last_modified=quote_name('last_modified'),
+                    id=quote_name('id'),
+                    cases=' '.join(['WHEN %s THEN %s'] * len(chunk)),
+                    ids=', '.join(['%s'] * len(chunk))),
+                [param for item in chunk for param in item] + [now] +
+                [pk for pk, _ in chunk])
+    return len(items)
+
+
+def _bulk_create_measurements(rows, using, on_conflict):
+    measurements = Measurement.objects.using(using)
+    now = _audit_timestamp()
+    overwritten = 0
+    if rows and on_conflict != ON_CONFLICT_REJECT:
+        # collapse duplicates within the batch like `_upsert_measurements`
+        unique = OrderedDict()
+        for row in rows:
+            key = (row.meter_port_id, row.timestamp)
+            if on_conflict == ON_CONFLICT_OVERWRITE or key not in unique:
+                unique[key] = row
+        stored = measurements.filter(
+            meter_port_id__in={row.meter_port_id for row in rows},
+            timestamp__gte=min(row.timestamp for row in rows),
+            timestamp__lte=max(row.timestamp for row in rows),
+        ).values_list('meter_port_id', 'timestamp', 'id')
+        existing = {(meter_port_id, timestamp): pk
+                    for meter_port_id, timestamp, pk in stored}
+        rows = [row for key, row in unique.items() if key not in existing]
+        if on_conflict == ON_CONFLICT_OVERWRITE:
+            overwritten = _overwrite_measurements(
+                {pk: unique[key].value for key, pk in existing.items()
+                 if key in unique}, now, using)
+    objs = [Measurement(meter_port_id=row.meter_port_id,
+                        timestamp=row.timestamp,
+                        value=row.value,
+                        created=now,
+                        last_modified=now)
+            for row in rows]
+    # the backend may limit the rows of one INSERT (SQLite to about 500)
+    batch_size = min(settings.HOMES_INGEST_CHUNK_SIZE,
+                     connections[using].ops.bulk_batch_size(
+                         Measurement._meta.concrete_fields, objs) or
+                     settings.HOMES_INGEST_CHUNK_SIZE)
+    measurements.bulk_create(objs, batch_size=batch_size)
+    return len(rows) + overwritten
+
+
+def _record_batch(rows, count, user, source, using):
+    batch = IngestBatch.objects.using(using).create(
+        user=user,
+        source=source,
+        from_timestamp=min(row.timestamp for row in rows),
+        to_timestamp=max(row.timestamp for row in rows),
+        rows=count,
+    )
+    batch.meter_ports.add(*{row.meter_port_id for row in rows})
+    return batch
+
+
+def load_measurements(rows, on_conflict=None, using='default', user=None,
+                      source='api'):
+    """
+    Store validated `rows` in a single transaction and return the number of
+    rows stored or overwritten.  The load is recorded as an `IngestBatch` by
+    `user` from `source` (see `INGEST_SOURCE_CHOICES`).
+
+    `on_conflict` decides what happens to rows for a meter port and timestamp
+    that is already stored: they are skipped, they overwrite the stored value
+    or the whole batch is rejected with `MeasurementConflict`.  It defaults to
+    `HOMES_INGEST_ON_CONFLICT`.
+
+    `measurements_stored` is sent before the transaction commits, so data
+    derived from the measurements is stored together with them, and
+    `measurements_committed` after it commits.  Within a transaction of the
+    caller the caller sends `measurements_committed`.
+    """
+    on_conflict = on_conflict or settings.HOMES_INGEST_ON_CONFLICT
+    if on_conflict not in ON_CONFLICT_CHOICES:
+        raise ValueError('Unknown on_conflict {!r}'.format(on_conflict))
+    connection = connections[using]
+    outermost = not connection.in_atomic_block
+    try:
+        with transaction.atomic(using=using):
+            if connection.vendor != 'postgresql':
+                count = _bulk_create_measurements(rows, using, on_conflict)
+            elif on_conflict == ON_CONFLICT_REJECT:
+                count = _copy_measurements(rows, connection)
+            else:
+                count = _upsert_measurements(rows, connection, on_conflict)
+            if rows:
+                _record_batch(rows, count, user, source, using)
+                measurements_stored.send(
+                    sender=Measurement, ranges=measurement_ranges(rows),
+                    using=using)
+    except IntegrityError as e:
+        raise MeasurementConflict(
+            'Measurements already stored for a meter port and timestamp in '
+            'the batch: {}'.format(e))
+    if rows and outermost:
+        measurements_committed.send(
+            sender=Measurement, ranges=measurement_ranges(rows), using=using)
+    return count
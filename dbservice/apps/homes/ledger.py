@@ -0,0 +1,219 @@
+"""
+Daily energy ledger of residential homes
+
+An `EnergyLedger` row holds the consumption of the mainmeters and the summed
+production of the production submeters of a home on a calendar day: the
+daily `condense` of their accumulated values, corrected for counter resets
+(see `corrected_samples`), so a meter reset does not turn a day negative.
+Days not covered by measurements are NULL.
+
+With `HOMES_ENERGY_LEDGER` enabled the days touched by an ingest are
+recomputed in the ingest transaction and `manage.py repair_energy_ledger`
+recomputes recent days nightly.  With `HOMES_COUNTER_RESETS` enabled as
+well, `aggregated()` corrects the measurements alike and answers whole day
+increments aligned to midnight from the ledger (see `ledger_condensed`).
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+
+from .condensed import (CondensedValue, Sample, bucket_boundary, condense,
+                        corrected_samples, samples)
+from .models import EnergyLedger, Measurement, MeterPort
+
+DAY = datetime.timedelta(days=1)
+
+
+def floor_day(timestamp):
+    """
+    Return midnight of the day of `timestamp`.
+    """
+    return datetime.datetime.combine(timestamp.date(), datetime.time())
+
+
+def consumption_measurements(home_id, using='default'):
+    """Return the energy measurements of the mainmeters of `home_id`."""
+    return Measurement.objects.using(using).filter(
+        meter_port__mainmeter__residential_home=home_id,
+        meter_port__unit=MEASUREMENT_UNIT_CHOICES[0][0],
+    )
+
+
+def production_measurements(home_id, using='default'):
+    """
+    Return the energy measurements of the production submeters of
+    `home_id`, one queryset per submeter.
+    """
+    energy_unit = MEASUREMENT_UNIT_CHOICES[0][0]
+    submeters = MeterPort.objects.using(using).filter(**{
+        'submeter__residential_home': home_id,
+        'energy_production_period__appliance__residential_home': home_id,
+        'unit': energy_unit,
+    }).values_list('submeter', flat=True).distinct()
+    return [
+        Measurement.objects.using(using).filter(**{
+            'meter_port__submeter': submeter,
+            ('meter_port__energy_production_period__'
+             'appliance__residential_home'): home_id,
+            'meter_port__unit': energy_unit,
+        })
+        for submeter in submeters
+    ]
+
+
+def _affected_range(measurements, from_timestamp, to_timestamp):
+    # reset detection looks one sample ahead, so the samples up to two
+    # before the range interpolate from the samples within it
+    previous = list(measurements.filter(
+        timestamp__lt=from_timestamp).order_by('-timestamp').values_list(
+            'timestamp', flat=True)[:2])
+    following = measurements.filter(timestamp__gt=to_timestamp).order_by(
+        'timestamp').values_list('timestamp', flat=True).first()
+    return (previous[-1] if previous else from_timestamp,
+            following or to_timestamp)
+
+
+def daily_values(measurements, from_day, to_day):
+    """
+    Return a dictionary mapping the dates from `from_day` to `to_day` covered
+    by `measurements` to the reset corrected daily value.
+    """
+    end = to_day + DAY
+    raw_data = samples(measurements.filter(
+        timestamp__gte=from_day, timestamp__lt=end).order_by('timestamp'))
+    before = measurements.filter(timestamp__lt=from_day).order_by(
+        '-timestamp').values_list('timestamp', 'value').first()
+    after = measurements.filter(timestamp__gte=end).order_by(
+        'timestamp').values_list('timestamp', 'value')[:2]
+    if before is not None:
+        raw_data.insert(0, Sample(*before))
+    raw_data.extend(Sample(*sample) for sample in after)
+    return {
+        value.from_timestamp.date(): value.value
+        for value in condense(corrected_samples(raw_data), from_day, DAY)
+        if value.from_timestamp <= to_day
+    }
+
+
+def update_ledger(home_id, from_timestamp, to_timestamp, using='default'):
+    """
+    Recompute the ledger days of home `home_id` affected by measurements
+    between `from_timestamp` and `to_timestamp` (inclusive).
+    """
+    consumption = consumption_measurements(home_id, using=using)
+    production = production_measurements(home_id, using=using)
+    low, high = from_timestamp, to_timestamp
+    for measurements in [consumption] + production:
+        series_low, series_high = _affected_range(
+            measurements, from_timestamp, to_timestamp)
+        low, high = min(low, series_low), max(high, series_high)
+    # days with a boundary within the affected range
+    from_day, to_day = floor_day(low) - DAY, floor_day(high)
+
+    days = {}
+    for date, value in daily_values(consumption, from_day, to_day).items():
+        days[date] = [value, None]
+    for measurements in production:
+        for date, value in daily_values(measurements, from_day,
+                                        to_day).items():
+            day = days.setdefault(date, [None, None])
+            day[1] = (day[1] or 0) + value
+    with transaction.atomic(using=using):
+        EnergyLedger.objects.using(using).filter(
+            residential_home=home_id, date__gte=from_day.date(),
+            date__lte=to_day.date()).delete()
+        EnergyLedger.objects.using(using).bulk_create([
+            EnergyLedger(residential_home_id=home_id, date=date,
+                         consumption=consumed, production=produced)
+            for date, (consumed, produced) in sorted(days.items())
+        ])
+
+
+def update_ledger_ranges(ranges, using='default'):
+    """
+    Recompute the ledger days of the homes of the energy meter ports of
+    `ranges`, as sent with `measurements_stored`.
+    """
+    homes = {}
+    meter_ports = MeterPort.objects.using(using).filter(
+        id__in=list(ranges), unit=MEASUREMENT_UNIT_CHOICES[0][0],
+    ).values_list('id', 'mainmeter__residential_home',
+                  'submeter__residential_home')
+    for meter_port_id, mainmeter_home_id, submeter_home_id in meter_ports:
+        from_timestamp, to_timestamp = ranges[meter_port_id]
+        for home_id in {mainmeter_home_id, submeter_home_id} - {None}:
+            low, high = homes.get(home_id, (from_timestamp, to_timestamp))
+            homes[home_id] = (min(low, from_timestamp),
+                              max(high, to_timestamp))
+    for home_id, (from_timestamp, to_timestamp) in sorted(homes.items()):
+        update_ledger(home_id, from_timestamp, to_timestamp, using=using)
+
+
+def rebuild_ledger(home_id, window=datetime.timedelta(days=30),
+                   using='default'):
+    """
+    Replace the ledger of home `home_id`, computing `window` of
+    measurements at a time.  Returns the number of windows computed.
+    """
+    EnergyLedger.objects.using(using).filter(
+        residential_home=home_id).delete()
+    first = last = None
+    for measurements in ([consumption_measurements(home_id, using=using)] +
+                         production_measurements(home_id, using=using)):
+        timestamps = measurements.order_by('timestamp').values_list(
+            'timestamp', flat=True)
+        series_first = timestamps.first()
+        if series_first is None:
+            continue
+        series_last = timestamps.reverse().first()
+        first = min(first or series_first, series_first)
+        last = max(last or series_last, series_last)
+    windows = 0
+    while first is not None and first <= last:
+        update_ledger(home_id, first, first + window, using=using)
+        first += window
+        windows += 1
+    return windows
+
+
+def ledger_condensed(home_id, pflow, from_timestamp, to_timestamp, tau):
+    """
+    `aggregate_mainmeter_consumption` or
+    `aggregate_submeter_measured_production` of `home_id` for power flow
+    `pflow` read from the ledger, with reset corrected values.
+
+    Returns None unless the ledger and the reset correction of the
+    measurements are enabled, `from_timestamp` is midnight and every bucket
+    boundary falls on midnight, so callers fall back to the measurements.
+    Buckets with days not covered by measurements are left out, as
+    `condense` leaves them out.
+    """
+    if not (settings.HOMES_ENERGY_LEDGER and settings.HOMES_COUNTER_RESETS and
+            tau and from_timestamp):
+        return None
+    # the buckets ending before `to_timestamp + tau`, where the measurements
+    # read by the aggregation end
+    boundaries = [from_timestamp]
+    while bucket_boundary(from_timestamp, tau,
+                          len(boundaries)) < to_timestamp + tau:
+        boundaries.append(bucket_boundary(from_timestamp, tau,
+                                          len(boundaries)))
+    if any(boundary != floor_day(boundary) for boundary in boundaries):
+        return None
+    values = dict(EnergyLedger.objects.filter(
+        residential_home=home_id,
+        date__gte=boundaries[0].date(),
+        date__lt=boundaries[-1].date(),
+    ).exclude(**{pflow: None}).values_list('date', pflow))
+    result = []
+    for bucket_from, bucket_to in zip(boundaries, boundaries[1:]):
+        days = [(bucket_from + n * DAY).date()
+                for n in range((bucket_to - bucket_from).days)]
+        if all(day in values for day in days):
+            result.append(CondensedValue(
+                from_timestamp=bucket_from, to_timestamp=bucket_to,
+                value=sum(values[day] for day in days)))
+    return result
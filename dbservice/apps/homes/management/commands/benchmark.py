@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbservice.apps.homes.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    args = '<benchmark benchmark ...>'
+    help = 'Run benchmarks of the measurement paths: {}'.format(
+        ', '.join(BENCHMARKS))
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', type='int', default=10000,
+                    help='Number of measurements to benchmark with'),
+    )
+
+    def handle(self, *args, **options):
+        unknown = set(args) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError('Unknown benchmark(s): {}'.format(
+                ', '.join(sorted(unknown))))
+        for name in args or BENCHMARKS:
+            self.stdout.write('== {} =='.format(name))
+            BENCHMARKS[name](self.stdout, **options)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from dbservice.apps.homes.models import Measurement
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete measurements duplicating the meter port and timestamp of an '
+        'earlier stored measurement.  Rows are processed in id ranges, each '
+        'in its own short transaction, so the table is never locked for long.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=50000,
+                    help='Number of ids to examine per transaction'),
+        make_option('--sleep', type='float', default=0.0,
+                    help='Seconds to pause between batches'),
+    )
+
+    def handle(self, *args, **options):
+        table = connection.ops.quote_name(Measurement._meta.db_table)
+        sql = (
+            'DELETE FROM {table} WHERE id >= %s AND id < %s AND EXISTS ('
+            'SELECT 1 FROM {table} earlier '
+            'WHERE earlier.meter_port_id = {table}.meter_port_id '
+            'AND earlier.timestamp = {table}.timestamp '
+            'AND earlier.id < {table}.id)'
+        ).format(table=table)
+        bounds = Measurement.objects.aggregate(
+            first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            return
+        batch_size = options['batch_size']
+        deleted = 0
+        for low in range(bounds['first'], bounds['last'] + 1, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [low, low + batch_size])
+                deleted += cursor.rowcount
+            if int(options['verbosity']) > 1:
+                self.stdout.write('ids {}-{}: {} duplicates deleted'.format(
+                    low, low + batch_size - 1, deleted))
+            time.sleep(options['sleep'])
+        self.stdout.write('Deleted {} duplicate measurements'.format(deleted))
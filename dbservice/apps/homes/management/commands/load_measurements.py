@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import collections
+import datetime
+import multiprocessing
+import os
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from dbservice.apps.homes.imports import (MeasurementFileError, checkpoint,
+                                          load_chunk, split_csv, text_lines)
+from dbservice.apps.homes.ingest import ON_CONFLICT_CHOICES, ON_CONFLICT_SKIP
+from dbservice.apps.homes.utils import close_connections
+
+SOURCE = 'csv'
+
+
+def _load_chunk(args):
+    return load_chunk(*args)
+
+
+class Command(BaseCommand):
+    args = '<file file ...>'
+    help = (
+        'Backfill measurements from CSV files (see '
+        '`dbservice.apps.homes.imports`), optionally gzip compressed.  Files '
+        'are split into chunks that are validated and bulk loaded by a pool '
+        'of worker processes.  Every stored chunk is checkpointed, so an '
+        'interrupted load resumes where it stopped when run again.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of worker processes'),
+        make_option('--chunk-size', type='int',
+                    default=settings.HOMES_INGEST_CHUNK_SIZE * 5,
+                    help='Number of CSV lines per chunk'),
+        make_option('--on-conflict', choices=ON_CONFLICT_CHOICES,
+                    default=ON_CONFLICT_SKIP,
+                    help='Handling of measurements already stored'),
+        make_option('--force', action='store_true', default=False,
+                    help='Load files again even when already loaded'),
+    )
+
+    def handle(self, *paths, **options):
+        if not paths:
+            raise CommandError('No files given')
+        self.options = options
+        self.verbosity = int(options['verbosity'])
+        workers = options['workers']
+        pool = None
+        if workers > 1:
+            close_connections()
+            pool = multiprocessing.Pool(workers)
+        started = time.time()
+        total = 0
+        try:
+            for path in paths:
+                total += self.load_file(path, pool)
+        except MeasurementFileError as e:
+            raise CommandError(e)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self.report('Total', total, time.time() - started)
+
+    def report(self, label, rows, elapsed):
+        self.stdout.write('{}: {} rows in {:.1f} s ({:.0f} rows/s)'.format(
+            label, rows, elapsed, rows / elapsed if elapsed else 0))
+
+    def load_file(self, path, pool):
+        """
+        Load the chunks of `path` not stored by an earlier run and return the
+        number of rows stored.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        mtime = datetime.datetime.utcfromtimestamp(int(stat.st_mtime))
+        imported_file = checkpoint(SOURCE, path)
+        if not self.options['force'] and imported_file.is_current(
+                stat.st_size, mtime):
+            self.stdout.write('{}: already loaded'.format(path))
+            return 0
+        chunk_size = self.options['chunk_size']
+        if (self.options['force'] or
+                (imported_file.size, imported_file.mtime,
+                 imported_file.chunk_size) !=
+                (stat.st_size, mtime, chunk_size)):
+            # chunk numbers only carry over to an unchanged file split into
+            # chunks of the same size
+            imported_file.chunks.all().delete()
+            imported_file.size = stat.st_size
+            imported_file.mtime = mtime
+            imported_file.chunk_size = chunk_size
+        imported_file.completed = False
+        imported_file.save()
+        done = set(imported_file.chunks.values_list('number', flat=True))
+        if done:
+            self.stdout.write('{}: resuming after {} chunks'.format(
+                path, len(done)))
+
+        started = time.time()
+        rows = 0
+        pending = collections.deque()
+        # bound the chunks in flight, so memory use does not depend on the
+        # size of the file
+        max_pending = 2 * self.options['workers']
+        with open(path, 'rb') as stream:
+            chunks = split_csv(text_lines(stream, path), chunk_size)
+            for number, line, fieldnames, chunk in chunks:
+                if number in done:
+                    continue
+                args = (imported_file.id, number, path, line, fieldnames,
+                        chunk, SOURCE, self.options['on_conflict'])
+                if pool is None:
+                    rows += load_chunk(*args)[1]
+                    continue
+                pending.append(pool.apply_async(_load_chunk, (args,)))
+                while len(pending) >= max_pending:
+                    rows += pending.popleft().get()[1]
+                    if self.verbosity > 1:
+                        self.report(path, rows, time.time() - started)
+            while pending:
+                rows += pending.popleft().get()[1]
+
+        imported_file.rows = imported_file.chunks.aggregate(
+            stored=Sum('rows'))['stored'] or 0
+        imported_file.completed = True
+        imported_file.save()
+        self.report(path, rows, time.time() - started)
+        return rows
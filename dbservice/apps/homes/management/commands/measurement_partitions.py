@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import datetime
+from optparse import make_option
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dbservice.apps.homes import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly measurement partitions for the coming months and '
+        'detach (or drop) partitions older than the retention period.  Meant '
+        'to run from cron, e.g. daily.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--ahead', type='int',
+                    default=settings.HOMES_MEASUREMENT_PARTITIONS_AHEAD,
+                    help='Number of future months to create partitions for'),
+        make_option('--retain', type='int',
+                    default=settings.HOMES_MEASUREMENT_RETENTION_MONTHS,
+                    help='Number of past months to keep attached'),
+        make_option('--drop', action='store_true', default=False,
+                    help='Drop partitions instead of detaching them'),
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL')
+        this_month = partitions.month_start(datetime.datetime.utcnow())
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError('The measurement table is not partitioned')
+            existing = set(partitions.monthly_partitions(cursor))
+            last = this_month + relativedelta(months=options['ahead'])
+            for month in partitions.months(this_month, last):
+                name = partitions.partition_name(month)
+                if name not in existing:
+                    partitions.create_partition(cursor, month)
+                    self.stdout.write('Created {}'.format(name))
+
+            if options['retain'] is None:
+                return
+            oldest = this_month - relativedelta(months=options['retain'])
+            for name in sorted(existing):
+                if partitions.partition_month(name) >= oldest:
+                    break
+                partitions.detach_partition(cursor, name, options['drop'])
+                self.stdout.write('{} {}'.format(
+                    'Dropped' if options['drop'] else 'Detached', name))
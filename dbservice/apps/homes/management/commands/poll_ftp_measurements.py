@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import fnmatch
+import functools
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dbservice.apps.homes.imports import MeasurementFileError, import_file
+from dbservice.apps.homes.ingest import ON_CONFLICT_CHOICES, ON_CONFLICT_SKIP
+from dbservice.apps.utils.ftpclient import (ftpconnection, listdir,
+                                            retrbinary_stream)
+
+SOURCE = 'ftp'
+
+
+class Command(BaseCommand):
+    args = '<directory>'
+    help = (
+        'Load new and changed measurement CSV files (see '
+        '`dbservice.apps.homes.imports`) from a directory on the meter '
+        'vendor FTP server.  Files already loaded at the same size and '
+        'modification time are skipped; files are streamed and loaded in '
+        'parallel, each over its own FTP connection.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--host', default=settings.HOMES_FTP_HOST,
+                    help='FTP server'),
+        make_option('--user', default=settings.HOMES_FTP_USER,
+                    help='FTP user'),
+        make_option('--password', default=settings.HOMES_FTP_PASSWORD,
+                    help='FTP password'),
+        make_option('--pattern', default='*.csv*',
+                    help='Shell pattern of the file names to load'),
+        make_option('--workers', type='int', default=4,
+                    help='Number of files loaded in parallel'),
+        make_option('--on-conflict', choices=ON_CONFLICT_CHOICES,
+                    default=ON_CONFLICT_SKIP,
+                    help='Handling of measurements already stored'),
+        make_option('--interval', type='float', default=0,
+                    help='Poll every INTERVAL seconds instead of once'),
+        make_option('--force', action='store_true', default=False,
+                    help='Load files even when already loaded'),
+    )
+
+    def handle(self, directory='', *args, **options):
+        self.options = options
+        self.directory = directory
+        while True:
+            self.poll()
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def connect(self):
+        return ftpconnection(self.options['host'], self.options['user'],
+                             self.options['password'])
+
+    def poll(self):
+        with self.connect() as ftp:
+            files = [
+                (name, size, mtime)
+                for name, size, mtime in listdir(ftp, self.directory)
+                if fnmatch.fnmatch(name, self.options['pattern'])
+            ]
+        workers = self.options['workers']
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.load_threaded, files))
+        else:
+            results = [self.load(file_info) for file_info in files]
+        loaded = [rows for rows in results if rows is not None]
+        self.stdout.write('Loaded {} rows from {} of {} files'.format(
+            sum(loaded), len(loaded), len(files)))
+
+    def load_threaded(self, file_info):
+        try:
+            return self.load(file_info)
+        finally:
+            connection.close()
+
+    def load(self, file_info):
+        name, size, mtime = file_info
+        path = posixpath.join(self.directory, name)
+        open_stream = functools.partial(remote_stream, self.connect, path)
+        try:
+            rows = import_file(SOURCE, path, size, mtime, open_stream,
+                               on_conflict=self.options['on_conflict'],
+                               force=self.options['force'])
+        except MeasurementFileError as e:
+            self.stderr.write('Skipping {}: {}'.format(path, e))
+            return None
+        if rows is not None and int(self.options['verbosity']) > 1:
+            self.stdout.write('{}: {} rows'.format(path, rows))
+        return rows
+
+
+@contextlib.contextmanager
+def remote_stream(connect, path):
+    """
+    Stream `path` over a fresh FTP connection from `connect`.
+    """
+    with connect() as ftp, retrbinary_stream(ftp, path) as stream:
+        yield stream
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from dbservice.apps.homes.models import MeterPort
+from dbservice.apps.homes.resets import rebuild_resets
+from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+
+
+class Command(BaseCommand):
+    args = '<meter_port_id meter_port_id ...>'
+    help = (
+        'Detect the counter resets (see `dbservice.apps.homes.resets`) of the '
+        'given energy meter ports, or of every energy meter port, from their '
+        'measurements.  Each meter port is scanned in its own transaction.'
+    )
+
+    def handle(self, *meter_port_ids, **options):
+        meter_ports = MeterPort.objects.filter(
+            unit=MEASUREMENT_UNIT_CHOICES[0][0]).order_by('id')
+        if meter_port_ids:
+            meter_ports = meter_ports.filter(id__in=meter_port_ids)
+        meter_port_ids = list(meter_ports.values_list('id', flat=True))
+        for meter_port_id in meter_port_ids:
+            resets = rebuild_resets(meter_port_id)
+            if int(options['verbosity']) > 1:
+                self.stdout.write('Meter port {}: {} resets'.format(
+                    meter_port_id, resets))
+        self.stdout.write('Rebuilt counter resets of {} meter ports'.format(
+            len(meter_port_ids)))
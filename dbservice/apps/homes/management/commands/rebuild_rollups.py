@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from dbservice.apps.homes.models import MeterPort
+from dbservice.apps.homes.rollups import rebuild_rollups
+from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
+
+
+class Command(BaseCommand):
+    args = '<meter_port_id meter_port_id ...>'
+    help = (
+        'Recompute the measurement rollups (see '
+        '`dbservice.apps.homes.rollups`) of the given energy meter ports, or '
+        'of every energy meter port.  Each window of measurements is '
+        'computed in its own transaction.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--window-days', type='int', default=30,
+                    help='Days of measurements computed per transaction'),
+    )
+
+    def handle(self, *meter_port_ids, **options):
+        meter_ports = MeterPort.objects.filter(
+            unit=MEASUREMENT_UNIT_CHOICES[0][0]).order_by('id')
+        if meter_port_ids:
+            meter_ports = meter_ports.filter(id__in=meter_port_ids)
+        window = datetime.timedelta(days=options['window_days'])
+        meter_port_ids = list(meter_ports.values_list('id', flat=True))
+        for meter_port_id in meter_port_ids:
+            windows = rebuild_rollups(meter_port_id, window)
+            if int(options['verbosity']) > 1:
+                self.stdout.write('Meter port {}: {} windows'.format(
+                    meter_port_id, windows))
+        self.stdout.write('Rebuilt rollups of {} meter ports'.format(
+            len(meter_port_ids)))
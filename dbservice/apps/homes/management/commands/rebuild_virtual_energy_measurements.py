@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from dbservice.apps.homes.models import VirtualEnergyPort
+from dbservice.apps.homes.virtual import rebuild_virtual_measurements
+
+
+class Command(BaseCommand):
+    args = '<virtual_energy_port_id virtual_energy_port_id ...>'
+    help = (
+        'Recompute the aligned measurements (see '
+        '`dbservice.apps.homes.virtual`) of the given virtual energy ports, '
+        'or of every virtual energy port.  Each virtual energy port is '
+        'computed in its own transaction.'
+    )
+
+    def handle(self, *virtual_port_ids, **options):
+        virtual_ports = VirtualEnergyPort.objects.order_by('pk')
+        if virtual_port_ids:
+            virtual_ports = virtual_ports.filter(pk__in=virtual_port_ids)
+        virtual_ports = list(virtual_ports)
+        for virtual_port in virtual_ports:
+            intervals = rebuild_virtual_measurements(virtual_port)
+            if int(options['verbosity']) > 1:
+                self.stdout.write(
+                    'Virtual energy port {}: {} intervals'.format(
+                        virtual_port.pk, intervals))
+        self.stdout.write(
+            'Rebuilt aligned measurements of {} virtual energy ports'.format(
+                len(virtual_ports)))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dbservice.apps.homes import indexes, partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Maintain the physical layout of the measurement table: switch the '
+        'timestamp index between B-tree and BRIN and CLUSTER the data by '
+        'meter port and timestamp.  CLUSTER locks one partition at a time.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--timestamp-index',
+                    choices=indexes.TIMESTAMP_INDEX_METHODS,
+                    help='Access method of the timestamp index'),
+        make_option('--cluster', action='store_true', default=False,
+                    help='Reorder the rows by meter port and timestamp'),
+        make_option('--partition', action='append', default=[],
+                    help='Only cluster these partitions'),
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Reorganizing requires PostgreSQL')
+        if options['timestamp_index']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                indexes.create_timestamp_index(
+                    cursor, options['timestamp_index'])
+            self.stdout.write('Timestamp index uses {}'.format(
+                options['timestamp_index']))
+        if not options['cluster']:
+            return
+        with connection.cursor() as cursor:
+            if partitions.is_partitioned(cursor):
+                tables = (options['partition'] or
+                          partitions.monthly_partitions(cursor) +
+                          [partitions.DEFAULT_PARTITION])
+            else:
+                tables = [partitions.MEASUREMENT_TABLE]
+        for table in tables:
+            start = time.time()
+            with transaction.atomic(), connection.cursor() as cursor:
+                indexes.cluster(cursor, table)
+            self.stdout.write('Clustered {} in {:.1f} s'.format(
+                table, time.time() - start))
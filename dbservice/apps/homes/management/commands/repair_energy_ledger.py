@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from dbservice.apps.homes.ledger import rebuild_ledger, update_ledger
+from dbservice.apps.homes.models import ResidentialHome
+
+
+class Command(BaseCommand):
+    args = '<residential_home_id residential_home_id ...>'
+    help = (
+        'Recompute the daily energy ledger (see '
+        '`dbservice.apps.homes.ledger`) of the given residential homes, or of '
+        'every home, for the last days.  Run nightly to repair days that '
+        'late or deleted measurements changed; with --rebuild the whole '
+        'ledger is replaced.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', default=2,
+                    help='Number of past days to recompute'),
+        make_option('--rebuild', action='store_true', default=False,
+                    help='Replace the whole ledger'),
+        make_option('--window-days', type='int', default=30,
+                    help='Days of measurements computed per transaction '
+                         'when rebuilding'),
+    )
+
+    def handle(self, *home_ids, **options):
+        homes = ResidentialHome.objects.order_by('id')
+        if home_ids:
+            homes = homes.filter(id__in=home_ids)
+        home_ids = list(homes.values_list('id', flat=True))
+        now = datetime.datetime.now()
+        from_timestamp = now - datetime.timedelta(days=options['days'])
+        window = datetime.timedelta(days=options['window_days'])
+        for home_id in home_ids:
+            if options['rebuild']:
+                windows = rebuild_ledger(home_id, window)
+                if int(options['verbosity']) > 1:
+                    self.stdout.write('Residential home {}: {} windows'.format(
+                        home_id, windows))
+            else:
+                update_ledger(home_id, from_timestamp, now)
+        self.stdout.write('{} the energy ledger of {} residential '
+                          'homes'.format('Rebuilt' if options['rebuild']
+                                         else 'Repaired', len(home_ids)))
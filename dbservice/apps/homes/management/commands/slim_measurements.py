@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from dbservice.apps.homes.models import IngestBatch, Measurement
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the provenance of measurements into ingest batches and clear '
+        'their per row created/last modified timestamps.  Run after turning '
+        'HOMES_MEASUREMENT_AUDIT_TIMESTAMPS off; follow up with '
+        '`reorganize_measurements --cluster` (or VACUUM FULL) to give the '
+        'space back.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=50000,
+                    help='Number of ids to rewrite per transaction'),
+        make_option('--sleep', type='float', default=0.0,
+                    help='Seconds to pause between batches'),
+    )
+
+    def handle(self, *args, **options):
+        audited = Measurement.objects.filter(created__isnull=False)
+        bounds = audited.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            return
+        batch_size = options['batch_size']
+        slimmed = 0
+        for low in range(bounds['first'], bounds['last'] + 1, batch_size):
+            rows = audited.filter(id__gte=low, id__lt=low + batch_size)
+            with transaction.atomic():
+                groups = rows.values('meter_port_id').annotate(
+                    from_timestamp=Min('timestamp'),
+                    to_timestamp=Max('timestamp'),
+                    created=Min('created'),
+                    rows=Count('id'),
+                )
+                for group in groups:
+                    batch = IngestBatch.objects.create(
+                        source='migration',
+                        from_timestamp=group['from_timestamp'],
+                        to_timestamp=group['to_timestamp'],
+                        rows=group['rows'],
+                    )
+                    batch.meter_ports.add(group['meter_port_id'])
+                    # keep when the rows were stored, not when they moved
+                    IngestBatch.objects.filter(id=batch.id).update(
+                        created=group['created'])
+                slimmed += rows.update(created=None, last_modified=None)
+            if int(options['verbosity']) > 1:
+                self.stdout.write('ids {}-{}: {} measurements slimmed'.format(
+                    low, low + batch_size - 1, slimmed))
+            time.sleep(options['sleep'])
+        self.stdout.write('Slimmed {} measurements'.format(slimmed))
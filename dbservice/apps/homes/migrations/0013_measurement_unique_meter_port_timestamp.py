@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Existing duplicates must be removed with
+    # `./manage.py dedupe_measurements` before applying this migration.
+
+    dependencies = [
+        ('homes', '0012_auto_20151030_1331'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='measurement',
+            unique_together=set([('meter_port', 'timestamp')]),
+        ),
+    ]
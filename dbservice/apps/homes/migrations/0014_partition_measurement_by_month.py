@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations
+
+from dbservice.apps.homes import partitions
+
+UNPARTITIONED = '{}_unpartitioned'.format(partitions.MEASUREMENT_TABLE)
+PARTITIONED = '{}_partitioned'.format(partitions.MEASUREMENT_TABLE)
+
+
+def partition_measurements(apps, schema_editor):
+    # Native range partitioning is PostgreSQL only; other backends keep the
+    # plain table.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    cursor = schema_editor.connection.cursor()
+    if partitions.is_partitioned(cursor):
+        return
+    table = partitions.MEASUREMENT_TABLE
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, UNPARTITIONED))
+    # The primary key and unique constraints of a partitioned table must
+    # contain the partition key.
+    cursor.execute(
+        'CREATE TABLE {table} ('
+        'LIKE {old} INCLUDING DEFAULTS, '
+        'PRIMARY KEY (id, timestamp), '
+        'UNIQUE (meter_port_id, timestamp), '
+        'FOREIGN KEY (meter_port_id) REFERENCES homes_meterport (id) '
+        'DEFERRABLE INITIALLY DEFERRED'
+        ') PARTITION BY RANGE (timestamp)'.format(
+            table=table, old=UNPARTITIONED))
+    for column in ('meter_port_id', 'timestamp', 'created'):
+        cursor.execute('CREATE INDEX {table}_{column} ON {table} ({column})'
+                       .format(table=table, column=column))
+    cursor.execute(
+        "SELECT pg_get_serial_sequence(%s, 'id')", [UNPARTITIONED])
+    sequence, = cursor.fetchone()
+    cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, table))
+
+    cursor.execute('SELECT min(timestamp) FROM {}'.format(UNPARTITIONED))
+    first, = cursor.fetchone()
+    now = datetime.datetime.utcnow()
+    first = first.replace(tzinfo=None) if first else now
+    for month in partitions.months(first, now + relativedelta(months=3)):
+        partitions.create_partition(cursor, month)
+    partitions.create_default_partition(cursor)
+
+    cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(
+        table, UNPARTITIONED))
+    cursor.execute('DROP TABLE {}'.format(UNPARTITIONED))
+
+
+def unpartition_measurements(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    cursor = schema_editor.connection.cursor()
+    if not partitions.is_partitioned(cursor):
+        return
+    table = partitions.MEASUREMENT_TABLE
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, PARTITIONED))
+    cursor.execute(
+        'CREATE TABLE {table} ('
+        'LIKE {old} INCLUDING DEFAULTS, '
+        'PRIMARY KEY (id), '
+        'UNIQUE (meter_port_id, timestamp), '
+        'FOREIGN KEY (meter_port_id) REFERENCES homes_meterport (id) '
+        'DEFERRABLE INITIALLY DEFERRED'
+        ')'.format(table=table, old=PARTITIONED))
+    cursor.execute(
+        "SELECT pg_get_serial_sequence(%s, 'id')", [PARTITIONED])
+    sequence, = cursor.fetchone()
+    cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(sequence, table))
+    cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(
+        table, PARTITIONED))
+    # drops the partitions and their indexes along with the parent
+    cursor.execute('DROP TABLE {}'.format(PARTITIONED))
+    for column in ('meter_port_id', 'timestamp', 'created'):
+        cursor.execute('CREATE INDEX {table}_{column} ON {table} ({column})'
+                       .format(table=table, column=column))
+
+
+class Migration(migrations.Migration):
+    # Copies every measurement into the new partitioned table; plan for the
+    # downtime on large installations.  Future partitions are maintained by
+    # `./manage.py measurement_partitions`.
+
+    dependencies = [
+        ('homes', '0013_measurement_unique_meter_port_timestamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_measurements,
+                             unpartition_measurements),
+    ]
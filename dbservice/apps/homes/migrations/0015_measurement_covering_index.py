@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import models, migrations
+
+from dbservice.apps.homes import indexes
+
+
+def create_measurement_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    cursor = schema_editor.connection.cursor()
+    if vendor == 'postgresql':
+        indexes.create_covering_index(cursor)
+    indexes.create_timestamp_index(
+        cursor, settings.HOMES_MEASUREMENT_TIMESTAMP_INDEX, vendor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0014_partition_measurement_by_month'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='meter_port',
+            field=models.ForeignKey(related_name='measurement', to='homes.MeterPort', db_index=False),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='timestamp',
+            field=models.DateTimeField(),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(create_measurement_indexes),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('homes', '0015_measurement_covering_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='created',
+            field=models.DateTimeField(null=True, blank=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='last_modified',
+            field=models.DateTimeField(null=True, blank=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.CreateModel(
+            name='IngestBatch',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('source', models.CharField(max_length=32, choices=[('api', 'REST API'), ('ftp', 'FTP meter file'), ('csv', 'CSV backfill'), ('migration', 'Migrated audit timestamps')])),
+                ('from_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('to_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('rows', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('meter_ports', models.ManyToManyField(related_name='ingest_batches', to='homes.MeterPort')),
+                ('user', models.ForeignKey(related_name='ingest_batches', blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0016_lean_measurements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('source', models.CharField(max_length=32, choices=[('api', 'REST API'), ('ftp', 'FTP meter file'), ('csv', 'CSV backfill'), ('migration', 'Migrated audit timestamps')])),
+                ('name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('mtime', models.DateTimeField(blank=True, null=True)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='importedfile',
+            unique_together=set([('source', 'name')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0017_importedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedChunk',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('number', models.IntegerField()),
+                ('rows', models.IntegerField()),
+                ('imported_file', models.ForeignKey(related_name='chunks', to='homes.ImportedFile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='importedchunk',
+            unique_together=set([('imported_file', 'number')]),
+        ),
+    ]
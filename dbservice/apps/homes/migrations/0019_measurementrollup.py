@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0018_importedchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('resolution', models.IntegerField(choices=[(60, '1min'), (900, '15min'), (3600, 'hour'), (86400, 'day')])),
+                ('timestamp', models.DateTimeField()),
+                ('value', models.BigIntegerField(blank=True, null=True)),
+                ('sample_before', models.DateTimeField(blank=True, null=True)),
+                ('sample_after', models.DateTimeField(blank=True, null=True)),
+                ('delta', models.BigIntegerField(blank=True, null=True)),
+                ('samples', models.IntegerField(default=0)),
+                ('meter_port', models.ForeignKey(related_name='rollups', to='homes.MeterPort', db_index=False)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='measurementrollup',
+            unique_together=set([('meter_port', 'resolution', 'timestamp')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0019_measurementrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnergyLedger',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('date', models.DateField()),
+                ('consumption', models.BigIntegerField(blank=True, null=True)),
+                ('production', models.BigIntegerField(blank=True, null=True)),
+                ('residential_home', models.ForeignKey(related_name='energy_ledger', to='homes.ResidentialHome', db_index=False)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='energyledger',
+            unique_together=set([('residential_home', 'date')]),
+        ),
+    ]
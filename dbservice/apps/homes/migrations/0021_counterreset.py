@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0020_energyledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterReset',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('timestamp', models.DateTimeField()),
+                ('correction', models.BigIntegerField()),
+                ('meter_port', models.ForeignKey(related_name='counter_resets', to='homes.MeterPort', db_index=False)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='counterreset',
+            unique_together=set([('meter_port', 'timestamp')]),
+        ),
+    ]
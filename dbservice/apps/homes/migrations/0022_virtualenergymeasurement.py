@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0021_counterreset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VirtualEnergyMeasurement',
+            fields=[
+                ('id', models.AutoField(primary_key=True, verbose_name='ID', auto_created=True, serialize=False)),
+                ('from_timestamp', models.DateTimeField()),
+                ('to_timestamp', models.DateTimeField()),
+                ('consumption_acc_start', models.BigIntegerField()),
+                ('consumption_acc_stop', models.BigIntegerField()),
+                ('current', models.BigIntegerField()),
+                ('voltage', models.BigIntegerField()),
+                ('power_factor', models.BigIntegerField()),
+                ('virtual_energy_port', models.ForeignKey(related_name='virtual_measurements', to='homes.VirtualEnergyPort', db_index=False)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='virtualenergymeasurement',
+            unique_together=set([('virtual_energy_port', 'from_timestamp')]),
+        ),
+    ]
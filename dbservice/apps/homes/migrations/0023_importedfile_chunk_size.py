@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homes', '0022_virtualenergymeasurement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedfile',
+            name='chunk_size',
+            field=models.IntegerField(null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
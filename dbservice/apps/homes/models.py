@@ -8,7 +8,10 @@ import sys
 from django.conf import settings
 from django.db import models
 from django.db.models.query import QuerySet
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.db import connections
+from django.utils import timezone
 from model_utils.managers import PassThroughManager
 
 from dbservice.apps.users.models import User
@@ -18,6 +21,11 @@ from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
 from dbservice.apps.utils import COUNTRY_CHOICES
 from dbservice.apps.utils import APPLIANCES_CHOICES
 from dbservice.apps.utils import PHASE_CHOICES
+from dbservice.apps.utils import INGEST_SOURCE_CHOICES
+from dbservice.apps.utils import ROLLUP_RESOLUTION_CHOICES
+
+from .signals import (defer_ranges, measurements_committed,
+                      measurements_stored)
 
 
 class ResidentialHome(models.Model):
@@ -251,9 +259,13 @@ class MyFuzzyCountManager(QuerySet):
                 return super().count()
 
             cursor = connections[self.db].cursor()
+            # sum over the partitions of partitioned tables
             sqlquery = (
-                "SELECT reltuples FROM pg_class ",
-                "WHERE relname = '{}';".format(self.model._meta.db_table)
+                "SELECT coalesce(sum(greatest(reltuples, 0)), 0) ",
+                "FROM pg_class WHERE oid = '{0}'::regclass OR oid IN ",
+                "(SELECT inhrelid FROM pg_inherits ",
+                "WHERE inhparent = '{0}'::regclass);".format(
+                    self.model._meta.db_table)
             )
             cursor.execute(''.join(sqlquery))
             count_estimate = int(cursor.fetchone()[0])
@@ -270,17 +282,278 @@ class Measurement(models.Model):
     """
     A measurement on a meter port
     """
+    # Indexed by the unique index on (meter_port, timestamp) covering value
+    # and a separate timestamp index; see `indexes`.
     meter_port = models.ForeignKey(
         MeterPort,
         related_name="measurement",
-        db_index=True,
+        db_index=False,
     )
-    timestamp = models.DateTimeField(db_index=True)
+    timestamp = models.DateTimeField()
     value = models.BigIntegerField()
-    created = models.DateTimeField(auto_now_add=True, db_index=True)
-    last_modified = models.DateTimeField(auto_now=True)
+    # Only filled in when HOMES_MEASUREMENT_AUDIT_TIMESTAMPS is set; NULLs
+    # take no space in the row.  Provenance is tracked by `IngestBatch`.
+    created = models.DateTimeField(null=True, blank=True, editable=False)
+    last_modified = models.DateTimeField(null=True, blank=True,
+                                         editable=False)
 
     objects = MyCountManager()
 
     class Meta:
         get_latest_by = 'timestamp'
+        unique_together = (('meter_port', 'timestamp'),)
+
+    def save(self, *args, **kwargs):
+        if settings.HOMES_MEASUREMENT_AUDIT_TIMESTAMPS:
+            now = timezone.now()
+            if self.created is None:
+                self.created = now
+            self.last_modified = now
+        super().save(*args, **kwargs)
+
+
+class MeasurementRollup(models.Model):
+    """
+    Energy measurements of a meter port condensed to a bucket of
+    `resolution` seconds starting at `timestamp` (aligned to the epoch)
+    """
+    meter_port = models.ForeignKey(
+        MeterPort,
+        related_name='rollups',
+        db_index=False,
+    )
+    resolution = models.IntegerField(choices=ROLLUP_RESOLUTION_CHOICES)
+    timestamp = models.DateTimeField()
+    # value interpolated at `timestamp` from the samples at `sample_before`
+    # and `sample_after`; NULL before the first and after the last sample
+    value = models.BigIntegerField(blank=True, null=True)
+    sample_before = models.DateTimeField(blank=True, null=True)
+    sample_after = models.DateTimeField(blank=True, null=True)
+    # value at the end of the bucket minus `value`
+    delta = models.BigIntegerField(blank=True, null=True)
+    # number of samples within the bucket
+    samples = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('meter_port', 'resolution', 'timestamp'),)
+
+
+class CounterReset(models.Model):
+    """
+    Reset of the counter of an accumulating energy meter port: the
+    measurement at `timestamp` dropped below the previous one by
+    `correction` and the next one did not drop further
+    """
+    meter_port = models.ForeignKey(
+        MeterPort,
+        related_name='counter_resets',
+        db_index=False,
+    )
+    timestamp = models.DateTimeField()
+    correction = models.BigIntegerField()
+
+    class Meta:
+        unique_together = (('meter_port', 'timestamp'),)
+
+
+class EnergyLedger(models.Model):
+    """
+    Energy consumption and production of a residential home on a day,
+    corrected for counter resets
+    """
+    residential_home = models.ForeignKey(
+        ResidentialHome,
+        related_name='energy_ledger',
+        db_index=False,
+    )
+    date = models.DateField()
+    # NULL when the measurements do not cover the day
+    consumption = models.BigIntegerField(blank=True, null=True)
+    production = models.BigIntegerField(blank=True, null=True)
+
+    class Meta:
+        unique_together = (('residential_home', 'date'),)
+
+
+class VirtualEnergyMeasurement(models.Model):
+    """
+    Measurements of a virtual energy port aligned on the interval between
+    two consumption measurements: the consumption at both ends and the
+    averages of current, voltage and power factor within it
+    """
+    virtual_energy_port = models.ForeignKey(
+        VirtualEnergyPort,
+        related_name='virtual_measurements',
+        db_index=False,
+    )
+    from_timestamp = models.DateTimeField()
+    to_timestamp = models.DateTimeField()
+    consumption_acc_start = models.BigIntegerField()
+    consumption_acc_stop = models.BigIntegerField()
+    current = models.BigIntegerField()
+    voltage = models.BigIntegerField()
+    power_factor = models.BigIntegerField()
+
+    class Meta:
+        unique_together = (('virtual_energy_port', 'from_timestamp'),)
+
+
+class IngestBatch(models.Model):
+    """
+    A batch of measurements loaded through the bulk ingest path
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='ingest_batches',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    source = models.CharField(
+        max_length=32,
+        choices=INGEST_SOURCE_CHOICES,
+    )
+    meter_ports = models.ManyToManyField(
+        MeterPort,
+        related_name='ingest_batches',
+    )
+    from_timestamp = models.DateTimeField(blank=True, null=True)
+    to_timestamp = models.DateTimeField(blank=True, null=True)
+    rows = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return "{} rows from {}: {} to {}".format(
+            self.rows, self.source, self.from_timestamp, self.to_timestamp)
+
+
+class ImportedFile(models.Model):
+    """
+    Checkpoint of a measurement file loaded from `source`, identified by
+    name and recognised as changed by its size and modification time
+    """
+    source = models.CharField(
+        max_length=32,
+        choices=INGEST_SOURCE_CHOICES,
+    )
+    name = models.CharField(max_length=1024)
+    size = models.BigIntegerField(blank=True, null=True)
+    mtime = models.DateTimeField(blank=True, null=True)
+    # lines per `ImportedChunk`, numbering the chunks of the last load
+    chunk_size = models.IntegerField(blank=True, null=True)
+    # rows stored by the last load
+    rows = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('source', 'name'),)
+
+    def __str__(self):
+        return "{}: {}".format(self.source, self.name)
+
+    def is_current(self, size, mtime):
+        """
+        Whether the file was completely loaded at `size` and `mtime`.
+        """
+        return self.completed and (self.size, self.mtime) == (size, mtime)
+
+
+class ImportedChunk(models.Model):
+    """
+    Chunk of an `ImportedFile` stored by a resumable load
+    """
+    imported_file = models.ForeignKey(
+        ImportedFile,
+        related_name='chunks',
+        on_delete=models.CASCADE,
+    )
+    number = models.IntegerField()
+    rows = models.IntegerField()
+
+    class Meta:
+        unique_together = (('imported_file', 'number'),)
+
+
+# deletions are not tracked: a post_delete receiver would rule out fast
+# deletes of measurements; rebuild derived data after deleting measurements
+@receiver(post_save, sender=Measurement)
+def measurement_saved(sender, instance, raw=False, using='default',
+                      **kwargs):
+    if raw:
+        return
+    ranges = {instance.meter_port_id: (instance.timestamp,
+                                       instance.timestamp)}
+    if not defer_ranges(ranges, using=using):
+        measurements_stored.send(sender=Measurement, using=using,
+                                 ranges=ranges)
+        if not connections[using].in_atomic_block:
+            # saved in autocommit mode
+            measurements_committed.send(sender=Measurement, using=using,
+                                        ranges=ranges)
+
+
+@receiver(measurements_stored)
+def update_measurement_rollups(sender, ranges, using='default', **kwargs):
+    if not settings.HOMES_ROLLUPS:
+        return
+    from .rollups import update_rollups
+    energy_ports = MeterPort.objects.using(using).filter(
+        id__in=list(ranges), unit=MEASUREMENT_UNIT_CHOICES[0][0],
+    ).values_list('id', flat=True)
+    for meter_port_id in energy_ports:
+        from_timestamp, to_timestamp = ranges[meter_port_id]
+        update_rollups(meter_port_id, from_timestamp, to_timestamp,
+                       using=using)
+
+
+@receiver(measurements_stored)
+def update_counter_resets(sender, ranges, using='default', **kwargs):
+    if not settings.HOMES_COUNTER_RESETS:
+        return
+    from .resets import update_resets
+    energy_ports = MeterPort.objects.using(using).filter(
+        id__in=list(ranges), unit=MEASUREMENT_UNIT_CHOICES[0][0],
+    ).values_list('id', flat=True)
+    for meter_port_id in energy_ports:
+        from_timestamp, to_timestamp = ranges[meter_port_id]
+        update_resets(meter_port_id, from_timestamp, to_timestamp,
+                      using=using)
+
+
+@receiver(measurements_stored)
+def update_energy_ledger(sender, ranges, using='default', **kwargs):
+    if not settings.HOMES_ENERGY_LEDGER:
+        return
+    from .ledger import update_ledger_ranges
+    update_ledger_ranges(ranges, using=using)
+
+
+@receiver(measurements_stored)
+def update_virtual_energy_measurements(sender, ranges, using='default',
+                                       **kwargs):
+    if not settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        return
+    from .virtual import update_virtual_ranges
+    update_virtual_ranges(ranges, using=using)
+
+
+@receiver(post_save, sender=VirtualEnergyPort)
+def virtual_energy_port_saved(sender, instance, raw=False, using='default',
+                              **kwargs):
+    # the source meter ports may have changed
+    if raw or not settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        return
+    from .virtual import rebuild_virtual_measurements
+    rebuild_virtual_measurements(instance, using=using)
+
+
+# evicted again after the commit, as results computed from the rows before
+# the commit may have been cached in the meantime
+@receiver([measurements_stored, measurements_committed])
+def invalidate_cached_results(sender, ranges, using='default', **kwargs):
+    if not settings.HOMES_RESULT_CACHE:
+        return
+    from .cache import invalidate_measurements
+    invalidate_measurements(ranges, using=using)
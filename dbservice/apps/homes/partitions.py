@@ -0,0 +1,119 @@
+"""
+Monthly range partitions of the measurement table
+
+The measurement table is partitioned on `timestamp` by month on PostgreSQL,
+so time bounded queries only scan the partitions of the requested period and
+retention is a matter of detaching or dropping old partitions.  Rows outside
+every monthly partition end up in the default partition.
+"""
+import datetime
+
+from dateutil.relativedelta import relativedelta
+
+MEASUREMENT_TABLE = 'homes_measurement'
+DEFAULT_PARTITION = '{}_default'.format(MEASUREMENT_TABLE)
+
+
+def month_start(timestamp):
+    return datetime.datetime(timestamp.year, timestamp.month, 1)
+
+
+def partition_name(month):
+    return '{}_y{:04d}m{:02d}'.format(MEASUREMENT_TABLE, month.year,
+                                      month.month)
+
+
+def partition_month(name):
+    """
+    Return the first day of the month covered by partition `name`.
+    """
+    suffix = name[len(MEASUREMENT_TABLE) + 1:]
+    return datetime.datetime(int(suffix[1:5]), int(suffix[6:8]), 1)
+
+
+def months(first, last):
+    """
+    Yield the first day of every month from `first` to `last` (inclusive).
+    """
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month += relativedelta(months=1)
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE relname = %s",
+        [MEASUREMENT_TABLE])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def monthly_partitions(cursor):
+    """
+    Return the names of the monthly partitions attached to the measurement
+    table, oldest first.
+    """
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'WHERE parent.relname = %s AND child.relname <> %s '
+        'ORDER BY child.relname',
+        [MEASUREMENT_TABLE, DEFAULT_PARTITION])
+    return [name for name, in cursor.fetchall()]
+
+
+def _exists(cursor, name):
+    cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', [name])
+    return cursor.fetchone() is not None
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition for the month starting at `month` unless it exists.
+
+    PostgreSQL refuses a partition for values the default partition holds,
+    so rows of the month in the default partition are moved into the new
+    partition while the default partition is detached.
+    """
+    name = partition_name(month)
+    bounds = [month, month + relativedelta(months=1)]
+    if _exists(cursor, name):
+        return
+    stray = False
+    if _exists(cursor, DEFAULT_PARTITION):
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM {} '
+            'WHERE "timestamp" >= %s AND "timestamp" < %s)'.format(
+                DEFAULT_PARTITION), bounds)
+        stray = cursor.fetchone()[0]
+    if stray:
+        detach_partition(cursor, DEFAULT_PARTITION)
+    cursor.execute(
+        'CREATE TABLE {} PARTITION OF {} '
+        'FOR VALUES FROM (%s) TO (%s)'.format(name, MEASUREMENT_TABLE),
+        bounds)
+    if stray:
+        cursor.execute(
+            'INSERT INTO {} SELECT * FROM {} '
+            'WHERE "timestamp" >= %s AND "timestamp" < %s'.format(
+                name, DEFAULT_PARTITION), bounds)
+        cursor.execute(
+            'DELETE FROM {} WHERE "timestamp" >= %s AND "timestamp" < %s'
+            .format(DEFAULT_PARTITION), bounds)
+        cursor.execute('ALTER TABLE {} ATTACH PARTITION {} DEFAULT'.format(
+            MEASUREMENT_TABLE, DEFAULT_PARTITION))
+
+
+def create_default_partition(cursor):
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT'.format(
+            DEFAULT_PARTITION, MEASUREMENT_TABLE))
+
+
+def detach_partition(cursor, name, drop=False):
+    cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+        MEASUREMENT_TABLE, name))
+    if drop:
+        cursor.execute('DROP TABLE {}'.format(name))
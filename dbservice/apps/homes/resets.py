@@ -0,0 +1,109 @@
+"""
+Counter resets of accumulating energy meter ports
+
+A measurement that drops below the previous measurement of its meter port,
+while the next measurement does not drop further, is a reset of the counter
+(the rule of `_find_negative_accumulated_values`).  With
+`HOMES_COUNTER_RESETS` enabled the resets around the measurements stored by
+an ingest are detected in the ingest transaction and kept as
+`CounterReset` rows, so the reset corrected increase of a meter port over a
+range is the last minus the first value plus the corrections of the resets
+strictly between them (see `accumulated_value`), without reading the
+measurements in between.
+"""
+import itertools
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .condensed import Sample, samples, stream_samples
+from .models import CounterReset, Measurement
+
+BULK_SIZE = 1000
+
+
+def detect_resets(meter_port_id, raw_data):
+    """
+    Yield the `CounterReset` rows of meter port `meter_port_id` among the
+    samples `raw_data` ordered by timestamp.
+    """
+    raw_data = iter(raw_data)
+    sample_a = next(raw_data, None)
+    sample_b = next(raw_data, None)
+    for sample_c in raw_data:
+        if sample_a.value > sample_b.value <= sample_c.value:
+            yield CounterReset(meter_port_id=meter_port_id,
+                               timestamp=sample_b.timestamp,
+                               correction=sample_a.value - sample_b.value)
+        sample_a, sample_b = sample_b, sample_c
+
+
+def update_resets(meter_port_id, from_timestamp, to_timestamp,
+                  using='default'):
+    """
+    Recompute the counter resets of meter port `meter_port_id` affected by
+    the measurements between `from_timestamp` and `to_timestamp`
+    (inclusive).
+    """
+    measurements = Measurement.objects.using(using).filter(
+        meter_port_id=meter_port_id)
+    # a reset depends on the samples before and after it, so the samples
+    # next to the range may change
+    before = list(measurements.filter(timestamp__lt=from_timestamp).order_by(
+        '-timestamp').values_list('timestamp', 'value')[:2])
+    after = list(measurements.filter(timestamp__gt=to_timestamp).order_by(
+        'timestamp').values_list('timestamp', 'value')[:2])
+    raw_data = [Sample(*sample) for sample in reversed(before)]
+    raw_data.extend(samples(measurements.filter(
+        timestamp__gte=from_timestamp, timestamp__lte=to_timestamp).order_by(
+            'timestamp')))
+    raw_data.extend(Sample(*sample) for sample in after)
+    low = before[0][0] if before else from_timestamp
+    high = after[0][0] if after else to_timestamp
+    with transaction.atomic(using=using):
+        CounterReset.objects.using(using).filter(
+            meter_port_id=meter_port_id, timestamp__gte=low,
+            timestamp__lte=high).delete()
+        CounterReset.objects.using(using).bulk_create(
+            list(detect_resets(meter_port_id, raw_data)))
+
+
+def rebuild_resets(meter_port_id, using='default'):
+    """
+    Replace the counter resets of meter port `meter_port_id`, streaming its
+    measurements once.  Returns the number of resets.
+    """
+    resets = 0
+    with transaction.atomic(using=using):
+        CounterReset.objects.using(using).filter(
+            meter_port_id=meter_port_id).delete()
+        detected = detect_resets(meter_port_id, stream_samples(
+            Measurement.objects.using(using).filter(
+                meter_port_id=meter_port_id).order_by('timestamp')))
+        while True:
+            chunk = list(itertools.islice(detected, BULK_SIZE))
+            if not chunk:
+                break
+            CounterReset.objects.using(using).bulk_create(chunk)
+            resets += len(chunk)
+    return resets
+
+
+def accumulated_value(measurements, meter_port_id):
+    """
+    Return the increase of the measurements of `measurements`, a queryset of
+    the measurements of meter port `meter_port_id` within a time range,
+    corrected for its recorded counter resets.
+    """
+    ordered = measurements.order_by('timestamp').values_list(
+        'timestamp', 'value')
+    first = ordered.first()
+    if first is None:
+        return 0
+    last = ordered.reverse().first()
+    corrections = CounterReset.objects.using(measurements.db).filter(
+        meter_port_id=meter_port_id,
+        timestamp__gt=first[0],
+        timestamp__lt=last[0],
+    ).aggregate(total=Sum('correction'))['total']
+    return last[1] - first[1] + (corrections or 0)
@@ -0,0 +1,156 @@
+"""
+Rollups of energy measurements
+
+For every energy meter port and every resolution of
+`ROLLUP_RESOLUTION_CHOICES` a `MeasurementRollup` row holds the value
+interpolated at each epoch aligned bucket boundary, the delta to the next
+boundary and the number of samples in the bucket.  Rows exist for the
+buckets from the first to the last sample of the port.
+
+With `HOMES_ROLLUPS` enabled the rows of the time range touched by an ingest
+are recomputed in the ingest transaction, and condensed queries with a
+matching increment and alignment read the rollups instead of interpolating
+the raw samples (see `condensed_from_rollups`).  The values are those of
+`condense`, so both paths answer alike.
+"""
+import bisect
+import datetime
+
+from django.db import transaction
+
+from dbservice.apps.utils import ROLLUP_RESOLUTION_CHOICES
+
+from .condensed import Sample, _interpolate_sample, samples
+from .models import Measurement, MeasurementRollup
+
+EPOCH = datetime.datetime(1970, 1, 1)
+RESOLUTIONS = [resolution for resolution, name in ROLLUP_RESOLUTION_CHOICES]
+_LARGEST = datetime.timedelta(seconds=max(RESOLUTIONS))
+
+
+def floor_timestamp(timestamp, step):
+    """
+    Return the start of the epoch aligned bucket of `step` containing
+    `timestamp`.
+    """
+    return EPOCH + (timestamp - EPOCH) // step * step
+
+
+def rollup_rows(meter_port_id, raw_data, resolution, first, last):
+    """
+    Return the `MeasurementRollup` rows of `resolution` for the bucket
+    boundaries from `first` to `last` of the samples `raw_data` ordered by
+    timestamp.  `raw_data` must hold the samples up to one bucket past
+    `last` and the samples next to them.
+    """
+    step = datetime.timedelta(seconds=resolution)
+    timestamps = [sample.timestamp for sample in raw_data]
+
+    def boundary(timestamp):
+        # (value, sample_before, sample_after) at `timestamp`
+        index = bisect.bisect_left(timestamps, timestamp)
+        if index < len(timestamps) and timestamps[index] == timestamp:
+            return raw_data[index].value, timestamp, timestamp
+        if 0 < index < len(timestamps):
+            before, after = raw_data[index - 1], raw_data[index]
+            return (_interpolate_sample(timestamp, before, after)[1],
+                    before.timestamp, after.timestamp)
+        return None, None, None
+
+    rows = []
+    timestamp = first
+    current = boundary(timestamp)
+    while timestamp <= last:
+        following = boundary(timestamp + step)
+        value, sample_before, sample_after = current
+        delta = None
+        if value is not None and following[0] is not None:
+            delta = following[0] - value
+        rows.append(MeasurementRollup(
+            meter_port_id=meter_port_id,
+            resolution=resolution,
+            timestamp=timestamp,
+            value=value,
+            sample_before=sample_before,
+            sample_after=sample_after,
+            delta=delta,
+            samples=(bisect.bisect_left(timestamps, timestamp + step) -
+                     bisect.bisect_left(timestamps, timestamp)),
+        ))
+        timestamp, current = timestamp + step, following
+    return rows
+
+
+def update_rollups(meter_port_id, from_timestamp, to_timestamp,
+                   using='default'):
+    """
+    Recompute the rollups of meter port `meter_port_id` affected by the
+    measurements between `from_timestamp` and `to_timestamp` (inclusive).
+    """
+    measurements = Measurement.objects.using(using).filter(
+        meter_port_id=meter_port_id)
+    # boundaries up to the samples next to the range interpolate from the
+    # samples within it
+    previous = measurements.filter(timestamp__lt=from_timestamp).order_by(
+        '-timestamp').values_list('timestamp', flat=True).first()
+    following = measurements.filter(timestamp__gt=to_timestamp).order_by(
+        'timestamp').values_list('timestamp', flat=True).first()
+    low = previous or from_timestamp
+    high = following or to_timestamp
+
+    window_from = floor_timestamp(low, _LARGEST) - _LARGEST
+    window_to = floor_timestamp(high, _LARGEST) + _LARGEST
+    raw_data = samples(measurements.filter(
+        timestamp__gte=window_from, timestamp__lt=window_to).order_by(
+            'timestamp'))
+    before = measurements.filter(timestamp__lt=window_from).order_by(
+        '-timestamp').values_list('timestamp', 'value').first()
+    after = measurements.filter(timestamp__gte=window_to).order_by(
+        'timestamp').values_list('timestamp', 'value').first()
+    if before is not None:
+        raw_data.insert(0, Sample(*before))
+    if after is not None:
+        raw_data.append(Sample(*after))
+
+    with transaction.atomic(using=using):
+        for resolution in RESOLUTIONS:
+            step = datetime.timedelta(seconds=resolution)
+            # the bucket before the range changes its delta
+            first = floor_timestamp(low, step) - step
+            last = floor_timestamp(high, step)
+            MeasurementRollup.objects.using(using).filter(
+                meter_port_id=meter_port_id, resolution=resolution,
+                timestamp__gte=first, timestamp__lte=last).delete()
+            if not raw_data:
+                continue
+            # rows only exist from the first to the last sample
+            if before is None:
+                first = max(first, floor_timestamp(raw_data[0].timestamp,
+                                                   step))
+            if after is None:
+                last = min(last, floor_timestamp(raw_data[-1].timestamp,
+                                                 step))
+            MeasurementRollup.objects.using(using).bulk_create(
+                rollup_rows(meter_port_id, raw_data, resolution, first,
+                            last))
+
+
+def rebuild_rollups(meter_port_id, window=datetime.timedelta(days=30),
+                    using='default'):
+    """
+    Replace the rollups of meter port `meter_port_id`, computing `window`
+    of measurements at a time.  Returns the number of windows computed.
+    """
+    MeasurementRollup.objects.using(using).filter(
+        meter_port_id=meter_port_id).delete()
+    measurements = Measurement.objects.using(using).filter(
+        meter_port_id=meter_port_id).order_by('timestamp').values_list(
+            'timestamp', flat=True)
+    first = measurements.first()
+    last = measurements.reverse().first()
+    windows = 0
+    while first is not None and first <= last:
+        update_rollups(meter_port_id, first, first + window, using=using)
+        first += window
+        windows += 1
+    return windows
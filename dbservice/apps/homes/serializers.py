@@ -2,14 +2,40 @@ from . import models
 from rest_framework import pagination, serializers
 
 from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
-
-
-class DefaultSerializer(serializers.HyperlinkedModelSerializer):
+from dbservice.apps.utils.relations import (BatchHyperlinkedRelatedField,
+                                            BatchPrimaryKeyRelatedField,
+                                            BatchRelationsMixin)
+
+# Lookups from each model to the user owning it; related objects must be
+# owned by the requesting user unless it is a superuser.
+OWNER_LOOKUPS = {
+    models.ResidentialHome: ('dno_customer_id',),
+    models.Appliance: ('residential_home__dno_customer_id',),
+    models.EnergyConsumptionPeriod: (
+        'appliance__residential_home__dno_customer_id',),
+    models.EnergyProductionPeriod: (
+        'appliance__residential_home__dno_customer_id',),
+    models.MainMeter: ('residential_home__dno_customer_id',),
+    models.SubMeter: ('residential_home__dno_customer_id',),
+    models.MeterPort: ('mainmeter__residential_home__dno_customer_id',
+                       'submeter__residential_home__dno_customer_id'),
+}
+
+
+class DefaultSerializer(BatchRelationsMixin,
+                        serializers.HyperlinkedModelSerializer):
     _default_view_name = 'homes-v1-%(model_name)s-detail'
+    _hyperlink_field_class = BatchHyperlinkedRelatedField
 
     class Meta:
         abstract = True
 
+    def get_related_field(self, model_field, related_model, to_many):
+        field = super().get_related_field(model_field, related_model,
+                                          to_many)
+        field.owner_lookups = OWNER_LOOKUPS.get(related_model, ())
+        return field
+
 
 class ResidentialHomeSerializer(DefaultSerializer):
     dno_customer_id = serializers.HyperlinkedRelatedField(
@@ -93,25 +119,29 @@ class MeasurementSerializer(DefaultSerializer):
 
 
 class VirtualEnergyPortSerializer(DefaultSerializer):
-    consumption = serializers.PrimaryKeyRelatedField(
+    consumption = BatchPrimaryKeyRelatedField(
         queryset=models.MeterPort.objects.filter(
             unit=MEASUREMENT_UNIT_CHOICES[0][0]
-        )
+        ),
+        owner_lookups=OWNER_LOOKUPS[models.MeterPort],
     )
-    current = serializers.PrimaryKeyRelatedField(
+    current = BatchPrimaryKeyRelatedField(
         queryset=models.MeterPort.objects.filter(
             unit=MEASUREMENT_UNIT_CHOICES[3][0]
-        )
+        ),
+        owner_lookups=OWNER_LOOKUPS[models.MeterPort],
     )
-    voltage = serializers.PrimaryKeyRelatedField(
+    voltage = BatchPrimaryKeyRelatedField(
         queryset=models.MeterPort.objects.filter(
             unit=MEASUREMENT_UNIT_CHOICES[2][0]
-        )
+        ),
+        owner_lookups=OWNER_LOOKUPS[models.MeterPort],
     )
-    power_factor = serializers.PrimaryKeyRelatedField(
+    power_factor = BatchPrimaryKeyRelatedField(
         queryset=models.MeterPort.objects.filter(
             unit=MEASUREMENT_UNIT_CHOICES[6][0]
-        )
+        ),
+        owner_lookups=OWNER_LOOKUPS[models.MeterPort],
     )
 
     class Meta:
@@ -140,6 +170,18 @@ class PaginatedCondensedSerializer(pagination.PaginationSerializer):
         object_serializer_class = CondensedSerializer
 
 
+class HomeLoadCurveSerializer(serializers.Serializer):
+    residential_home = serializers.IntegerField()
+    values = CondensedSerializer(many=True)
+
+
+class LoadCurveSerializer(serializers.Serializer):
+    pflow = serializers.CharField()
+    homes = serializers.IntegerField()
+    values = CondensedSerializer(many=True)
+    per_home = HomeLoadCurveSerializer(many=True)
+
+
 class AggregatedSerializer(serializers.Serializer):
     value = serializers.IntegerField()
     from_timestamp = serializers.DateTimeField()
@@ -153,7 +195,7 @@ class StatusSerializer(serializers.Serializer):
     resource_type = serializers.CharField()
     meterport_name = serializers.CharField()
     time_discrepancy_occurence = serializers.DateTimeField()
-    time_discrepancy_sec = serializers.DateTimeField()
+    time_discrepancy_sec = serializers.FloatField()
 
 
 class VirtualEnergyMeasurementSerializer(serializers.Serializer):
@@ -166,12 +208,18 @@ class VirtualEnergyMeasurementSerializer(serializers.Serializer):
     to_timestamp = serializers.DateTimeField()
 
 
+class VirtualEnergyPortMeasurementsSerializer(serializers.Serializer):
+    virtual_energy_port = serializers.IntegerField()
+    measurements = VirtualEnergyMeasurementSerializer(many=True)
+
+
 class TemperatureSerializer(serializers.Serializer):
     temperature = serializers.IntegerField()
     timestamp = serializers.DateTimeField()
     submeter_name = serializers.CharField()
 
 
-class PaginatedTemperatureSerializer(pagination.PaginationSerializer):
-    class Meta:
-        object_serializer_class = TemperatureSerializer
+class TemperaturePageSerializer(serializers.Serializer):
+    next = serializers.CharField()
+    previous = serializers.CharField()
+    results = TemperatureSerializer(many=True)
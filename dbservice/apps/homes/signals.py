@@ -0,0 +1,77 @@
+"""
+Signals of the measurement store
+"""
+import contextlib
+import threading
+
+from django.dispatch import Signal
+
+# Sent inside the transaction storing measurements, with `ranges` mapping
+# each meter port id to the (first, last) timestamp stored for it and the
+# database alias `using`.  Receivers maintain data derived from the
+# measurements of those ranges.
+measurements_stored = Signal(providing_args=['ranges', 'using'])
+
+# Sent with the same arguments once the transaction storing the measurements
+# has committed, for receivers that must not act on uncommitted rows, such as
+# the result cache: a result computed by another request before the commit
+# would otherwise be cached after the eviction.  Code storing measurements
+# within a transaction of its own sends it after committing.
+measurements_committed = Signal(providing_args=['ranges', 'using'])
+
+
+def measurement_ranges(rows):
+    """
+    Return the `ranges` argument of `measurements_stored` for `rows` with
+    `meter_port_id` and `timestamp` attributes.
+    """
+    ranges = {}
+    for row in rows:
+        first, last = ranges.get(row.meter_port_id,
+                                 (row.timestamp, row.timestamp))
+        ranges[row.meter_port_id] = (min(first, row.timestamp),
+                                     max(last, row.timestamp))
+    return ranges
+
+
+_deferred = threading.local()
+
+
+@contextlib.contextmanager
+def batched_measurements(sender, using='default'):
+    """
+    Context manager collecting the ranges of the measurements saved one at a
+    time on `using` within the block (see `defer_ranges`) and sending one
+    `measurements_stored` for all of them when the block completes.  Use it
+    within the transaction storing the measurements; the block yields the
+    collected ranges for `measurements_committed`.
+    """
+    if getattr(_deferred, 'ranges', None) is not None:
+        # nested in another block, which sends the signal
+        yield _deferred.ranges
+        return
+    _deferred.ranges, _deferred.using = {}, using
+    try:
+        yield _deferred.ranges
+        ranges = _deferred.ranges
+    finally:
+        _deferred.ranges = None
+    if ranges:
+        measurements_stored.send(sender=sender, ranges=ranges, using=using)
+
+
+def defer_ranges(ranges, using='default'):
+    """
+    Add `ranges` to those of the enclosing `batched_measurements` block on
+    `using`.  Returns False, leaving the signal to the caller, outside of
+    such a block.
+    """
+    pending = getattr(_deferred, 'ranges', None)
+    if pending is None or _deferred.using != using:
+        return False
+    for meter_port_id, (first, last) in ranges.items():
+        pending_first, pending_last = pending.get(meter_port_id,
+                                                  (first, last))
+        pending[meter_port_id] = (min(first, pending_first),
+                                  max(last, pending_last))
+    return True
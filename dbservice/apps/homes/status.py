@@ -1,6 +1,7 @@
 import datetime
 
 import itertools
+import operator
 from collections import namedtuple, OrderedDict
 
 
@@ -10,8 +11,8 @@ from rest_framework.exceptions import ParseError
 from django.views.decorators.http import require_GET
 
 from .serializers import StatusSerializer
-from .utils import (pairwise, get_urlquery_timespan,
-                    meter_port_objs, extract_query, source_options)
+from .streaming import stream_rows
+from .utils import pairwise, get_urlquery_timespan, extract_query
 from .models import Measurement, MeterPort
 
 time_tolerance = OrderedDict([
@@ -47,25 +48,20 @@ def tolerance_parser(tolerance):
     return tolerance
 
 
-def detect_time_discrepancy(dtseries, tolerance):
+def detect_time_discrepancy(rows, tolerance):
     """
-    Check datetime series for time discrepancy between timestamps according to
-    timedelta tolerance. If the time between two observations are above the
-    tolerance level, it is included in the return value
+    Check the `(meter_port_id, timestamp)` rows, ordered by meter port and
+    timestamp, for time discrepancy between the timestamps of each meter
+    port according to timedelta tolerance.  Yields
+    `(meter_port_id, timestamp, timedelta)` for the observations followed by
+    a gap above the tolerance level.
     """
-    # If dtseries is empty
-    if not dtseries:
-        return None
-
-    # Find the timedelta between datetimes entries
-    fromto_dt = pairwise(dtseries)
-    td_dtseries = map(lambda fdt, tdt: tdt-fdt, fromto_dt)
-
-    # Find time_discrepancy based on tolerance and index and violation
-    time_discrepancy = ((idx, td) for idx, td in enumerate(td_dtseries)
-                        if td > tolerance)
-
-    return time_discrepancy
+    for meter_port_id, port_rows in itertools.groupby(
+            rows, key=operator.itemgetter(0)):
+        timestamps = (timestamp for _, timestamp in port_rows)
+        for from_dt, to_dt in pairwise(timestamps):
+            if to_dt - from_dt > tolerance:
+                yield meter_port_id, from_dt, to_dt - from_dt
 
 
 @require_GET
@@ -81,61 +77,41 @@ def get_status(request, pk):
     status_report = []
 
     # First search in the mainmeter and then the submeters
-    for meter_type in ['mainmeters', 'submeters']:
-
-        # Get the meterport objects based on the residential_home_id
-        mp_objs = meter_port_objs(pk, meter_type)
-
-        # Get the measurments within the timespan
-        mmeter = Measurement.objects.filter(
-            meter_port_id__in=mp_objs[meter_type],
-            timestamp__gt=from_timestamp,
-            timestamp__lt=to_timestamp).order_by('timestamp')
-
-        # Get only the timestamps from the measurements
-        mmeter_time = mmeter.values_list('timestamp', flat=True)
-
-        # Look for time discrepancy and return (index, size of timegap)
-        mmeter_timedis = detect_time_discrepancy(mmeter_time, tolerance)
-
-        if not mmeter_timedis:
-            break
-
-        # Get the possible time discrepancy
-        result_timedis = zip(*list(mmeter_timedis))
-
-        # If there are no entries, then we go out of loop
-        if result_timedis:
-
-            # Deconvolute the sequence
-            mmeter_idx, time_discrepancy_sec = result_timedis
-
-            # Get the ids and the time_discrepancy timestamp
-            mp_timedis_ids, time_discrepancy_occur = zip(
-                *[(mmeter[idx].meter_port_id, mmeter[idx].timestamp)
-                  for idx in mmeter_idx])
-
-            # For each meter port id, get the meter port object
-            for mp_timedis_id in mp_timedis_ids:
-                mport_timedis_obj = MeterPort.objects.get(id=mp_timedis_id)
-
-                # Determine the meter name
-                meter_name = None
-                if meter_type is 'mainmeters':
-                    meter_name = source_options[meter_type].objects.get(
-                        id=mport_timedis_obj.mainmeter_id).name
-                elif meter_type is 'submeters':
-                    meter_name = source_options[meter_type].objects.get(
-                        id=mport_timedis_obj.submeter_id).name
-
-                # Generate an entry in the status_report object
-                status_report.append(
-                    (meter_type,
-                     meter_name,
-                     time_discrepancy_occur,
-                     time_discrepancy_sec,
-                     mport_timedis_obj.resource_type,
-                     mport_timedis_obj.name))
+    for meter_type, meter_field in [('mainmeters', 'mainmeter'),
+                                    ('submeters', 'submeter')]:
+
+        # Get the meter ports based on the residential_home_id
+        meter_ports = {
+            meter_port.id: meter_port
+            for meter_port in MeterPort.objects.filter(**{
+                '{}__residential_home_id'.format(meter_field): pk,
+            }).select_related(meter_field)
+        }
+        if not meter_ports:
+            continue
+
+        # Stream the timestamps of the measurements within the timespan,
+        # one meter port at a time
+        rows = stream_rows(
+            Measurement.objects.filter(
+                meter_port_id__in=list(meter_ports),
+                timestamp__gt=from_timestamp,
+                timestamp__lt=to_timestamp).order_by('meter_port_id',
+                                                     'timestamp'),
+            'meter_port_id', 'timestamp')
+
+        # Look for time discrepancy
+        for meter_port_id, occurence, discrepancy in \
+                detect_time_discrepancy(rows, tolerance):
+            meter_port = meter_ports[meter_port_id]
+            # Generate an entry in the status_report object
+            status_report.append(
+                (meter_type,
+                 getattr(meter_port, meter_field).name,
+                 occurence,
+                 discrepancy.total_seconds(),
+                 meter_port.resource_type,
+                 meter_port.name))
 
     # Map the statusreport to the StatusReport class
     result = itertools.starmap(StatusReport, status_report)
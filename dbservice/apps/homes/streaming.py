@@ -0,0 +1,112 @@
+"""
+Bounded memory scans of measurements
+
+Analytics read measurements over arbitrarily long ranges.  `stream_rows`
+yields the rows of a queryset as plain tuples, fetched in chunks of
+`HOMES_STREAM_CHUNK_SIZE` rows through a named (server side) cursor on
+PostgreSQL, so a scan holds one chunk in memory however long the range is;
+`stream_sql` does the same for raw SQL.
+
+Code that has to keep rows in memory passes them through `bounded`, which
+enforces the per request ceiling `HOMES_ANALYTICS_MAX_ROWS` and fails the
+request with 413 rather than exhausting the worker.  Responses over
+unbounded ranges are written with `streaming_json_response` instead, which
+renders a chunk of items at a time.
+"""
+import itertools
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+
+class RangeTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = ('Too many measurements in the requested range, '
+                      'request a shorter range.')
+
+
+def stream_rows(queryset, *fields, **kwargs):
+    """
+    Yield the `fields` of the rows of `queryset` as tuples, fetching
+    `chunk_size` rows at a time.
+    """
+    queryset = queryset.values_list(*fields)
+    if connections[queryset.db].vendor != 'postgresql':
+        for row in queryset.iterator():
+            yield row
+        return
+    sql, params = queryset.query.sql_with_params()
+    for row in stream_sql(sql, params, using=queryset.db, **kwargs):
+        yield row
+
+
+def stream_sql(sql, params, using='default', chunk_size=None):
+    """
+    Yield the rows of the PostgreSQL query `sql` as tuples, fetching
+    `chunk_size` rows at a time.
+    """
+    chunk_size = chunk_size or settings.HOMES_STREAM_CHUNK_SIZE
+    connection = connections[using]
+    connection.ensure_connection()
+    # named cursors live within the transaction; outside one they are
+    # declared WITH HOLD, so scans can interleave without nesting
+    # transactions
+    cursor = connection.connection.cursor(
+        name='homes_stream_{}'.format(uuid.uuid4().hex),
+        withhold=connection.get_autocommit())
+    if not settings.USE_TZ:
+        # as the cursors of the Django backend, return naive datetimes
+        cursor.tzinfo_factory = None
+    cursor.itersize = chunk_size
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+
+
+def bounded(rows, limit=None):
+    """
+    Pass `rows` through, raising `RangeTooLarge` after more than `limit`
+    (default `HOMES_ANALYTICS_MAX_ROWS`) rows.
+    """
+    limit = limit or settings.HOMES_ANALYTICS_MAX_ROWS
+    rows = iter(rows)
+    for row in itertools.islice(rows, limit):
+        yield row
+    if next(rows, None) is not None:
+        raise RangeTooLarge()
+
+
+def streaming_json_response(items, chunk_size=None):
+    """
+    Return a response streaming the JSON array of `items`, the serialized
+    data of its elements, rendering `chunk_size` items at a time.
+    """
+    chunk_size = chunk_size or settings.HOMES_STREAM_CHUNK_SIZE
+    renderer = JSONRenderer()
+
+    def content():
+        items_iter = iter(items)
+        separator = b''
+        yield b'['
+        while True:
+            chunk = list(itertools.islice(items_iter, chunk_size))
+            if not chunk:
+                break
+            # the items of the rendered array, without its brackets
+            yield separator + renderer.render(chunk)[1:-1]
+            separator = b','
+        yield b']'
+
+    return StreamingHttpResponse(content(), content_type=renderer.media_type)
@@ -1,9 +1,23 @@
+import collections
 import datetime
+import gzip
+import io
 import itertools
+import json
+import os
 import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
 
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from unittest import skipIf
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import force_authenticate
@@ -18,7 +32,22 @@ from dbservice.apps.utils import MEASUREMENT_UNIT_CHOICES
 
 from . import models
 from . import views
+from .ingest import ON_CONFLICT_OVERWRITE, ON_CONFLICT_SKIP
+from .ingest import MeasurementRow, load_measurements
+from .status import detect_time_discrepancy
 from . import aggregated
+from . import buffer
+from . import cache
+from . import condensed
+from . import fleet
+from . import ledger
+from . import partitions
+from . import resets
+from . import rollups
+from . import serializers
+from . import signals
+from . import streaming
+from . import virtual
 
 
 class AccessControlFilteringTestCase(TestCase):
@@ -558,6 +587,95 @@ class VirtualEnergyMeasurementsTestCase(TestCase):
             self.assertGreaterEqual(cur_minmax[1], m['current'])
             self.assertLessEqual(cur_minmax[0], m['current'])
 
+    def test_calc_timeslots(self):
+        """Test the sweep aligns as averaging every timeslot on its own."""
+        def naive(followers, leader):
+            def average(follower, from_timestamp, to_timestamp):
+                values = [sample.value for sample in follower
+                          if from_timestamp <= sample.timestamp <=
+                          to_timestamp]
+                if values:
+                    return round(sum(values) / len(values))
+
+            entries = []
+            for from_meas, to_meas in zip(leader, leader[1:]):
+                entry = ((from_meas.value, to_meas.value) +
+                         tuple(average(follower, from_meas.timestamp,
+                                       to_meas.timestamp)
+                               for follower in followers) +
+                         (from_meas.timestamp, to_meas.timestamp))
+                if all(entry):
+                    entries.append(entry)
+            return entries
+
+        def series(count, step):
+            timestamp = self.start_datetime
+            result = []
+            for _ in range(count):
+                # steps of 0 and samples on the leader timestamps included
+                timestamp += datetime.timedelta(
+                    seconds=random.randint(0, step))
+                result.append(condensed.Sample(timestamp,
+                                               random.randint(0, 5)))
+            return result
+
+        for _ in range(50):
+            leader = series(random.randint(0, 30), 10)
+            followers = [series(random.randint(0, 60), 5) for _ in range(3)]
+            self.assertEqual(
+                list(aggregated.calc_timeslots(
+                    [iter(follower) for follower in followers],
+                    iter(leader))),
+                naive(followers, leader))
+
+    @skipIf(condensed.np is None, 'numpy is not installed')
+    def test_calc_timeslots_numpy(self):
+        """Test the NumPy engine aligns as `calc_timeslots`."""
+        def series(count, step):
+            timestamp = self.start_datetime
+            result = []
+            for _ in range(count):
+                timestamp += datetime.timedelta(
+                    seconds=random.randint(0, step))
+                result.append(condensed.Sample(timestamp,
+                                               random.randint(-2, 5)))
+            return result
+
+        for _ in range(50):
+            leader = series(random.randint(0, 30), 10)
+            followers = [series(random.randint(0, 60), 5) for _ in range(3)]
+            self.assertEqual(
+                list(aggregated.calc_timeslots(
+                    [condensed.sample_arrays(follower)
+                     for follower in followers],
+                    condensed.sample_arrays(leader))),
+                list(aggregated.calc_timeslots(followers, leader)))
+        timespan = (self.start_datetime - datetime.timedelta(seconds=1),
+                    self.end_datetime + datetime.timedelta(seconds=1))
+        expected = list(aggregated.calc_timeslots(
+            *aggregated.get_virtual_energy_measurements(
+                self.virtualenergyport.id, *timespan)))
+        self.assertTrue(expected)
+        with override_settings(HOMES_VIRTUAL_ENERGY_ENGINE='numpy'):
+            followers, leader = aggregated.get_virtual_energy_measurements(
+                self.virtualenergyport.id, *timespan)
+            self.assertIsInstance(leader, condensed.SampleArrays)
+            self.assertEqual(
+                expected, list(aggregated.calc_timeslots(followers, leader)))
+
+    @skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+    def test_calc_timeslots_sql(self):
+        """Test the SQL engine aligns as `calc_timeslots`."""
+        timespan = (self.start_datetime - datetime.timedelta(seconds=1),
+                    self.end_datetime + datetime.timedelta(seconds=1))
+        expected = list(aggregated.calc_timeslots(
+            *aggregated.get_virtual_energy_measurements(
+                self.virtualenergyport.id, *timespan)))
+        self.assertTrue(expected)
+        self.assertEqual(expected, list(aggregated.calc_timeslots_sql(
+            *aggregated.virtual_energy_querysets(
+                self.virtualenergyport.id, *timespan))))
+
 
 class TemperatureMeasurementsTestCase(TestCase):
     def setUp(self):
@@ -612,9 +730,48 @@ class TemperatureMeasurementsTestCase(TestCase):
             'from_timestamp': '{}'.format(datetime1_str),
             'to_timestamp': '{}'.format(datetime2_str),
         })
-        self.assertEqual(4, len(response.data))
+        self.assertEqual(4, len(response.data['results']))
         response = self.client.get(self.url)
-        self.assertEqual(4, len(response.data))
+        self.assertEqual(4, len(response.data['results']))
+
+    def test_temperature_pages(self):
+        """Test the cursors page forwards and backwards through the stream."""
+        self.client.force_authenticate(user=self.user)
+        start = datetime.datetime(2015, 9, 1)
+        for meter_port, count in ((self.meter_port1, 35),
+                                  (self.meter_port2, 12)):
+            load_measurements([
+                MeasurementRow(meter_port.id,
+                               start + datetime.timedelta(minutes=n),
+                               20000 + n)
+                for n in range(count)
+            ])
+        streamed = json.loads(b''.join(self.client.get(
+            self.url.replace('get_temperature', 'get_temperature_stream')
+        ).streaming_content).decode())
+        self.assertEqual(47, len(streamed))
+        self.assertEqual(
+            ['user submeter1'] * 35 + ['user submeter2'] * 12,
+            [temperature['submeter_name'] for temperature in streamed])
+
+        def get_page(url):
+            return json.loads(self.client.get(url).content.decode())
+
+        pages = [get_page(self.url)]
+        while pages[-1]['next']:
+            pages.append(get_page(pages[-1]['next']))
+        self.assertEqual([20, 20, 7],
+                         [len(page['results']) for page in pages])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertEqual(streamed, [temperature for page in pages
+                                    for temperature in page['results']])
+        previous = get_page(pages[2]['previous'])
+        self.assertEqual(pages[1]['results'], previous['results'])
+        previous = get_page(previous['previous'])
+        self.assertEqual(pages[0]['results'], previous['results'])
+        self.assertIsNone(previous['previous'])
+        self.assertEqual(400, self.client.get(
+            self.url, {'cursor': 'invalid'}).status_code)
 
 
 class AggregationTestCase(TestCase):
@@ -831,3 +988,1612 @@ class AggregationTestCase(TestCase):
         })
         self.assertEqual(int(time_duration / tau_timedelta),
                          len(response.data))
+
+
+class MeterPortMixin(object):
+
+    """Fixture of a user owning a home with an energy meter port."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        self.meter_port = self.create_meter_port('normal1@test.com')
+        self.mainmeter = self.meter_port.mainmeter
+        self.home = self.mainmeter.residential_home
+        self.user = self.home.dno_customer_id
+
+    def create_meter_port(self, email):
+        """
+        Return an energy meter port on the main meter of the home of a new
+        user `email`.
+        """
+        user = User.objects.create_user(email, 'qwe')
+        home = models.ResidentialHome.objects.create(
+            dno_customer_id=user,
+            country=COUNTRY_CHOICES[0][0]
+        )
+        return models.MeterPort.objects.create(
+            mainmeter=models.MainMeter.objects.create(
+                residential_home=home,
+                name="user main meter"
+            ),
+            name='user meter port mainmeter consumption',
+            resource_type=RESOURCE_TYPE_CHOICES[0][0],
+            unit=MEASUREMENT_UNIT_CHOICES[0][0]
+        )
+
+    def random_rows(self, start, count, value=0, seconds=(30, 900),
+                    resets=0):
+        """
+        Return `count` measurement rows at intervals of random `seconds`
+        drawn from `self.rnd`, accumulating from `value`; with probability
+        `resets` the counter is reset to zero.
+        """
+        rows = []
+        timestamp = start
+        for n in range(count):
+            timestamp += datetime.timedelta(
+                seconds=self.rnd.randint(*seconds))
+            if resets and self.rnd.random() < resets:
+                value = 0
+            value += self.rnd.randint(0, 5000)
+            rows.append(MeasurementRow(self.meter_port.id, timestamp, value))
+        return rows
+
+
+class FleetMixin(object):
+
+    """Fixture of three homes with consumption and production."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        self.superuser = User.objects.create_superuser(
+            'super@test.com', 'qwe')
+        rnd = random.Random(18)
+        self.from_timestamp = datetime.datetime(2015, 9, 1)
+        self.to_timestamp = datetime.datetime(2015, 9, 3)
+        self.homes = []
+        rows = []
+        for n in range(3):
+            user = User.objects.create_user(
+                'normal{}@test.com'.format(n + 1), 'qwe')
+            home = models.ResidentialHome.objects.create(
+                dno_customer_id=user,
+                country=COUNTRY_CHOICES[0][0]
+            )
+            appliance = models.Appliance.objects.create(
+                residential_home=home,
+                name=APPLIANCES_CHOICES[0][0],
+                location=LOCATION_CHOICES[0][0]
+            )
+            meter_ports = [models.MeterPort.objects.create(
+                mainmeter=models.MainMeter.objects.create(
+                    residential_home=home,
+                    name="user main meter"
+                ),
+                name='user meter port mainmeter consumption',
+                resource_type=RESOURCE_TYPE_CHOICES[0][0],
+                unit=MEASUREMENT_UNIT_CHOICES[0][0]
+            )]
+            for m in range(2):
+                meter_ports.append(models.MeterPort.objects.create(
+                    submeter=models.SubMeter.objects.create(
+                        residential_home=home,
+                        name="user sub meter{}".format(m)
+                    ),
+                    energy_production_period=(
+                        models.EnergyProductionPeriod.objects.create(
+                            appliance=appliance,
+                            from_timestamp=self.from_timestamp,
+                        )
+                    ),
+                    unit=MEASUREMENT_UNIT_CHOICES[0][0],
+                    name='user meter port submeter production{}'.format(m)
+                ))
+            for meter_port in meter_ports:
+                timestamp = self.from_timestamp - datetime.timedelta(
+                    minutes=rnd.randint(0, 600))
+                value = 0
+                while timestamp < self.to_timestamp + datetime.timedelta(
+                        hours=2):
+                    timestamp += datetime.timedelta(
+                        seconds=rnd.randint(60, 7200))
+                    value += rnd.randint(0, 5000)
+                    rows.append(MeasurementRow(meter_port.id, timestamp,
+                                               value))
+            self.homes.append(home)
+        load_measurements(rows)
+        self.client = APIClient()
+        self.url = '/api/v1/homes/residential_homes/load_curve/'
+
+
+class MeasurementIngestTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the bulk ingest path for measurements."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.other_meter_port = self.create_meter_port('normal2@test.com')
+        self.url = '/api/v1/homes/measurements/ingest/'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_ingest(self):
+        """Test ingest accepts hyperlinks and primary keys."""
+        meter_port_url = reverse('homes-v1-meterport-detail',
+                                 kwargs={'pk': self.meter_port.id})
+        start = datetime.datetime(2015, 9, 1)
+        data = [
+            {
+                'meter_port': meter_port_url if n % 2 else self.meter_port.id,
+                'timestamp': (start + datetime.timedelta(minutes=n)).strftime(
+                    "%Y-%m-%dT%H:%M:%S"),
+                'value': 100 * n,
+            }
+            for n in range(10)
+        ]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(10, response.data['count'])
+        self.assertEqual(10, models.Measurement.objects.filter(
+            meter_port=self.meter_port).count())
+
+    def test_ingest_rejects_batch_with_invalid_rows(self):
+        """Test ingest stores nothing when a single row is invalid."""
+        data = [
+            {
+                'meter_port': self.meter_port.id,
+                'timestamp': '2015-09-01T00:00:00',
+                'value': 100,
+            },
+            {
+                'meter_port': self.other_meter_port.id,
+                'timestamp': '2015-09-01T00:01:00',
+                'value': 'not a number',
+            },
+        ]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('meter_port', response.data[1])
+        self.assertIn('value', response.data[1])
+        self.assertEqual(0, models.Measurement.objects.count())
+
+    def test_ingest_on_conflict(self):
+        """Test ingest of an already stored meter port and timestamp."""
+        def post(value, **params):
+            url = self.url
+            if params:
+                url += '?on_conflict={on_conflict}'.format(**params)
+            return self.client.post(url, [{
+                'meter_port': self.meter_port.id,
+                'timestamp': '2015-09-01T00:00:00',
+                'value': value,
+            }], format='json')
+
+        self.assertEqual(201, post(100).status_code)
+        self.assertEqual(409, post(200).status_code)
+        response = post(200, on_conflict='skip')
+        self.assertEqual(0, response.data['count'])
+        self.assertEqual(100, models.Measurement.objects.get().value)
+        response = post(300, on_conflict='overwrite')
+        self.assertEqual(1, response.data['count'])
+        self.assertEqual(300, models.Measurement.objects.get().value)
+        self.assertEqual(400, post(300, on_conflict='merge').status_code)
+
+    @override_settings(HOMES_MEASUREMENT_AUDIT_TIMESTAMPS=False)
+    def test_ingest_lean_rows(self):
+        """Test lean ingest keeps provenance in the ingest batch only."""
+        data = [
+            {
+                'meter_port': self.meter_port.id,
+                'timestamp': '2015-09-01T00:0{}:00'.format(n),
+                'value': 100 * n,
+            }
+            for n in range(3)
+        ]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(201, response.status_code)
+        self.assertFalse(models.Measurement.objects.filter(
+            created__isnull=False).exists())
+        batch = models.IngestBatch.objects.get()
+        self.assertEqual(self.user, batch.user)
+        self.assertEqual(3, batch.rows)
+        self.assertEqual([self.meter_port], list(batch.meter_ports.all()))
+        self.assertEqual(datetime.datetime(2015, 9, 1, 0, 2),
+                         batch.to_timestamp.replace(tzinfo=None))
+
+
+class MeasurementPartitionsTestCase(MeterPortMixin, TestCase):
+    def test_partition_months(self):
+        """Test monthly partitions cover every month of a period."""
+        months = list(partitions.months(datetime.datetime(2015, 11, 17),
+                                        datetime.datetime(2016, 2, 1)))
+        self.assertEqual(
+            [datetime.datetime(2015, 11, 1), datetime.datetime(2015, 12, 1),
+             datetime.datetime(2016, 1, 1), datetime.datetime(2016, 2, 1)],
+            months)
+        for month in months:
+            name = partitions.partition_name(month)
+            self.assertEqual(month, partitions.partition_month(name))
+
+    @skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+    def test_default_rows_moved(self):
+        """Test a new partition takes over its rows from the default one."""
+        month = datetime.datetime(2100, 1, 1)
+        load_measurements([
+            MeasurementRow(self.meter_port.id,
+                           month + datetime.timedelta(days=n), n)
+            for n in range(3)
+        ])
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                self.skipTest('the measurement table is not partitioned')
+            partitions.create_partition(cursor, month)
+            cursor.execute('SELECT count(*) FROM {}'.format(
+                partitions.partition_name(month)))
+            self.assertEqual(3, cursor.fetchone()[0])
+            cursor.execute('SELECT count(*) FROM {}'.format(
+                partitions.DEFAULT_PARTITION))
+            self.assertEqual(0, cursor.fetchone()[0])
+        self.assertEqual(3, models.Measurement.objects.filter(
+            meter_port=self.meter_port).count())
+
+
+class IngestBufferTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the write-behind ingest buffer."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+
+    def rows(self, start, count):
+        """Return `count` measurement rows a minute apart."""
+        return [
+            MeasurementRow(
+                self.meter_port.id,
+                datetime.datetime(2015, 9, 1) + datetime.timedelta(minutes=n),
+                100 * n)
+            for n in range(start, start + count)
+        ]
+
+    def test_flush_combines_batches(self):
+        """Test spooled batches are loaded together and unspooled."""
+        ingest_buffer = buffer.IngestBuffer(spool_dir=self.spool_dir)
+        first = ingest_buffer.put(self.rows(0, 3), user=self.user,
+                                  ack=buffer.ACK_SPOOL)
+        second = ingest_buffer.put(self.rows(3, 2), user=self.user,
+                                   ack=buffer.ACK_SPOOL)
+        self.assertEqual(2, len(os.listdir(self.spool_dir)))
+        ingest_buffer.flush()
+        self.assertEqual(3, first.wait(0))
+        self.assertEqual(2, second.wait(0))
+        self.assertEqual([], os.listdir(self.spool_dir))
+        self.assertEqual(5, models.Measurement.objects.count())
+        self.assertEqual(1, models.IngestBatch.objects.count())
+
+    def test_recover_spool(self):
+        """Test batches spooled by a stopped buffer are loaded on start."""
+        live = buffer.IngestBuffer(spool_dir=self.spool_dir).put(
+            self.rows(0, 3), user=self.user, ack=buffer.ACK_SPOOL)
+        self.assertEqual(
+            0, buffer.IngestBuffer(spool_dir=self.spool_dir).pending_rows)
+        # the exit of a process releases the locks of its spool files
+        live.spool_file.close()
+        ingest_buffer = buffer.IngestBuffer(spool_dir=self.spool_dir)
+        self.assertEqual(3, ingest_buffer.pending_rows)
+        ingest_buffer.flush()
+        self.assertEqual(3, models.Measurement.objects.count())
+        self.assertEqual(self.user, models.IngestBatch.objects.get().user)
+
+    def test_failed_batch(self):
+        """Test a conflicting batch fails alone."""
+        ingest_buffer = buffer.IngestBuffer()
+        ingest_buffer.put(self.rows(0, 2))
+        ingest_buffer.flush()
+        valid = ingest_buffer.put(self.rows(2, 2))
+        conflicting = ingest_buffer.put(self.rows(1, 2))
+        ingest_buffer.flush()
+        self.assertEqual(2, valid.wait(0))
+        self.assertRaises(Exception, conflicting.wait, 0)
+        self.assertEqual(4, models.Measurement.objects.count())
+
+    def test_unspool_error(self):
+        """Test a failing spool directory fails no batch and no flush."""
+        ingest_buffer = buffer.IngestBuffer(spool_dir=self.spool_dir)
+        batch = ingest_buffer.put(self.rows(0, 3), user=self.user,
+                                  ack=buffer.ACK_SPOOL)
+        with mock.patch.object(buffer.os, 'remove',
+                               side_effect=OSError('read-only')):
+            ingest_buffer.flush()
+        self.assertEqual(3, batch.wait(0))
+        failed = ingest_buffer.put(self.rows(3, 1))
+        with mock.patch.object(buffer, 'load_measurements',
+                               side_effect=RuntimeError('database gone')):
+            with mock.patch.object(buffer.os, 'rename',
+                                   side_effect=OSError('read-only')):
+                ingest_buffer.flush()
+        self.assertRaises(RuntimeError, failed.wait, 0)
+
+    def test_flush_counts_stored_rows(self):
+        """Test skipping batches loaded together report their stored rows."""
+        ingest_buffer = buffer.IngestBuffer()
+        ingest_buffer.put(self.rows(0, 2))
+        ingest_buffer.flush()
+        first = ingest_buffer.put(self.rows(1, 3), ON_CONFLICT_SKIP)
+        second = ingest_buffer.put(self.rows(3, 2), ON_CONFLICT_SKIP)
+        ingest_buffer.flush()
+        self.assertEqual(2, first.wait(0))
+        self.assertEqual(1, second.wait(0))
+        self.assertEqual(5, models.Measurement.objects.count())
+        self.assertEqual([2, 2, 1], list(models.IngestBatch.objects.order_by(
+            'pk').values_list('rows', flat=True)))
+
+    def test_flush_keeps_users(self):
+        """Test batches of different users are recorded apart."""
+        other_meter_port = self.create_meter_port('normal2@test.com')
+        other_home = other_meter_port.mainmeter.residential_home
+        other_user = other_home.dno_customer_id
+        ingest_buffer = buffer.IngestBuffer()
+        ingest_buffer.put(self.rows(0, 3), user=self.user)
+        ingest_buffer.put([row._replace(meter_port_id=other_meter_port.id)
+                           for row in self.rows(0, 2)], user=other_user)
+        ingest_buffer.flush()
+        self.assertEqual(
+            {(self.user.id, 3), (other_user.id, 2)},
+            set(models.IngestBatch.objects.values_list('user', 'rows')))
+
+    @override_settings(HOMES_INGEST_BUFFER=True,
+                       HOMES_INGEST_BUFFER_ACK=buffer.ACK_COMMIT,
+                       HOMES_INGEST_BUFFER_COMMIT_TIMEOUT=0)
+    def test_commit_timeout(self):
+        """Test a batch not committed in time is accepted with its id."""
+        # a buffer without a flush thread never commits
+        ingest_buffer = buffer.IngestBuffer()
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        data = [{'meter_port': row.meter_port_id,
+                 'timestamp': row.timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
+                 'value': row.value}
+                for row in self.rows(0, 3)]
+        with mock.patch.object(buffer, 'get_buffer',
+                               return_value=ingest_buffer):
+            response = client.post('/api/v1/homes/measurements/ingest/',
+                                   data, format='json')
+        self.assertEqual(202, response.status_code)
+        batch, = ingest_buffer.pending
+        self.assertEqual({'count': 3, 'batch': batch.id}, response.data)
+        ingest_buffer.flush()
+        self.assertEqual(3, batch.wait(0))
+
+    def test_backpressure(self):
+        """Test a full buffer turns new batches away."""
+        ingest_buffer = buffer.IngestBuffer(max_rows=3)
+        ingest_buffer.put(self.rows(0, 3))
+        self.assertRaises(buffer.BufferFull, ingest_buffer.put,
+                          self.rows(3, 1), block=0)
+        ingest_buffer.flush()
+        ingest_buffer.put(self.rows(3, 1), block=0)
+
+
+class FakeFTP(object):
+
+    """Stand-in for `ftplib.FTP` serving `files` from one directory."""
+
+    files = {}
+
+    def __init__(self, host='', user='', passwd=''):
+        pass
+
+    def mlsd(self, path='', facts=[]):
+        for name, (data, modify) in sorted(self.files.items()):
+            yield name, {'type': 'file', 'size': str(len(data)),
+                         'modify': modify}
+
+    def voidcmd(self, cmd):
+        return '200 OK'
+
+    def transfercmd(self, cmd):
+        data, modify = self.files[os.path.basename(cmd.split(' ', 1)[1])]
+        connection = mock.Mock()
+        connection.makefile.return_value = io.BytesIO(data)
+        return connection
+
+    def voidresp(self):
+        return '226 Transfer complete'
+
+    def quit(self):
+        pass
+
+
+class PollFTPMeasurementsTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the incremental FTP meter file poller."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        patcher = mock.patch('dbservice.apps.utils.ftpclient.ftplib.FTP',
+                             FakeFTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def csv(self, minutes):
+        """Return CSV data of the meter port for `minutes`."""
+        lines = ['meter_port,timestamp,value']
+        lines.extend('{},2015-09-01T00:{:02d}:00,{}'.format(
+            self.meter_port.id, minute, 100 * minute) for minute in minutes)
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def poll(self):
+        """Poll the fake FTP server and return the command output."""
+        out = io.StringIO()
+        call_command('poll_ftp_measurements', 'incoming', workers=1,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_poll(self):
+        """Test only new and changed files are loaded."""
+        FakeFTP.files = {
+            'a.csv': (self.csv(range(0, 3)), '20150901010000'),
+            'b.csv.gz': (gzip.compress(self.csv(range(3, 5))),
+                         '20150901010000'),
+        }
+        self.assertIn('Loaded 5 rows from 2 of 2 files', self.poll())
+        self.assertIn('Loaded 0 rows from 0 of 2 files', self.poll())
+        FakeFTP.files['a.csv'] = (self.csv([0, 1, 2, 5]),
+                                  '20150901020000')
+        self.assertIn('Loaded 1 rows from 1 of 2 files', self.poll())
+        self.assertEqual(6, models.Measurement.objects.count())
+        self.assertEqual(
+            1, models.ImportedFile.objects.get(name='incoming/a.csv').rows)
+
+
+class LoadMeasurementsTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the CSV backfill loader."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        fd, self.path = tempfile.mkstemp(suffix='.csv.gz')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        with gzip.open(self.path, 'wt') as f:
+            f.write('meter_port,timestamp,value\n')
+            for minute in range(5):
+                f.write('{},2015-09-01T00:{:02d}:00,{}\n'.format(
+                    self.meter_port.id, minute, 100 * minute))
+
+    def load(self, chunk_size=2):
+        """Run the loader and return its output."""
+        out = io.StringIO()
+        call_command('load_measurements', self.path, workers=1,
+                     chunk_size=chunk_size, stdout=out)
+        return out.getvalue()
+
+    def test_load_and_resume(self):
+        """Test an interrupted load only loads the missing chunks."""
+        self.assertIn('Total: 5 rows', self.load())
+        self.assertEqual(5, models.Measurement.objects.count())
+        self.assertIn('already loaded', self.load())
+
+        # interrupted before storing the last chunk
+        imported_file = models.ImportedFile.objects.get()
+        imported_file.chunks.get(number=2).delete()
+        imported_file.completed = False
+        imported_file.save()
+        models.Measurement.objects.latest().delete()
+
+        output = self.load()
+        self.assertIn('resuming after 2 chunks', output)
+        self.assertIn('Total: 1 rows', output)
+        self.assertEqual(5, models.Measurement.objects.count())
+        self.assertEqual(5, models.ImportedFile.objects.get().rows)
+
+    def test_resume_other_chunk_size(self):
+        """Test chunks of another chunk size are loaded again."""
+        self.load()
+        imported_file = models.ImportedFile.objects.get()
+        imported_file.chunks.get(number=2).delete()
+        imported_file.completed = False
+        imported_file.save()
+        models.Measurement.objects.latest().delete()
+
+        output = self.load(chunk_size=3)
+        self.assertNotIn('resuming', output)
+        self.assertIn('Total: 1 rows', output)
+        self.assertEqual(5, models.Measurement.objects.count())
+        imported_file = models.ImportedFile.objects.get()
+        self.assertEqual(3, imported_file.chunk_size)
+        self.assertEqual([0, 1], sorted(
+            imported_file.chunks.values_list('number', flat=True)))
+
+
+class BatchRelationsTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of batch resolution of related objects on bulk creation."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        # owned through the main meter, the sub meter and by another user
+        self.meter_ports = [
+            self.meter_port,
+            models.MeterPort.objects.create(
+                submeter=models.SubMeter.objects.create(
+                    residential_home=self.home,
+                    name="sub meter"
+                ),
+                name='meter port submeter consumption',
+                resource_type=RESOURCE_TYPE_CHOICES[0][0],
+                unit=MEASUREMENT_UNIT_CHOICES[0][0]
+            ),
+            self.create_meter_port('normal2@test.com'),
+        ]
+        self.url = '/api/v1/homes/measurements/bulk/'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def payload(self, meter_ports, rows):
+        """Return `rows` measurements spread over `meter_ports`."""
+        return [
+            {
+                'meter_port': reverse(
+                    'homes-v1-meterport-detail',
+                    kwargs={'pk': meter_ports[n % len(meter_ports)].id}),
+                'timestamp': '2015-09-01T00:{:02d}:00'.format(n),
+                'value': n,
+            }
+            for n in range(rows)
+        ]
+
+    def test_one_query_per_relation(self):
+        """Test the meter ports of a batch are resolved in one query."""
+        payload = self.payload(self.meter_ports[:2], 20)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(201, response.status_code)
+        meter_port_queries = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and
+            'FROM "homes_meterport"' in query['sql']
+        ]
+        self.assertEqual(1, len(meter_port_queries))
+        self.assertEqual(20, models.Measurement.objects.count())
+
+    def test_ownership(self):
+        """Test rows referencing meter ports of other users are rejected."""
+        payload = self.payload(self.meter_ports[1:], 2)
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('meter_port', response.data[1])
+        self.assertEqual(0, models.Measurement.objects.count())
+
+    def test_ownership_superuser(self):
+        """Test a superuser may reference the meter ports of any user."""
+        superuser = User.objects.create_superuser('super@test.com', 'qwe')
+        self.client.force_authenticate(user=superuser)
+        payload = self.payload(self.meter_ports, 3)
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(3, models.Measurement.objects.count())
+
+
+@skipIf(condensed.np is None, 'numpy is not installed')
+class CondenseEngineTestCase(TestCase):
+
+    """TestCase comparing the NumPy condense engine with the reference."""
+
+    def random_samples(self, rnd):
+        """Return random samples, from timestamp and increment."""
+        start = datetime.datetime(2015, 1, 1)
+        timestamp = start + datetime.timedelta(
+            seconds=rnd.randint(-1000, 1000))
+        value = rnd.randint(-10 ** 6, 10 ** 6)
+        samples = []
+        for n in range(rnd.randint(0, 50)):
+            if rnd.random() < 0.2:
+                timestamp += datetime.timedelta(
+                    microseconds=rnd.randint(1, 3 * 10 ** 6))
+            else:
+                timestamp += datetime.timedelta(seconds=rnd.randint(1, 400))
+            if rnd.random() < 0.9:
+                value += rnd.randint(-1000, 10 ** 5)
+            else:
+                # counter reset
+                value = rnd.randint(-10 ** 7, 0)
+            if rnd.random() < 0.02:
+                value = rnd.choice([2 ** 62, -2 ** 62, 2 ** 63 - 1])
+            # stay within BigIntegerField
+            value = max(min(value, 2 ** 63 - 1), -2 ** 63)
+            samples.append(condensed.Sample(timestamp, value))
+        from_timestamp = start + datetime.timedelta(
+            seconds=rnd.randint(-2000, 2000),
+            microseconds=rnd.choice([0, rnd.randint(0, 999999)]))
+        increment = datetime.timedelta(
+            seconds=rnd.choice([1, 7, 60, 300, 3600]),
+            microseconds=rnd.choice([0, 0, rnd.randint(1, 999999)]))
+        return samples, from_timestamp, increment
+
+    def test_identical_output(self):
+        """Test both engines condense random samples identically."""
+        rnd = random.Random(20151001)
+        for case in range(500):
+            samples, from_timestamp, increment = self.random_samples(rnd)
+            arrays = condensed.sample_arrays(samples)
+            self.assertEqual(
+                list(condensed.condense(samples, from_timestamp, increment)),
+                condensed.condense_arrays(arrays, from_timestamp, increment),
+                'case {}'.format(case))
+
+
+@override_settings(HOMES_ROLLUPS=True)
+class RollupTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the measurement rollups."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.start = datetime.datetime(2015, 9, 1)
+        self.rnd = random.Random(11)
+
+    def assertCondensedAlike(self):
+        """
+        Assert the rollups answer like `condense` on raw samples.  Ranges
+        without a complete bucket, which `condense` answers with an empty
+        list, are left to the raw samples.
+        """
+        for increment in (datetime.timedelta(minutes=15),
+                          datetime.timedelta(hours=1),
+                          datetime.timedelta(days=1)):
+            from_timestamp = self.start
+            to_timestamp = self.start + datetime.timedelta(days=3)
+            raw_data = condensed.samples(models.Measurement.objects.filter(
+                meter_port=self.meter_port,
+                timestamp__gt=from_timestamp - increment,
+                timestamp__lt=to_timestamp + increment).order_by('timestamp'))
+            expected = list(condensed.condense(raw_data, from_timestamp,
+                                               increment))
+            from_rollups = condensed.condensed_from_rollups(
+                self.meter_port.id, from_timestamp, to_timestamp, increment)
+            if from_rollups is None:
+                self.assertEqual([], expected)
+            else:
+                self.assertEqual(expected, from_rollups)
+            if increment < datetime.timedelta(days=1):
+                self.assertIsNotNone(from_rollups)
+
+    def test_maintained_on_ingest(self):
+        """Test rollups follow loads, overwrites and single saves."""
+        load_measurements(self.random_rows(self.start, 300))
+        self.assertCondensedAlike()
+
+        # overwrite values in the middle and append later measurements
+        stored = list(models.Measurement.objects.order_by('timestamp'))
+        load_measurements(
+            [MeasurementRow(self.meter_port.id, m.timestamp, m.value + 7)
+             for m in stored[100:]], on_conflict=ON_CONFLICT_OVERWRITE)
+        load_measurements(self.random_rows(stored[-1].timestamp, 50,
+                                           stored[-1].value + 7))
+        self.assertCondensedAlike()
+
+        models.Measurement.objects.create(
+            meter_port=self.meter_port,
+            timestamp=stored[0].timestamp - datetime.timedelta(hours=3),
+            value=stored[0].value - 10)
+        self.assertCondensedAlike()
+
+    def test_bulk_create_batched(self):
+        """Test a bulk created batch updates the rollups once."""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        meter_port = reverse('homes-v1-meterport-detail',
+                             kwargs={'pk': self.meter_port.id})
+        payload = [
+            {
+                'meter_port': meter_port,
+                'timestamp': '2015-09-01T00:{:02d}:00'.format(n),
+                'value': 100 * n,
+            }
+            for n in range(10)
+        ]
+        with mock.patch.object(rollups, 'update_rollups',
+                               wraps=rollups.update_rollups) as update:
+            response = client.post('/api/v1/homes/measurements/bulk/',
+                                   payload, format='json')
+        self.assertEqual(201, response.status_code)
+        update.assert_called_once_with(
+            self.meter_port.id, datetime.datetime(2015, 9, 1),
+            datetime.datetime(2015, 9, 1, 0, 9), using='default')
+        self.assertTrue(models.MeasurementRollup.objects.exists())
+
+    def test_rebuild(self):
+        """Test the rebuild command recomputes the maintained rollups."""
+        load_measurements(self.random_rows(self.start, 200))
+        load_measurements(self.random_rows(
+            self.start + datetime.timedelta(days=2), 100, 10 ** 6))
+        fields = ('resolution', 'timestamp', 'value', 'sample_before',
+                  'sample_after', 'delta', 'samples')
+        maintained = list(models.MeasurementRollup.objects.order_by(
+            'resolution', 'timestamp').values_list(*fields))
+        self.assertTrue(maintained)
+
+        call_command('rebuild_rollups', window_days=1, stdout=io.StringIO())
+        self.assertEqual(maintained, list(
+            models.MeasurementRollup.objects.order_by(
+                'resolution', 'timestamp').values_list(*fields)))
+
+    def test_unaligned_falls_back(self):
+        """Test unaligned or unknown increments are not read from rollups."""
+        load_measurements(self.random_rows(self.start, 50))
+        to_timestamp = self.start + datetime.timedelta(days=1)
+        self.assertIsNone(condensed.condensed_from_rollups(
+            self.meter_port.id, self.start + datetime.timedelta(minutes=5),
+            to_timestamp, datetime.timedelta(hours=1)))
+        self.assertIsNone(condensed.condensed_from_rollups(
+            self.meter_port.id, self.start, to_timestamp,
+            datetime.timedelta(minutes=10)))
+        self.assertEqual(
+            rollups.floor_timestamp(self.start + datetime.timedelta(
+                minutes=20), datetime.timedelta(minutes=15)),
+            self.start + datetime.timedelta(minutes=15))
+
+
+@skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+class CondenseSQLTestCase(MeterPortMixin, TestCase):
+
+    """TestCase comparing the SQL condense engine with the reference."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        rnd = random.Random(12)
+        timestamp = datetime.datetime(2015, 1, 1)
+        value = 0
+        rows = []
+        for n in range(2000):
+            timestamp += datetime.timedelta(seconds=rnd.randint(60, 36000))
+            if rnd.random() < 0.01:
+                # counter reset
+                value = rnd.randint(-1000, 0)
+            value += rnd.randint(0, 10 ** 5)
+            rows.append(MeasurementRow(self.meter_port.id, timestamp, value))
+        load_measurements(rows)
+
+    def test_identical_output(self):
+        """Test timedelta and relativedelta increments match `condense`."""
+        from_timestamp = datetime.datetime(2015, 1, 31, 0, 0, 30)
+        to_timestamp = datetime.datetime(2015, 9, 1)
+        for increment in aggregated.condensed_options.values():
+            measurements = models.Measurement.objects.filter(
+                meter_port=self.meter_port,
+                timestamp__gt=from_timestamp - increment,
+                timestamp__lt=to_timestamp + increment)
+            expected = list(condensed.condense(
+                condensed.samples(measurements.order_by('timestamp')),
+                from_timestamp, increment))
+            self.assertTrue(expected)
+            self.assertEqual(expected, condensed.condense_sql(
+                measurements, from_timestamp, to_timestamp, increment))
+
+
+@skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+class AccumulatedSQLTestCase(MeterPortMixin, TestCase):
+
+    """TestCase comparing the SQL totals with the reference."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        appliance = models.Appliance.objects.create(
+            residential_home=self.home,
+            name=APPLIANCES_CHOICES[0][0],
+            location=LOCATION_CHOICES[0][0]
+        )
+        meter_ports = [self.meter_port]
+        for n in range(2):
+            meter_ports.append(models.MeterPort.objects.create(
+                submeter=models.SubMeter.objects.create(
+                    residential_home=self.home,
+                    name="user sub meter{}".format(n)
+                ),
+                energy_production_period=(
+                    models.EnergyProductionPeriod.objects.create(
+                        appliance=appliance,
+                        from_timestamp=datetime.datetime(2015, 1, 1),
+                    )
+                ),
+                unit=MEASUREMENT_UNIT_CHOICES[0][0],
+                name='user meter port submeter production{}'.format(n)
+            ))
+        rnd = random.Random(16)
+        self.values = {}
+        rows = []
+        for meter_port in meter_ports:
+            timestamp = datetime.datetime(2015, 1, 1)
+            value = 0
+            values = self.values[meter_port.id] = []
+            for n in range(1000):
+                timestamp += datetime.timedelta(minutes=rnd.randint(1, 60))
+                if rnd.random() < 0.02:
+                    # counter reset
+                    value = 0
+                value += rnd.randint(0, 1000)
+                values.append(value)
+                rows.append(MeasurementRow(meter_port.id, timestamp, value))
+        load_measurements(rows)
+        self.consumption, self.production = meter_ports[0], meter_ports[1:]
+
+    def test_consumption_total(self):
+        """Test the consumption total matches `_accumulated_value`."""
+        expected = aggregated._accumulated_value(
+            self.values[self.consumption.id])
+        result = aggregated.aggregate_mainmeter_consumption(
+            self.home.id, None, None, datetime.timedelta(0))
+        self.assertEqual(expected, result[0].value)
+
+    def test_production_total(self):
+        """Test the production total sums the totals per submeter."""
+        expected = sum(aggregated._accumulated_value(self.values[port.id])
+                       for port in self.production)
+        result = aggregated.aggregate_submeter_measured_production(
+            self.home.id, None, None, datetime.timedelta(0))
+        self.assertEqual(expected, result[0].value)
+
+
+@override_settings(
+    CACHES={'results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'homes-results-test',
+    }},
+    HOMES_RESULT_CACHE='results')
+class ResultCacheTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the range aware result cache."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        cache.get_cache().clear()
+        self.computed = 0
+        self.start = datetime.datetime(2015, 9, 1)
+
+    def cached(self, scope, days):
+        """Return a cached result of a window of `days` from start."""
+        def compute():
+            self.computed += 1
+            return [days]
+        window = (self.start, self.start + datetime.timedelta(days=days))
+        return cache.cached_result(scope, ('test', days), window, compute)
+
+    def test_hits_and_misses(self):
+        """Test results are computed once and counted."""
+        scope = ('port', self.meter_port.id)
+        self.assertEqual([1], self.cached(scope, 1))
+        self.assertEqual([1], self.cached(scope, 1))
+        self.assertEqual(1, self.computed)
+        stats = cache.cache_stats()
+        self.assertEqual((1, 1), (stats['hits'], stats['misses']))
+
+    def test_ingest_evicts_overlapping(self):
+        """Test ingest only evicts results overlapping the stored range."""
+        port, home = ('port', self.meter_port.id), ('home', self.home.id)
+        for scope in (port, home):
+            self.cached(scope, 1)
+            self.cached(scope, 5)
+        self.assertEqual(4, self.computed)
+
+        load_measurements([MeasurementRow(
+            self.meter_port.id, self.start + datetime.timedelta(days=3),
+            100)])
+        for scope in (port, home):
+            self.cached(scope, 1)
+            self.cached(scope, 5)
+        # only the 5 day windows were computed again
+        self.assertEqual(6, self.computed)
+
+    @override_settings(HOMES_RESULT_CACHE_MAX_ENTRIES=2)
+    def test_index_pruned(self):
+        """Test the index drops expired, then older epoch and old entries."""
+        scope = ('port', self.meter_port.id)
+        index_key = cache._scope_key(scope, 'entries')
+        self.cached(scope, 1)
+        load_measurements([MeasurementRow(
+            self.meter_port.id, self.start + datetime.timedelta(days=3),
+            100)])
+        self.cached(scope, 2)
+        self.cached(scope, 3)
+        # the result of the older epoch made room
+        self.assertEqual(
+            {cache._entry_key(scope, ('test', days)) for days in (2, 3)},
+            set(cache.get_cache().get(index_key)))
+        self.cached(scope, 1)
+        self.assertEqual(4, self.computed)
+
+        # expired in the index, while the index itself is still cached
+        with mock.patch.object(cache, 'time') as clock:
+            clock.time.return_value = time.time() + 2 * 3600
+            self.cached(scope, 4)
+        self.assertEqual([cache._entry_key(scope, ('test', 4))],
+                         list(cache.get_cache().get(index_key)))
+
+
+@override_settings(
+    CACHES={'results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'homes-results-test',
+    }},
+    HOMES_RESULT_CACHE='results')
+class ResultCacheCommitTestCase(MeterPortMixin, TransactionTestCase):
+
+    """TestCase of the result cache eviction after an ingest commits."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        cache.get_cache().clear()
+
+    def test_evicted_after_commit(self):
+        """Test results cached before an ingest commits are evicted."""
+        scope = ('port', self.meter_port.id)
+        start = datetime.datetime(2015, 9, 1)
+        window = (start, start + datetime.timedelta(days=1))
+        computed = []
+
+        def compute():
+            computed.append(None)
+            return len(computed)
+
+        def cache_before_commit(sender, **kwargs):
+            # another request caching a result of the rows before the commit
+            cache.cached_result(scope, 'test', window, compute)
+
+        signals.measurements_stored.connect(cache_before_commit)
+        self.addCleanup(signals.measurements_stored.disconnect,
+                        cache_before_commit)
+        load_measurements([MeasurementRow(
+            self.meter_port.id, start + datetime.timedelta(hours=12), 100)])
+        self.assertEqual(2, cache.cached_result(scope, 'test', window,
+                                                compute))
+
+
+class CondensedPaginationTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the page seeking condensed pagination."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.rnd = random.Random(14)
+        load_measurements(self.random_rows(
+            datetime.datetime(2015, 9, 1, 0, 10), 500, seconds=(60, 1800)))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.from_timestamp = datetime.datetime(2015, 9, 1)
+        self.to_timestamp = datetime.datetime(2015, 9, 10)
+
+    def pages(self, url, **params):
+        """Return the counts and results of every page of `url`."""
+        counts, results = set(), []
+        for name in ('from_timestamp', 'to_timestamp'):
+            params[name] = params[name].strftime('%Y-%m-%dT%H:%M:%S.%f')
+        page = 1
+        while page:
+            params['page'] = page
+            response = self.client.get(url, params)
+            self.assertEqual(200, response.status_code)
+            counts.add(response.data['count'])
+            results.extend(
+                (item['from_timestamp'], item['to_timestamp'], item['value'])
+                for item in response.data['results'])
+            page = page + 1 if response.data['next'] else None
+        return counts, results
+
+    def expected(self, window, increment):
+        """Return the condensed values of the samples in `window`."""
+        raw_data = condensed.samples(window.order_by('timestamp'))
+        serializer = serializers.CondensedSerializer(list(condensed.condense(
+            raw_data, self.from_timestamp, increment)), many=True)
+        return [(item['from_timestamp'], item['to_timestamp'], item['value'])
+                for item in serializer.data]
+
+    def test_condensed_pages(self):
+        """Test the pages of hourly condensed match the full result."""
+        increment = datetime.timedelta(hours=1)
+        counts, results = self.pages(
+            '/api/v1/homes/measurements/{}/hourly_condensed/'.format(
+                self.meter_port.id),
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp)
+        expected = self.expected(models.Measurement.objects.filter(
+            meter_port=self.meter_port,
+            timestamp__gt=self.from_timestamp - increment,
+            timestamp__lt=self.to_timestamp + increment), increment)
+        self.assertEqual({len(expected)}, counts)
+        self.assertEqual(expected, results)
+
+    def test_consumption_pages(self):
+        """Test the pages of condensed consumption match the full result."""
+        increment = datetime.timedelta(minutes=15)
+        counts, results = self.pages(
+            '/api/v1/homes/residential_homes/{}/get_energy_consumption/'
+            .format(self.home.id),
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp, tau='15min')
+        expected = self.expected(models.Measurement.objects.filter(
+            meter_port=self.meter_port,
+            timestamp__gte=self.from_timestamp - increment,
+            timestamp__lte=self.to_timestamp + increment), increment)
+        self.assertEqual({len(expected)}, counts)
+        self.assertEqual(expected, results)
+
+    def test_production_pages(self):
+        """Test the pages of production sum the buckets of the submeters."""
+        appliance = models.Appliance.objects.create(
+            residential_home=self.home,
+            name=APPLIANCES_CHOICES[0][0],
+            location=LOCATION_CHOICES[0][0]
+        )
+        meter_ports = [
+            models.MeterPort.objects.create(
+                submeter=models.SubMeter.objects.create(
+                    residential_home=self.home,
+                    name="user sub meter{}".format(n)
+                ),
+                energy_production_period=(
+                    models.EnergyProductionPeriod.objects.create(
+                        appliance=appliance,
+                        from_timestamp=self.from_timestamp,
+                    )
+                ),
+                unit=MEASUREMENT_UNIT_CHOICES[0][0],
+                name='user meter port submeter production{}'.format(n)
+            )
+            for n in range(3)
+        ]
+        # the submeters cover overlapping and disjoint parts of the range
+        spans = [(0, 2), (1, 4), (6, 8)]
+        rows = []
+        for meter_port, (first, last) in zip(meter_ports, spans):
+            for n in range(first * 96, last * 96):
+                rows.append(MeasurementRow(
+                    meter_port.id,
+                    self.from_timestamp + datetime.timedelta(minutes=15 * n,
+                                                             seconds=7),
+                    n * (meter_port.id + 1)))
+        load_measurements(rows)
+        increment = datetime.timedelta(hours=1)
+        buckets = collections.defaultdict(int)
+        for meter_port in meter_ports:
+            for value in condensed.condense(
+                    condensed.samples(models.Measurement.objects.filter(
+                        meter_port=meter_port).order_by('timestamp')),
+                    self.from_timestamp, increment):
+                buckets[value.from_timestamp, value.to_timestamp] += \
+                    value.value
+        expected = list(aggregated.aggregate_submeter_measured_production(
+            self.home.id, self.from_timestamp, self.to_timestamp, increment))
+        self.assertEqual(sorted(buckets.items()), [
+            ((value.from_timestamp, value.to_timestamp), value.value)
+            for value in expected])
+        counts, results = self.pages(
+            '/api/v1/homes/residential_homes/{}/get_energy_production/'
+            .format(self.home.id),
+            from_timestamp=self.from_timestamp,
+            to_timestamp=self.to_timestamp, tau='hourly')
+        serializer = serializers.CondensedSerializer(expected, many=True)
+        self.assertEqual({len(expected)}, counts)
+        self.assertEqual([
+            (item['from_timestamp'], item['to_timestamp'], item['value'])
+            for item in serializer.data], results)
+
+    def test_page_reads_page_window(self):
+        """Test a late page only reads the samples around its buckets."""
+        window = models.Measurement.objects.filter(
+            meter_port=self.meter_port)
+        first, count = condensed.condensed_grid(
+            window, self.from_timestamp, datetime.timedelta(hours=1))
+        page = condensed.condense_window(
+            window, self.from_timestamp, datetime.timedelta(hours=1),
+            first, count - 20, count)
+        self.assertEqual(20, len(page))
+        with mock.patch.object(condensed, 'load_samples',
+                               wraps=condensed.load_samples) as load_samples:
+            condensed.condense_window(
+                window, self.from_timestamp, datetime.timedelta(hours=1),
+                first, count - 20, count)
+        # the samples are streamed, so count the rows of the scanned queryset
+        rows_read = load_samples.call_args[0][0].count()
+        self.assertLess(rows_read, window.count() / 4)
+
+
+class StatusTestCase(TestCase):
+
+    """TestCase of the reporting status time discrepancy detection."""
+
+    def test_gaps_per_meter_port(self):
+        """Test gaps are only detected between samples of one meter port."""
+        start = datetime.datetime(2015, 9, 1)
+        hour = datetime.timedelta(hours=1)
+        rows = [
+            (1, start), (1, start + 2 * hour), (1, start + 7 * hour),
+            (2, start + hour), (2, start + 3 * hour),
+        ]
+        self.assertEqual(
+            [(1, start + 2 * hour, 5 * hour)],
+            list(detect_time_discrepancy(rows, 2 * hour)))
+        self.assertEqual(
+            [(1, start, 2 * hour), (1, start + 2 * hour, 5 * hour),
+             (2, start + hour, 2 * hour)],
+            list(detect_time_discrepancy(rows, hour)))
+
+
+@skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+@override_settings(HOMES_STREAM_CHUNK_SIZE=500)
+class StreamingScanTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the bounded memory measurement scans."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.start = datetime.datetime(2015, 9, 1)
+        load_measurements([
+            MeasurementRow(self.meter_port.id,
+                           self.start + datetime.timedelta(minutes=n),
+                           10 * n)
+            for n in range(40000)])
+
+    def peak_memory(self, days):
+        """Return the peak memory of totalling and condensing `days`."""
+        to_timestamp = self.start + datetime.timedelta(days=days)
+
+        def scan():
+            aggregated.aggregate_mainmeter_consumption(
+                self.home.id, self.start, to_timestamp,
+                datetime.timedelta(0))
+            list(aggregated.aggregate_mainmeter_consumption(
+                self.home.id, self.start, to_timestamp,
+                datetime.timedelta(days=1)))
+        scan()
+        tracemalloc.start()
+        try:
+            scan()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_flat(self):
+        """Test peak memory does not grow with the scanned range."""
+        small, large = self.peak_memory(3), self.peak_memory(27)
+        self.assertLess(large, 2 * small)
+
+    def test_memory_ceiling(self):
+        """Test requests holding too many rows are refused."""
+        measurements = models.Measurement.objects.filter(
+            meter_port=self.meter_port).order_by('timestamp')
+        with override_settings(HOMES_ANALYTICS_MAX_ROWS=100):
+            self.assertRaises(streaming.RangeTooLarge,
+                              condensed.samples, measurements)
+            self.assertEqual(
+                40000, sum(1 for sample in condensed.stream_samples(
+                    measurements)))
+
+
+@override_settings(HOMES_FLEET_CHUNK_BUCKETS=5)
+class FleetLoadCurveTestCase(FleetMixin, TestCase):
+
+    """TestCase of the fleet load curve."""
+
+    def test_load_curve_sums_homes(self):
+        """Test the load curve sums the condensed values of every home."""
+        home_ids = [home.id for home in self.homes]
+        for pflow, aggregate in (
+                ('consumption', aggregated.aggregate_mainmeter_consumption),
+                ('production',
+                 aggregated.aggregate_submeter_measured_production)):
+            for tau in (datetime.timedelta(minutes=15),
+                        datetime.timedelta(hours=1)):
+                expected = {
+                    home_id: list(aggregate(home_id, self.from_timestamp,
+                                            self.to_timestamp, tau))
+                    for home_id in home_ids
+                }
+                total = collections.defaultdict(int)
+                for values in expected.values():
+                    for value in values:
+                        total[value.from_timestamp, value.to_timestamp] += \
+                            value.value
+                values, curves = fleet.load_curve(
+                    pflow, home_ids, self.from_timestamp, self.to_timestamp,
+                    tau, per_home=True)
+                self.assertEqual(sorted(total.items()), [
+                    ((value.from_timestamp, value.to_timestamp), value.value)
+                    for value in values])
+                self.assertEqual(expected, curves)
+
+    def test_superuser_only(self):
+        """Test only superusers may request the load curve."""
+        params = {
+            'from_timestamp': self.from_timestamp.strftime(
+                "%Y-%m-%dT%H:%M:%S.%f"),
+            'to_timestamp': self.to_timestamp.strftime(
+                "%Y-%m-%dT%H:%M:%S.%f"),
+            'residential_homes': '{},{}'.format(self.homes[0].id,
+                                                self.homes[1].id),
+            'per_home': 'true',
+        }
+        self.client.force_authenticate(
+            user=self.homes[0].dno_customer_id)
+        self.assertEqual(403, self.client.get(self.url, params).status_code)
+        self.client.force_authenticate(user=self.superuser)
+        response = self.client.get(self.url, params)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.data['homes'])
+        self.assertEqual(
+            [self.homes[0].id, self.homes[1].id],
+            [curve['residential_home'] for curve in response.data['per_home']])
+        self.assertTrue(response.data['values'])
+
+    def test_tau(self):
+        """Test an unknown tau is rejected and a missing one defaulted."""
+        params = {
+            'from_timestamp': self.from_timestamp.strftime(
+                "%Y-%m-%dT%H:%M:%S.%f"),
+            'to_timestamp': self.to_timestamp.strftime(
+                "%Y-%m-%dT%H:%M:%S.%f"),
+        }
+        self.client.force_authenticate(user=self.superuser)
+        response = self.client.get(self.url, dict(params, tau='bogus'))
+        self.assertEqual(400, response.status_code)
+        self.assertIn('tau', response.data['detail'])
+        response = self.client.get(self.url, params)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            response.data['values'],
+            self.client.get(self.url, dict(params, tau='15min')).data[
+                'values'])
+
+
+@skipIf(connection.vendor != 'postgresql', 'requires PostgreSQL')
+class FleetLoadCurveProcessesTestCase(FleetMixin, TransactionTestCase):
+
+    """TestCase of the fleet load curve computed by worker processes."""
+
+    def test_processes(self):
+        """Test worker processes compute the load curve of one process."""
+        home_ids = [home.id for home in self.homes]
+        tau = datetime.timedelta(hours=1)
+        for pflow in ('consumption', 'production'):
+            expected = fleet.load_curve(
+                pflow, home_ids, self.from_timestamp, self.to_timestamp,
+                tau, per_home=True, processes=1)
+            with mock.patch.object(fleet.multiprocessing, 'Pool',
+                                   wraps=fleet.multiprocessing.Pool) as pool:
+                self.assertEqual(expected, fleet.load_curve(
+                    pflow, home_ids, self.from_timestamp, self.to_timestamp,
+                    tau, per_home=True, processes=2))
+            pool.assert_called_once_with(2)
+
+
+@override_settings(HOMES_ENERGY_LEDGER=True, HOMES_COUNTER_RESETS=True)
+class EnergyLedgerTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the daily energy ledger."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.start = datetime.datetime(2015, 9, 1)
+        self.rnd = random.Random(19)
+
+    def ledger(self):
+        """Return the ledger of the home."""
+        return list(models.EnergyLedger.objects.filter(
+            residential_home=self.home).order_by('date').values_list(
+                'date', 'consumption', 'production'))
+
+    def test_maintained_on_ingest(self):
+        """Test the ledger follows loads and overwrites like a rebuild."""
+        rows = self.random_rows(self.start, 400, seconds=(600, 7200),
+                                resets=0.02)
+        load_measurements(rows[:200])
+        load_measurements(rows[300:])
+        load_measurements(rows[200:300])
+        load_measurements(
+            [MeasurementRow(row.meter_port_id, row.timestamp, row.value + 7)
+             for row in rows[100:150]], on_conflict=ON_CONFLICT_OVERWRITE)
+        maintained = self.ledger()
+        self.assertTrue(maintained)
+        self.assertTrue(all(consumption >= 0
+                            for date, consumption, production in maintained))
+        ledger.rebuild_ledger(self.home.id)
+        self.assertEqual(self.ledger(), maintained)
+
+    def test_aggregated_from_ledger(self):
+        """Test whole day increments read from the ledger alike."""
+        load_measurements(self.random_rows(
+            self.start - datetime.timedelta(days=1), 600,
+            seconds=(600, 7200)))
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = ('/api/v1/homes/residential_homes/{}/get_energy_consumption/'
+               .format(self.home.id))
+        params = {
+            'from_timestamp': self.start.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            'to_timestamp': (self.start + datetime.timedelta(days=21))
+            .strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        }
+        for tau in ('daily', 'weekly'):
+            params['tau'] = tau
+            with mock.patch.object(aggregated, 'paged_mainmeter_consumption',
+                                   side_effect=AssertionError):
+                from_ledger = client.get(url, params).data
+            with override_settings(HOMES_ENERGY_LEDGER=False):
+                expected = client.get(url, params).data
+            self.assertTrue(expected['results'])
+            self.assertEqual(expected, from_ledger)
+
+    def test_aggregated_with_resets(self):
+        """Test the measurements are corrected for resets like the ledger."""
+        rows = self.random_rows(self.start - datetime.timedelta(days=1), 500,
+                                seconds=(600, 7200), resets=0.05)
+        # a drop on the last sample, after midnight
+        rows.append(MeasurementRow(
+            self.meter_port.id,
+            ledger.floor_day(rows[-1].timestamp) +
+            datetime.timedelta(days=1, hours=1),
+            rows[-1].value // 2))
+        load_measurements(rows)
+        self.assertTrue(models.CounterReset.objects.exists())
+        for days in (10, 30):
+            to_timestamp = self.start + datetime.timedelta(days=days)
+            for tau in (datetime.timedelta(days=1),
+                        datetime.timedelta(days=7)):
+                expected = ledger.ledger_condensed(
+                    self.home.id, 'consumption', self.start, to_timestamp,
+                    tau)
+                self.assertTrue(expected)
+                self.assertTrue(all(value.value >= 0 for value in expected))
+                self.assertEqual(expected, list(
+                    aggregated.aggregate_mainmeter_consumption(
+                        self.home.id, self.start, to_timestamp, tau)))
+                pages = aggregated.paged_mainmeter_consumption(
+                    self.home.id, self.start, to_timestamp, tau)
+                self.assertEqual(expected, pages[0:len(pages)])
+
+
+@override_settings(HOMES_COUNTER_RESETS=True)
+class CounterResetTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the counter resets recorded on ingest."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        self.start = datetime.datetime(2015, 9, 1)
+        rnd = random.Random(20)
+        self.rows = []
+        timestamp, value = self.start, 0
+        for n in range(500):
+            timestamp += datetime.timedelta(seconds=rnd.randint(60, 900))
+            if rnd.random() < 0.03:
+                value = rnd.randint(0, 100)
+            else:
+                value += rnd.randint(0, 5000)
+            self.rows.append(MeasurementRow(self.meter_port.id, timestamp,
+                                            value))
+
+    def resets(self):
+        """Return the recorded resets of the meter port."""
+        return list(models.CounterReset.objects.filter(
+            meter_port=self.meter_port).order_by('timestamp').values_list(
+                'timestamp', 'correction'))
+
+    def test_recorded_on_ingest(self):
+        """Test resets follow out of order loads like a rebuild."""
+        load_measurements(self.rows[:200])
+        load_measurements(self.rows[300:])
+        load_measurements(self.rows[200:300])
+        recorded = self.resets()
+        self.assertTrue(recorded)
+        self.assertEqual(len(recorded), resets.rebuild_resets(
+            self.meter_port.id))
+        self.assertEqual(recorded, self.resets())
+
+    def test_corrected_totals(self):
+        """Test totals from the resets match scanning the measurements."""
+        load_measurements(self.rows)
+        for first, last in ((0, 499), (10, 250), (137, 138), (200, 480)):
+            from_timestamp = self.rows[first].timestamp
+            to_timestamp = self.rows[last].timestamp
+            expected = aggregated._accumulated_value(
+                row.value for row in self.rows[first:last + 1])
+            with mock.patch.object(aggregated, 'accumulated_value_sql',
+                                   side_effect=AssertionError):
+                result = aggregated.aggregate_mainmeter_consumption(
+                    self.home.id, from_timestamp, to_timestamp,
+                    datetime.timedelta(0))
+            self.assertEqual(expected, result[0].value)
+
+    def test_two_mainmeters(self):
+        """Test a home with two consumption ports is one series."""
+        meter_port = models.MeterPort.objects.create(
+            mainmeter=models.MainMeter.objects.create(
+                residential_home=self.home,
+                name="user second main meter"
+            ),
+            name='user meter port second mainmeter consumption',
+            resource_type=RESOURCE_TYPE_CHOICES[0][0],
+            unit=MEASUREMENT_UNIT_CHOICES[0][0]
+        )
+        rows = [
+            MeasurementRow(meter_port.id, row.timestamp + datetime.timedelta(
+                microseconds=1), 10 * n)
+            for n, row in enumerate(self.rows[::10])
+        ]
+        load_measurements(self.rows + rows)
+        expected = aggregated._accumulated_value(
+            row.value for row in sorted(self.rows + rows,
+                                        key=lambda row: row.timestamp))
+        with mock.patch.object(resets, 'accumulated_value',
+                               side_effect=AssertionError):
+            result = aggregated.aggregate_mainmeter_consumption(
+                self.home.id, self.rows[0].timestamp,
+                self.rows[-1].timestamp + datetime.timedelta(seconds=1),
+                datetime.timedelta(0))
+        self.assertEqual(expected, result[0].value)
+
+
+@override_settings(HOMES_VIRTUAL_ENERGY_MEASUREMENTS=True)
+class VirtualEnergyMaterializedTestCase(MeterPortMixin, TestCase):
+
+    """TestCase of the virtual energy measurements maintained on ingest."""
+
+    def setUp(self):
+        """Setup of testcase."""
+        super().setUp()
+        meter_ports = {
+            name: models.MeterPort.objects.create(
+                mainmeter=self.mainmeter,
+                name='user meter port mainmeter {}'.format(name),
+                resource_type=RESOURCE_TYPE_CHOICES[0][0],
+                unit=MEASUREMENT_UNIT_CHOICES[unit][0]
+            )
+            for name, unit in (('current', 3), ('voltage', 2),
+                               ('power_factor', 6))
+        }
+        meter_ports['consumption'] = self.meter_port
+        self.virtual_port = models.VirtualEnergyPort.objects.create(
+            mainmeter=self.mainmeter, **meter_ports)
+        self.start = datetime.datetime(2015, 9, 1)
+        rnd = random.Random(23)
+        self.rows = {}
+        for name, period in (('consumption', 30), ('current', 5),
+                             ('voltage', 8), ('power_factor', 11)):
+            self.rows[name] = [
+                MeasurementRow(
+                    meter_ports[name].id,
+                    self.start + datetime.timedelta(seconds=period * n),
+                    1000 * n + 1 if name == 'consumption' else
+                    rnd.randint(1, 1000))
+                for n in range(200)
+            ]
+
+    def materialized(self):
+        """Return the materialized measurements of the virtual port."""
+        return list(aggregated.materialized_timeslots(
+            self.virtual_port.id, None, None))
+
+    def test_updated_on_ingest(self):
+        """Test late followers are aligned as a rebuild aligns them."""
+        load_measurements(self.rows['consumption'][:150])
+        for name in ('current', 'voltage', 'power_factor'):
+            load_measurements(self.rows[name][50:])
+        load_measurements(self.rows['consumption'][150:])
+        for name in ('current', 'voltage', 'power_factor'):
+            load_measurements(self.rows[name][:50])
+        expected = list(aggregated.calc_timeslots(
+            *aggregated.get_virtual_energy_measurements(
+                self.virtual_port.id, None, None)))
+        self.assertTrue(expected)
+        self.assertEqual(expected, self.materialized())
+        self.assertEqual(len(expected), virtual.rebuild_virtual_measurements(
+            self.virtual_port))
+        self.assertEqual(expected, self.materialized())
+
+    def test_response(self):
+        """Test the measurements are answered from the materialized rows."""
+        for rows in self.rows.values():
+            load_measurements(rows)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = '/api/v1/homes/virtual_energy_ports/{}/get_measurements/'.format(
+            self.virtual_port.id)
+        params = {
+            'from_timestamp': self.start.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            'to_timestamp': (self.start + datetime.timedelta(hours=1))
+            .strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        }
+        with mock.patch.object(aggregated, 'calc_timeslots',
+                               side_effect=AssertionError):
+            materialized = client.get(url, params).data
+        with override_settings(HOMES_VIRTUAL_ENERGY_MEASUREMENTS=False):
+            expected = client.get(url, params).data
+        self.assertTrue(expected)
+        self.assertEqual(expected, materialized)
+
+    def test_batch(self):
+        """Test the batch endpoint streams the measurements of every port."""
+        for rows in self.rows.values():
+            load_measurements(rows)
+        swapped = models.VirtualEnergyPort.objects.create(
+            mainmeter=self.virtual_port.mainmeter,
+            consumption=self.virtual_port.consumption,
+            current=self.virtual_port.voltage,
+            voltage=self.virtual_port.power_factor,
+            power_factor=self.virtual_port.current,
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        params = {
+            'from_timestamp': self.start.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            'to_timestamp': (self.start + datetime.timedelta(hours=1))
+            .strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        }
+        virtual_ports = (self.virtual_port.id, swapped.id)
+        for materialized in (True, False):
+            with override_settings(
+                    HOMES_VIRTUAL_ENERGY_MEASUREMENTS=materialized):
+                expected = [{
+                    'virtual_energy_port': virtual_port,
+                    'measurements': json.loads(client.get(
+                        '/api/v1/homes/virtual_energy_ports/{}/'
+                        'get_measurements/'.format(virtual_port),
+                        params).content.decode()),
+                } for virtual_port in virtual_ports]
+                response = client.get(
+                    '/api/v1/homes/virtual_energy_ports/batch_measurements/',
+                    dict(params, virtual_energy_ports='{},{}'.format(
+                        *virtual_ports)))
+                self.assertTrue(expected[0]['measurements'])
+                self.assertTrue(expected[1]['measurements'])
+                self.assertEqual(expected, json.loads(b''.join(
+                    response.streaming_content).decode()))
+
+    def test_batch_above_cap(self):
+        """Test ports above the row cap are batched without a 413."""
+        for rows in self.rows.values():
+            load_measurements(rows)
+        swapped = models.VirtualEnergyPort.objects.create(
+            mainmeter=self.virtual_port.mainmeter,
+            consumption=self.virtual_port.consumption,
+            current=self.virtual_port.voltage,
+            voltage=self.virtual_port.power_factor,
+            power_factor=self.virtual_port.current,
+        )
+        virtual_ports = models.VirtualEnergyPort.objects.filter(
+            pk__in=(self.virtual_port.id, swapped.id))
+        timespan = (self.start, self.start + datetime.timedelta(hours=1))
+        for materialized in (True, False):
+            with override_settings(
+                    HOMES_VIRTUAL_ENERGY_MEASUREMENTS=materialized):
+                expected = list(virtual.batch_timeslots(
+                    virtual_ports, *timespan, processes=1))
+                self.assertTrue(expected[0][1])
+                ports = list(virtual_ports.order_by('pk').values_list(
+                    'pk', 'consumption', 'current', 'voltage',
+                    'power_factor'))
+                self.assertEqual(1, len(list(virtual.port_groups(
+                    ports, *timespan))))
+                with override_settings(HOMES_ANALYTICS_MAX_ROWS=100):
+                    self.assertEqual(2, len(list(virtual.port_groups(
+                        ports, *timespan))))
+                    self.assertEqual(expected, list(virtual.batch_timeslots(
+                        virtual_ports, *timespan, processes=1)))
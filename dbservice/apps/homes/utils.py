@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from django import forms
 from django.views.decorators.http import require_GET
 from django.conf import settings
+from django.db import connections
 from django.shortcuts import get_object_or_404
 
 from . import models
@@ -26,6 +27,17 @@ class PeriodForm(forms.Form):
         input_formats=settings.DATETIME_INPUT_FORMATS)
 
 
+def close_connections():
+    """
+    Close the database connections of this process before forking worker
+    processes, which must not share them; both reconnect on their next
+    query.  Work within a transaction stays in this process, as the workers
+    would not see its rows.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
 # pairwise from http://docs.python.org/2/library/itertools.html#recipes
 def pairwise(iterable, tee=itertools.tee, izip=zip):
     """
@@ -154,7 +166,7 @@ def extract_query(request, field, fparse):
             field = [field]
         field = set(field)
 
-    if set(request.GET.viewkeys()).issuperset(field):
+    if set(request.GET.keys()).issuperset(field):
         fld = None
         if len(field) == 1:
             fld = request.GET[field.pop()]
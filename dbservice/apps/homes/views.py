@@ -1,9 +1,11 @@
 import datetime
 
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
 from rest_framework import status, viewsets
 from rest_framework.decorators import link, list_route
-from rest_framework.exceptions import ParseError
+from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework.fields import ValidationError
 from rest_framework.response import Response
 
@@ -14,10 +16,19 @@ from dbservice.apps.utils.viewsets import (BulkCreateModelMixin,
 
 from . import filters, models, serializers
 from .aggregated import (aggregated, get_temperature_home,
-                         response_virtual_energy_port_measurements)
+                         response_virtual_energy_port_measurements,
+                         stream_temperature_home)
+from .buffer import ACK_CHOICES, ACK_SPOOL, buffered_ingest
+from .cache import cache_stats
 from .condensed import condensed
+from .fleet import response_load_curve
+from .ingest import (ON_CONFLICT_CHOICES, load_measurements,
+                     parse_measurements)
+from .signals import batched_measurements, measurements_committed
 from .status import get_status
-from .utils import response_fixed_value_measurements, response_measurements
+from .utils import (get_urlquery_value, response_fixed_value_measurements,
+                    response_measurements)
+from .virtual import response_batch_virtual_energy_measurements
 
 
 class ApplianceViewSet(viewsets.ModelViewSet):
@@ -368,6 +379,12 @@ class VirtualEnergyPortViewSet(viewsets.ModelViewSet):
     period. The from_timestamp and to_timestamp indicate the time interval of
     energy measurement. It can be obtained from
     `/homes/virtual_energy_ports/{meter_port_id}/get_measurements/?from_timestamp={tf}&to_timestamp={tt}`
+
+    The aligned energy measurements of many virtual energy ports are streamed
+    one virtual energy port at a time from
+    `/homes/virtual_energy_ports/batch_measurements/` with the query
+    parameters `virtual_energy_ports={id},{id}`, `from_timestamp={tf}` and
+    `to_timestamp={tt}`.
     """
 
     model = models.VirtualEnergyPort
@@ -394,6 +411,11 @@ class VirtualEnergyPortViewSet(viewsets.ModelViewSet):
     def get_measurements(self, request, pk=None):
         return response_virtual_energy_port_measurements(request, pk)
 
+    @list_route()
+    def batch_measurements(self, request):
+        return response_batch_virtual_energy_measurements(
+            request, self.filter_queryset(self.get_queryset()))
+
 
 class VirtualEnergyPortSchema(JSONSchemaViewSet):
     schema_for = serializers.VirtualEnergyPortSerializer
@@ -422,6 +444,20 @@ class MeasurementViewSet(viewsets.ModelViewSet, BulkCreateModelMixin):
 
     Bulk creation possible at `/homes/measurements/bulk/`
     (post JSON array of objects to create).
+
+    Large batches should be posted to `/homes/measurements/ingest/`, which
+    validates the batch as a whole and bulk loads it; it responds with the
+    number of stored measurements rather than the created objects.  The
+    optional query parameter `on_conflict` decides what happens to
+    measurements already stored for the meter port and timestamp: `skip`,
+    `overwrite` or `reject` (the default) the batch.  When the ingest buffer
+    is enabled, batches are queued and loaded together with those of other
+    requests; `ack=spool` responds with 202 Accepted and the id of the
+    batch once the batch is spooled, `ack=commit` once it is stored, or with
+    202 Accepted when it is not stored within the commit timeout.
+
+    Superusers can monitor the hit and miss counters of the condensed and
+    aggregated result cache at `/homes/measurements/cache_stats/`.
     """
     throttle_scope = 'measurements'
     model = models.Measurement
@@ -446,6 +482,17 @@ class MeasurementViewSet(viewsets.ModelViewSet, BulkCreateModelMixin):
                 qs.filter(meter_port__submeter__residential_home__dno_customer_id=user)  # noqa
             )
 
+    def bulk_create(self, request):
+        # maintain the derived data of the batch at once rather than for
+        # every saved measurement
+        with transaction.atomic():
+            with batched_measurements(Measurement) as ranges:
+                response = super().bulk_create(request)
+        if ranges and not transaction.get_connection().in_atomic_block:
+            measurements_committed.send(sender=Measurement, ranges=ranges,
+                                        using='default')
+        return response
+
     @list_route()
     def latest(self, request):
         all_measurements = Measurement.objects.all().order_by('-timestamp')
@@ -453,6 +500,37 @@ class MeasurementViewSet(viewsets.ModelViewSet, BulkCreateModelMixin):
         serializer = self.get_pagination_serializer(page)
         return Response(serializer.data)
 
+    @list_route()
+    def cache_stats(self, request):
+        if not request.user.is_superuser:
+            raise PermissionDenied()
+        return Response(cache_stats())
+
+    @list_route(methods=['post'])
+    def ingest(self, request):
+        on_conflict = get_urlquery_value(
+            request, 'on_conflict',
+            parser_options={choice: choice for choice in ON_CONFLICT_CHOICES})
+        rows, errors = parse_measurements(request.DATA, request.user)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        if settings.HOMES_INGEST_BUFFER:
+            ack = get_urlquery_value(
+                request, 'ack',
+                parser_options={choice: choice for choice in ACK_CHOICES})
+            ack = ack or settings.HOMES_INGEST_BUFFER_ACK
+            batch = buffered_ingest(rows, on_conflict=on_conflict,
+                                    user=request.user, source='api', ack=ack)
+            if ack == ACK_SPOOL or not batch.done.is_set():
+                # accepted, but not committed yet
+                return Response({'count': len(rows), 'batch': batch.id},
+                                status=status.HTTP_202_ACCEPTED)
+            count = batch.count
+        else:
+            count = load_measurements(rows, on_conflict=on_conflict,
+                                      user=request.user, source='api')
+        return Response({'count': count}, status=status.HTTP_201_CREATED)
+
     @link()
     def hourly_condensed(self, request, pk=None):
         return condensed(request, pk, datetime.timedelta(hours=1))
@@ -500,7 +578,17 @@ class ResidentialHomeViewSet(viewsets.ModelViewSet):
     measurements that it must be within.
 
     Temperature measurements can be obtained from
-    `/homes/residential_homes/{home_id}/get_temperature/[?from_timestamp={tf}&to_timestamp={tt}]`.
+    `/homes/residential_homes/{home_id}/get_temperature/[?from_timestamp={tf}&to_timestamp={tt}]`,
+    20 at a time ordered by submeter name and timestamp; follow the `next`
+    and `previous` links to page.  All of them are streamed from
+    `/homes/residential_homes/{home_id}/get_temperature_stream/[?from_timestamp={tf}&to_timestamp={tt}]`.
+
+    Superusers can obtain the summed load curve of all residential homes at
+    `/homes/residential_homes/load_curve/?from_timestamp={tf}&to_timestamp={tt}
+    [&tau={tau}][&pflow={consumption,production}][&residential_homes={ids}]
+    [&per_home=true]`, where `{ids}` is a comma separated list of home ids,
+    restricting the homes as the other filters do, `{tau}` defaults to 15min
+    and `per_home` adds the load curve of every home.
 
     Residential homes can be filtered on `dno_customer_id`.
     """
@@ -535,10 +623,21 @@ class ResidentialHomeViewSet(viewsets.ModelViewSet):
     def get_temperature(self, request, pk=None):
         return get_temperature_home(request, pk)
 
+    @link()
+    def get_temperature_stream(self, request, pk=None):
+        return stream_temperature_home(request, pk)
+
     @link()
     def get_status(self, request, pk=None):
         return get_status(request, pk)
 
+    @list_route()
+    def load_curve(self, request):
+        if not request.user.is_superuser:
+            raise PermissionDenied()
+        return response_load_curve(
+            request, self.filter_queryset(self.get_queryset()))
+
 
 class ResidentialHomeSchema(JSONSchemaViewSet):
     schema_for = serializers.ResidentialHomeSerializer
@@ -0,0 +1,316 @@
+"""
+Materialized and batch measurements of virtual energy ports
+
+A `VirtualEnergyMeasurement` row holds an entry of `calc_timeslots` of a
+virtual energy port: the consumption at the ends of the interval between
+two consumption measurements and the current, voltage and power factor
+averaged over it.  With `HOMES_VIRTUAL_ENERGY_MEASUREMENTS` enabled the
+intervals affected by the measurements stored by an ingest are recomputed in
+the ingest transaction, and `response_virtual_energy_port_measurements`
+reads the rows instead of aligning the source measurements on every request.
+
+The intervals affected by measurements between `from_timestamp` and
+`to_timestamp` of any of the four source ports are those between the last
+consumption measurement before `from_timestamp` and the first after
+`to_timestamp`, so a late current, voltage or power factor measurement only
+recomputes the interval it falls in.
+
+`batch_timeslots` aligns many virtual energy ports at once: the source
+measurements of up to `HOMES_VIRTUAL_ENERGY_BATCH_PORTS` ports holding at
+most `HOMES_ANALYTICS_MAX_ROWS` rows are read with one scan, and the groups
+of ports are aligned by `HOMES_VIRTUAL_ENERGY_PROCESSES` worker processes.
+A port with more rows on its own streams its source measurements one
+series at a time.
+"""
+import itertools
+import multiprocessing
+import operator
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from rest_framework.exceptions import ParseError
+
+from .aggregated import ConsumptionAligned, calc_timeslots
+from .condensed import Sample, stream_samples
+from .models import Measurement, VirtualEnergyMeasurement, VirtualEnergyPort
+from .serializers import VirtualEnergyPortMeasurementsSerializer
+from .streaming import bounded, stream_rows, streaming_json_response
+from .utils import close_connections, get_urlquery_timespan
+
+BULK_SIZE = 1000
+
+LEADER = 'consumption'
+FOLLOWERS = ('current', 'voltage', 'power_factor')
+
+
+def virtual_energy_measurements(entries, virtual_port_id):
+    """
+    Yield the `VirtualEnergyMeasurement` rows of virtual energy port
+    `virtual_port_id` of the `calc_timeslots` entries `entries`.
+    """
+    for (consumption_acc_start, consumption_acc_stop, current, voltage,
+         power_factor, from_timestamp, to_timestamp) in entries:
+        yield VirtualEnergyMeasurement(
+            virtual_energy_port_id=virtual_port_id,
+            from_timestamp=from_timestamp,
+            to_timestamp=to_timestamp,
+            consumption_acc_start=consumption_acc_start,
+            consumption_acc_stop=consumption_acc_stop,
+            current=current,
+            voltage=voltage,
+            power_factor=power_factor)
+
+
+def _sources(virtual_port):
+    # ids of the (consumption, current, voltage, power_factor) meter ports
+    return tuple(getattr(virtual_port, field + '_id')
+                 for field in (LEADER,) + FOLLOWERS)
+
+
+def _timeslots(sources, using, **filters):
+    # `calc_timeslots` of the source measurements matching `filters` of the
+    # `_sources` `sources`
+    def measurements(meter_port_id):
+        return stream_samples(Measurement.objects.using(using).filter(
+            meter_port_id=meter_port_id, **filters).order_by('timestamp'))
+
+    leader, *followers = sources
+    return calc_timeslots([measurements(follower) for follower in followers],
+                          measurements(leader))
+
+
+def _create(virtual_port, entries, using):
+    # store the entries in batches of `BULK_SIZE`, returning their number
+    rows = virtual_energy_measurements(entries, virtual_port.pk)
+    created = 0
+    while True:
+        chunk = list(itertools.islice(rows, BULK_SIZE))
+        if not chunk:
+            return created
+        VirtualEnergyMeasurement.objects.using(using).bulk_create(chunk)
+        created += len(chunk)
+
+
+def update_virtual_measurements(virtual_port, from_timestamp, to_timestamp,
+                                using='default'):
+    """
+    Recompute the intervals of `VirtualEnergyPort` `virtual_port` affected
+    by source measurements between `from_timestamp` and `to_timestamp`
+    (inclusive).
+    """
+    leader = Measurement.objects.using(using).filter(
+        meter_port_id=virtual_port.consumption_id)
+    low = leader.filter(timestamp__lt=from_timestamp).order_by(
+        '-timestamp').values_list('timestamp', flat=True).first()
+    high = leader.filter(timestamp__gt=to_timestamp).order_by(
+        'timestamp').values_list('timestamp', flat=True).first()
+    low = low or from_timestamp
+    high = high or to_timestamp
+    with transaction.atomic(using=using):
+        VirtualEnergyMeasurement.objects.using(using).filter(
+            virtual_energy_port=virtual_port.pk, from_timestamp__gte=low,
+            from_timestamp__lt=high).delete()
+        _create(virtual_port, _timeslots(
+            _sources(virtual_port), using, timestamp__gte=low,
+            timestamp__lte=high), using)
+
+
+def update_virtual_ranges(ranges, using='default'):
+    """
+    Recompute the intervals of the virtual energy ports with a source meter
+    port in `ranges`, as sent with `measurements_stored`.
+    """
+    meter_port_ids = list(ranges)
+    sources = Q()
+    for field in (LEADER,) + FOLLOWERS:
+        sources |= Q(**{field + '__in': meter_port_ids})
+    virtual_ports = VirtualEnergyPort.objects.using(using).filter(
+        sources).order_by('pk')
+    for virtual_port in virtual_ports:
+        source_ranges = [
+            ranges[getattr(virtual_port, field + '_id')]
+            for field in (LEADER,) + FOLLOWERS
+            if getattr(virtual_port, field + '_id') in ranges
+        ]
+        update_virtual_measurements(
+            virtual_port,
+            min(from_timestamp for from_timestamp, _ in source_ranges),
+            max(to_timestamp for _, to_timestamp in source_ranges),
+            using=using)
+
+
+def rebuild_virtual_measurements(virtual_port, using='default'):
+    """
+    Replace the intervals of `VirtualEnergyPort` `virtual_port`, streaming
+    its source measurements once.  Returns the number of intervals.
+    """
+    with transaction.atomic(using=using):
+        VirtualEnergyMeasurement.objects.using(using).filter(
+            virtual_energy_port=virtual_port.pk).delete()
+        return _create(virtual_port, _timeslots(_sources(virtual_port),
+                                                using), using)
+
+
+def _grouped(rows):
+    # dictionary mapping the first field of `rows` to lists of the others
+    return {
+        key: [row[1:] for row in group]
+        for key, group in itertools.groupby(rows, key=operator.itemgetter(0))
+    }
+
+
+def _keys(virtual_port):
+    # keys of the series `group_timeslots` reads of `virtual_port`, a
+    # `(pk, consumption, current, voltage, power_factor)` tuple of ids
+    if settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        return {virtual_port[0]}
+    return set(virtual_port[1:]) - {None}
+
+
+def _series(virtual_ports, from_timestamp, to_timestamp, using='default'):
+    # the rows `group_timeslots` reads of `virtual_ports` and the fields of
+    # their `_keys` and order within a series
+    if settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        rows = VirtualEnergyMeasurement.objects.using(using).filter(
+            virtual_energy_port__in=[port[0] for port in virtual_ports])
+        if from_timestamp and to_timestamp:
+            rows = rows.filter(from_timestamp__gt=from_timestamp,
+                               to_timestamp__lt=to_timestamp)
+        return rows, 'virtual_energy_port', 'from_timestamp'
+    keys = set().union(*map(_keys, virtual_ports))
+    rows = Measurement.objects.using(using).filter(meter_port__in=sorted(keys))
+    if from_timestamp and to_timestamp:
+        rows = rows.filter(timestamp__gt=from_timestamp,
+                           timestamp__lt=to_timestamp)
+    return rows, 'meter_port', 'timestamp'
+
+
+def port_groups(virtual_ports, from_timestamp, to_timestamp):
+    """
+    Split the virtual energy ports `virtual_ports`, `(pk, consumption,
+    current, voltage, power_factor)` tuples of ids, into groups of up to
+    `HOMES_VIRTUAL_ENERGY_BATCH_PORTS` ports whose series hold at most
+    `HOMES_ANALYTICS_MAX_ROWS` rows, counted with one query.  A port with
+    more rows is a group on its own.
+    """
+    size = settings.HOMES_VIRTUAL_ENERGY_BATCH_PORTS
+    limit = settings.HOMES_ANALYTICS_MAX_ROWS
+    rows, key, _ = _series(virtual_ports, from_timestamp, to_timestamp)
+    counts = dict(rows.order_by().values(key).annotate(
+        rows=Count('id')).values_list(key, 'rows'))
+    group, keys, total = [], set(), 0
+    for port in virtual_ports:
+        added = _keys(port) - keys
+        port_rows = sum(counts.get(series, 0) for series in added)
+        if group and (len(group) == size or total + port_rows > limit):
+            yield group
+            group, keys, total = [], set(), 0
+            port_rows = sum(counts.get(series, 0)
+                            for series in _keys(port))
+        group.append(port)
+        keys |= _keys(port)
+        total += port_rows
+    if group:
+        yield group
+
+
+def group_timeslots(virtual_ports, from_timestamp, to_timestamp,
+                    using='default'):
+    """
+    Return the `calc_timeslots` entries of the virtual energy ports
+    `virtual_ports`, `(pk, consumption, current, voltage, power_factor)`
+    tuples of ids, as `(pk, entries)` pairs.  The measurements of all ports
+    are read with one scan of at most `HOMES_ANALYTICS_MAX_ROWS` rows, those
+    of a single port one series at a time.
+    """
+    rows, key, order = _series(virtual_ports, from_timestamp, to_timestamp,
+                               using)
+    if len(virtual_ports) == 1:
+        (port,) = virtual_ports
+        if settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+            return [(port[0], list(stream_rows(
+                rows.order_by(order), *ConsumptionAligned._fields)))]
+        filters = {}
+        if from_timestamp and to_timestamp:
+            filters = {'timestamp__gt': from_timestamp,
+                       'timestamp__lt': to_timestamp}
+        return [(port[0], list(_timeslots(port[1:], using, **filters)))]
+
+    if settings.HOMES_VIRTUAL_ENERGY_MEASUREMENTS:
+        entries = _grouped(bounded(stream_rows(
+            rows.order_by(key, order), key, *ConsumptionAligned._fields)))
+        return [(port[0], entries.get(port[0], []))
+                for port in virtual_ports]
+
+    samples = _grouped(bounded(stream_rows(
+        rows.order_by(key, order), key, 'timestamp', 'value')))
+    result = []
+    for pk, leader, current, voltage, power_factor in virtual_ports:
+        followers = [
+            [Sample(*sample) for sample in samples.get(follower, [])]
+            for follower in (current, voltage, power_factor)
+        ]
+        leader = [Sample(*sample) for sample in samples.get(leader, [])]
+        result.append((pk, list(calc_timeslots(followers, leader))))
+    return result
+
+
+def _group_timeslots(args):
+    return group_timeslots(*args)
+
+
+def batch_timeslots(virtual_ports, from_timestamp, to_timestamp,
+                    processes=None):
+    """
+    Yield the `ConsumptionAligned` of every virtual energy port of queryset
+    `virtual_ports` as `(pk, list)` pairs, ordered by pk.
+    """
+    processes = processes or settings.HOMES_VIRTUAL_ENERGY_PROCESSES
+    virtual_ports = list(virtual_ports.order_by('pk').values_list(
+        'pk', LEADER, *FOLLOWERS))
+    args = [(group, from_timestamp, to_timestamp) for group in
+            port_groups(virtual_ports, from_timestamp, to_timestamp)]
+    connection = connections[Measurement.objects.db]
+    pool = None
+    if min(processes, len(args)) > 1 and not connection.in_atomic_block:
+        close_connections()
+        pool = multiprocessing.Pool(min(processes, len(args)))
+        groups = pool.imap(_group_timeslots, args)
+    else:
+        groups = map(_group_timeslots, args)
+    try:
+        for group in groups:
+            for pk, entries in group:
+                yield pk, list(itertools.starmap(ConsumptionAligned,
+                                                 entries))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def response_batch_virtual_energy_measurements(request, virtual_ports):
+    """
+    Returns a response streaming the aligned measurements of the virtual
+    energy ports of queryset `virtual_ports` with the comma separated ids
+    `virtual_energy_ports`, one virtual energy port at a time.
+    """
+    from_timestamp, to_timestamp = get_urlquery_timespan(request)
+    try:
+        virtual_port_ids = [
+            int(virtual_port_id) for virtual_port_id in
+            request.QUERY_PARAMS.get('virtual_energy_ports', '').split(',')]
+    except ValueError:
+        raise ParseError('virtual_energy_ports must be a comma separated '
+                         'list of ids')
+    virtual_ports = virtual_ports.filter(pk__in=virtual_port_ids)
+    items = (
+        VirtualEnergyPortMeasurementsSerializer({
+            'virtual_energy_port': pk,
+            'measurements': measurements,
+        }).data
+        for pk, measurements in batch_timeslots(
+            virtual_ports, from_timestamp, to_timestamp)
+    )
+    return streaming_json_response(items, chunk_size=1)
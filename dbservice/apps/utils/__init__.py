@@ -79,3 +79,18 @@ PHASE_CHOICES = (
     ('L3', 'L3'),
     ('L1L2L3', 'L1L2L3'),
 )
+
+INGEST_SOURCE_CHOICES = (
+    ('api', 'REST API'),
+    ('ftp', 'FTP meter file'),
+    ('csv', 'CSV backfill'),
+    ('migration', 'Migrated audit timestamps'),
+)
+
+# Bucket sizes (seconds) of the measurement rollups
+ROLLUP_RESOLUTION_CHOICES = (
+    (60, '1min'),
+    (900, '15min'),
+    (3600, 'hour'),
+    (86400, 'day'),
+)
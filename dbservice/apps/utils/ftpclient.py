@@ -1,5 +1,7 @@
 import contextlib
+import datetime
 import ftplib
+import posixpath
 
 
 @contextlib.contextmanager
@@ -20,3 +22,72 @@ def ftpconnection(host='', user='', passwd=''):
         yield ftp
     finally:
         ftp.quit()
+
+
+def _parse_modify(value):
+    """
+    Parse an FTP `modify` fact or MDTM reply (YYYYMMDDHHMMSS[.sss]) into a
+    naive UTC datetime.
+    """
+    return datetime.datetime.strptime(value[:14], '%Y%m%d%H%M%S')
+
+
+def listdir(ftp, path=''):
+    """
+    Yield `(name, size, mtime)` of the files in directory `path`.
+
+    Uses MLSD where the server supports it and falls back to NLST with SIZE
+    and MDTM per file.
+    """
+    try:
+        entries = list(ftp.mlsd(path, facts=['type', 'size', 'modify']))
+    except ftplib.error_perm:
+        entries = None
+    if entries is not None:
+        for name, facts in entries:
+            if facts.get('type', 'file') != 'file':
+                continue
+            yield (
+                name,
+                int(facts['size']) if 'size' in facts else None,
+                _parse_modify(facts['modify']) if 'modify' in facts else None,
+            )
+        return
+    ftp.voidcmd('TYPE I')
+    for name in ftp.nlst(path):
+        name = posixpath.basename(name)
+        full_name = posixpath.join(path, name)
+        try:
+            size = ftp.size(full_name)
+        except ftplib.error_perm:
+            # directories have no size
+            continue
+        response = ftp.voidcmd('MDTM ' + full_name)
+        yield name, size, _parse_modify(response.split()[-1])
+
+
+@contextlib.contextmanager
+def retrbinary_stream(ftp, name):
+    """
+    Context manager yielding a binary file object reading file `name` from
+    the data connection, so large files are never held in memory.
+    """
+    ftp.voidcmd('TYPE I')
+    conn = ftp.transfercmd('RETR ' + name)
+    stream = conn.makefile('rb')
+    try:
+        yield stream
+    except BaseException:
+        stream.close()
+        conn.close()
+        try:
+            # consume the response of the aborted transfer, leaving the
+            # control connection ready for QUIT
+            ftp.getresp()
+        except ftplib.all_errors:
+            pass
+        raise
+    else:
+        stream.close()
+        conn.close()
+        ftp.voidresp()
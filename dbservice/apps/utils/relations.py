@@ -0,0 +1,154 @@
+"""
+Related fields resolving the related objects of a whole batch at once
+
+With `many=True` the stock related fields look up every related object of
+every row on its own.  Serializers with `BatchRelationsMixin` collect the
+values of all their batch aware related fields before validating a batch and
+resolve each field with a single `IN` query, which also applies the
+ownership restriction of the field.
+"""
+from urllib.parse import urlparse
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.urlresolvers import Resolver404, get_script_prefix, resolve
+from django.db.models import Q
+from django.utils.encoding import smart_text
+from rest_framework import relations
+
+
+class BatchRelatedFieldMixin(object):
+    """
+    Related field that looks up prefetched objects while a batch is being
+    validated.
+
+    `owner_lookups` are lookups from the related model to its owning user;
+    unless the requesting user is a superuser, only related objects matching
+    one of them are accepted.  Subclasses implement `batch_pk`, returning
+    the primary key referenced by a value or raising `ValidationError`,
+    `TypeError` or `ValueError` when it is invalid.
+    """
+    def __init__(self, *args, **kwargs):
+        self.owner_lookups = kwargs.pop('owner_lookups', ())
+        super().__init__(*args, **kwargs)
+        self.batch = None
+
+    def initialize(self, parent, field_name):
+        super().initialize(parent, field_name)
+        if self.queryset is not None and not self.read_only:
+            self.queryset = self.owned(self.queryset)
+
+    def owned(self, queryset):
+        request = self.context.get('request', None)
+        user = getattr(request, 'user', None)
+        if not self.owner_lookups or user is None or user.is_superuser:
+            return queryset.all()
+        owned = Q()
+        for lookup in self.owner_lookups:
+            owned |= Q(**{lookup: user})
+        return queryset.filter(owned)
+
+    def to_pk(self, value):
+        return self.queryset.model._meta.pk.to_python(value)
+
+    def prefetch(self, values):
+        """
+        Resolve every related object referenced by `values` with one query.
+        """
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.batch_pk(value))
+            except (ValidationError, TypeError, ValueError):
+                # reported when the row is validated
+                pass
+        self.batch = self.queryset.in_bulk(pks)
+
+    def clear(self):
+        self.batch = None
+
+
+class BatchPrimaryKeyRelatedField(BatchRelatedFieldMixin,
+                                  relations.PrimaryKeyRelatedField):
+    def batch_pk(self, value):
+        return self.to_pk(value)
+
+    def from_native(self, data):
+        if self.batch is None:
+            return super().from_native(data)
+        try:
+            return self.batch[self.batch_pk(data)]
+        except KeyError:
+            msg = self.error_messages['does_not_exist'] % smart_text(data)
+            raise ValidationError(msg)
+        except (TypeError, ValueError, ValidationError):
+            received = type(data).__name__
+            msg = self.error_messages['incorrect_type'] % received
+            raise ValidationError(msg)
+
+
+class BatchHyperlinkedRelatedField(BatchRelatedFieldMixin,
+                                   relations.HyperlinkedRelatedField):
+    def batch_pk(self, value):
+        # mirrors the URL handling of `HyperlinkedRelatedField.from_native`
+        try:
+            if value.startswith(('http:', 'https:')):
+                value = urlparse(value).path
+                prefix = get_script_prefix()
+                if value.startswith(prefix):
+                    value = '/' + value[len(prefix):]
+            match = resolve(value)
+        except (AttributeError, Resolver404):
+            raise ValueError(value)
+        if (match.view_name != self.view_name or self.lookup_field != 'pk' or
+                'pk' not in match.kwargs):
+            raise ValueError(value)
+        return self.to_pk(match.kwargs['pk'])
+
+    def get_object(self, queryset, view_name, view_args, view_kwargs):
+        # only primary key lookups are prefetched
+        if (self.batch is None or self.lookup_field != 'pk' or
+                'pk' not in view_kwargs):
+            return super().get_object(queryset, view_name, view_args,
+                                      view_kwargs)
+        try:
+            return self.batch[self.to_pk(view_kwargs['pk'])]
+        except KeyError:
+            raise ObjectDoesNotExist()
+
+
+class BatchRelationsMixin(object):
+    """
+    Serializer mixin prefetching the related objects of a `many=True` batch
+    before it is validated.
+    """
+    def batch_related_fields(self):
+        return [
+            (name, field) for name, field in self.fields.items()
+            if isinstance(field, BatchRelatedFieldMixin) and
+            not field.read_only
+        ]
+
+    def prefetch_related(self, items):
+        for name, field in self.batch_related_fields():
+            values = []
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                value = item.get(name, None)
+                if field.many and isinstance(value, list):
+                    values.extend(value)
+                elif value not in field.null_values:
+                    values.append(value)
+            field.prefetch(values)
+
+    @property
+    def errors(self):
+        if (self._errors is None and self.many and
+                isinstance(self.init_data, list)):
+            self.prefetch_related(self.init_data)
+            try:
+                return super().errors
+            finally:
+                for name, field in self.batch_related_fields():
+                    field.clear()
+        return super().errors
@@ -241,6 +241,88 @@ AUTHENTICATION_BACKENDS += (
 
 AUTH_USER_MODEL = 'users.User'
 
+# =============================================================================
+# Measurement ingest and analytics
+# =============================================================================
+
+# Rows per COPY/INSERT statement when bulk loading measurements
+HOMES_INGEST_CHUNK_SIZE = 10000
+# Default handling of measurements already stored for a meter port and
+# timestamp: 'skip', 'overwrite' or 'reject' the batch
+HOMES_INGEST_ON_CONFLICT = 'reject'
+# Store created/last_modified on every measurement; when False measurements
+# keep only meter port, timestamp and value and their provenance is the
+# IngestBatch they were loaded in
+HOMES_MEASUREMENT_AUDIT_TIMESTAMPS = True
+# Write-behind buffer for /homes/measurements/ingest/: rows are queued in
+# process and loaded in batches of FLUSH_ROWS or every FLUSH_SECONDS.
+# Requests are acknowledged after the rows are committed ('commit') or
+# written to SPOOL_DIR ('spool'); with more than MAX_ROWS rows pending new
+# requests wait BLOCK_SECONDS for room before they are rejected with 503
+HOMES_INGEST_BUFFER = False
+HOMES_INGEST_BUFFER_ACK = 'commit'
+HOMES_INGEST_BUFFER_SPOOL_DIR = None
+HOMES_INGEST_BUFFER_MAX_ROWS = 500000
+HOMES_INGEST_BUFFER_FLUSH_ROWS = 50000
+HOMES_INGEST_BUFFER_FLUSH_SECONDS = 1.0
+HOMES_INGEST_BUFFER_BLOCK_SECONDS = 5.0
+HOMES_INGEST_BUFFER_COMMIT_TIMEOUT = 30.0
+# Meter vendor FTP server polled by `./manage.py poll_ftp_measurements`
+HOMES_FTP_HOST = ''
+HOMES_FTP_USER = ''
+HOMES_FTP_PASSWORD = ''
+
+# Monthly measurement partitions (PostgreSQL) created ahead of time and the
+# number of past months kept attached; None keeps everything
+HOMES_MEASUREMENT_PARTITIONS_AHEAD = 3
+HOMES_MEASUREMENT_RETENTION_MONTHS = None
+# Access method of the measurement timestamp index: 'btree', or 'brin' for
+# append-only data (smaller, but cannot serve ORDER BY timestamp)
+HOMES_MEASUREMENT_TIMESTAMP_INDEX = 'btree'
+# Engine interpolating condensed measurements: 'python', 'numpy'
+# (requires numpy) for vectorised interpolation with identical results, or
+# 'sql' to interpolate in PostgreSQL and only transfer one row per bucket
+HOMES_CONDENSE_ENGINE = 'python'
+# Engine aligning virtual energy port measurements: 'python', 'numpy'
+# (requires numpy) for vectorised alignment with identical results, or 'sql'
+# to average the followers over the leader intervals in PostgreSQL
+HOMES_VIRTUAL_ENERGY_ENGINE = 'python'
+# Maintain rollups of energy measurements on ingest and answer condensed
+# queries from them (run `manage.py rebuild_rollups` after enabling)
+HOMES_ROLLUPS = False
+# Record counter resets of energy meter ports on ingest and correct totals
+# with them, and the condensed consumption and production of homes for
+# counter resets (run `manage.py rebuild_counter_resets` after enabling)
+HOMES_COUNTER_RESETS = False
+# Maintain the daily energy ledger of every home on ingest and, with
+# HOMES_COUNTER_RESETS, answer whole day increments aligned to midnight from
+# it (run `manage.py repair_energy_ledger --rebuild` after enabling, and
+# nightly without)
+HOMES_ENERGY_LEDGER = False
+# Maintain the aligned measurements of every virtual energy port on ingest
+# and answer from them (run `manage.py rebuild_virtual_energy_measurements`
+# after enabling)
+HOMES_VIRTUAL_ENERGY_MEASUREMENTS = False
+# Alias in CACHES of the cache for condensed and aggregated results, None to
+# disable; entries are evicted when measurements overlapping them arrive
+HOMES_RESULT_CACHE = None
+HOMES_RESULT_CACHE_TIMEOUT = 3600
+# Most entries indexed per meter port or home, keeping the index well within
+# the 1 MB item limit of memcached
+HOMES_RESULT_CACHE_MAX_ENTRIES = 2000
+# Rows fetched per round trip by streaming measurement scans, and the most
+# rows an analytics request may hold in memory at once
+HOMES_STREAM_CHUNK_SIZE = 10000
+HOMES_ANALYTICS_MAX_ROWS = 1000000
+# Fleet load curves: worker processes computing the homes in parallel, and
+# buckets of the time range read per scan of the measurements of all homes
+HOMES_FLEET_PROCESSES = 4
+HOMES_FLEET_CHUNK_BUCKETS = 96
+# Batch virtual energy measurements: virtual energy ports whose measurements
+# are read per scan, and worker processes aligning the groups in parallel
+HOMES_VIRTUAL_ENERGY_BATCH_PORTS = 50
+HOMES_VIRTUAL_ENERGY_PROCESSES = 4
+
 # =============================================================================
 # Third party app settings
 # =============================================================================